@@ -0,0 +1,160 @@
+"""
+Synthetic gateway replay: push generated or recorded traffic through the real message
+dispatch path (AhriBot.on_message plus every feature on_message listener) with fake
+discord models and a stubbed NSFW provider. No network, no token.
+
+    python -m bench.dispatch --messages 20000 --mix chat=80,trigger=5,image=10,banned=5
+    python -m bench.dispatch --record traffic.jsonl --messages 5000
+    python -m bench.dispatch --replay traffic.jsonl --alloc
+"""
+import argparse, asyncio, json, logging, os, random, sys, tempfile, time, tracemalloc
+from typing import Dict, List
+
+from bench import fakes
+
+TRIGGERS = ["ahri listadmins", "ahri automod list", "ahri reactionrole list", "ahri nsfw viewsettings", "ahri nope"]
+BANNED = ["badword", "worseword"]
+CHAT = ["hello there", "lol", "anyone up for ranked?", "that was a great game gg", "ahrimain btw", "brb"]
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    out = {}
+    for part in spec.split(","):
+        k, _, v = part.partition("=")
+        out[k.strip()] = int(v)
+    return out
+
+def generate(n: int, mix: Dict[str, int], seed: int) -> List[dict]:
+    rnd = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    out = []
+    for _ in range(n):
+        kind = rnd.choices(kinds, weights)[0]
+        if kind == "trigger":
+            content = rnd.choice(TRIGGERS)
+        elif kind == "banned":
+            content = f"{rnd.choice(CHAT)} {rnd.choice(BANNED)}"
+        elif kind == "image":
+            content = rnd.choice(["", "look", "nsfw?"])
+        else:
+            content = rnd.choice(CHAT)
+        out.append({"kind": kind, "content": content})
+    return out
+
+def _stub_provider(nsfw_mod):
+    async def check_image(self, session, url):
+        await fakes._api("provider_check")
+        return {"ok": True, "data": {"nudity": {"sexual_activity": 0.01, "sexual_display": 0.01, "erotica": 0.02, "suggestive": 0.05}, "type": {"photo": 0.9, "illustration": 0.1}}}
+    nsfw_mod.SightengineProvider.check_image = check_image
+
+async def _setup(data_dir: str, guilds: int):
+    os.environ.setdefault("SIGHTENGINE_USER", "bench")
+    os.environ.setdefault("SIGHTENGINE_SECRET", "bench")
+    from core import config, db, loader
+    import core.db
+    config.DATA_DIR = core.db.DATA_DIR = __import__("pathlib").Path(data_dir)
+
+    import main
+    bot = main.AhriBot()
+    await bot._async_setup_hook()   # binds bot.loop so dispatch() works without login
+    bot._connection.user = type("BenchUser", (), {"id": 1, "mention": "<@1>", "bot": True})()
+
+    async def is_owner(user):
+        return False
+    bot.is_owner = is_owner
+
+    await loader.load_features(bot)
+    _stub_provider(sys.modules["features.nsfw_moderator"])
+
+    gs = []
+    for _ in range(guilds):
+        g = fakes.FakeGuild(members=200)
+        doc = await db.ensure_guild(g.id)
+        doc.activated = True
+        doc.admins = [g.owner_id]
+        doc.automod.enabled = True
+        doc.automod.banned_words = list(BANNED)
+        doc.nsfw.active_channel_ids = [g.channels[0].id]
+        doc.nsfw.everyone_blacklisted = True
+        await db.save_guild(g.id, doc)
+        gs.append(g)
+    return bot, gs
+
+def _message(bot, guilds, rnd, item) -> "fakes.FakeMessage":
+    g = rnd.choice(guilds)
+    author = rnd.choice(g.members[2:])
+    atts = [fakes.FakeAttachment()] if item["kind"] == "image" else []
+    return fakes.FakeMessage(g.channels[0], author, item["content"], attachments=atts, state=bot._connection)
+
+async def run(traffic: List[dict], guilds: int, concurrency: int, alloc: bool, seed: int):
+    from core import metrics
+    with tempfile.TemporaryDirectory() as data_dir:
+        bot, gs = await _setup(data_dir, guilds)
+        listeners = list(bot.extra_events.get("on_message", []))
+        rnd = random.Random(seed)
+        msgs = [(item["kind"], _message(bot, gs, rnd, item)) for item in traffic]
+
+        metrics.reset()
+        fakes.calls.clear()
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(kind, m):
+            async with sem:
+                with metrics.span("bench." + kind):
+                    await asyncio.gather(bot.on_message(m), *(fn(m) for fn in listeners))
+
+        if alloc:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(k, m) for k, m in msgs))
+        elapsed = time.perf_counter() - t0
+        alloc_stats = None
+        if alloc:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            alloc_stats = (current, peak)
+        await bot.close()
+
+    print(f"messages: {len(msgs)}  guilds: {guilds}  concurrency: {concurrency}  elapsed: {elapsed:.2f}s")
+    print(f"throughput: {len(msgs) / elapsed:,.0f} msg/s")
+    if alloc_stats:
+        print(f"allocations: retained {alloc_stats[0] / 1024:.0f} KiB, peak {alloc_stats[1] / 1024:.0f} KiB, "
+              f"~{alloc_stats[1] / len(msgs):.0f} B/msg peak")
+    snap = metrics.snapshot()
+    width = max((len(k) for k in snap), default=4)
+    print(f"\n{'stage':<{width}}  {'count':>7}  {'p50ms':>8}  {'p95ms':>8}  {'p99ms':>8}")
+    for name, s in snap.items():
+        print(f"{name:<{width}}  {s['count']:>7}  {s['p50'] * 1000:>8.3f}  {s['p95'] * 1000:>8.3f}  {s['p99'] * 1000:>8.3f}")
+    print("\nfake API calls: " + ", ".join(f"{k}={v}" for k, v in sorted(fakes.calls.items())))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=10000)
+    ap.add_argument("--mix", default="chat=80,trigger=5,image=10,banned=5")
+    ap.add_argument("--guilds", type=int, default=20)
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--api-latency", type=float, default=0.0, help="seconds each fake REST/provider call takes")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--record", help="write the generated traffic to this JSONL file and exit")
+    ap.add_argument("--replay", help="replay traffic from a JSONL file instead of generating it")
+    ap.add_argument("--alloc", action="store_true", help="trace allocations (slower)")
+    args = ap.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # every trigger also goes through process_commands, which reports CommandNotFound
+    logging.getLogger("discord.ext.commands").setLevel(logging.CRITICAL)
+    fakes.API_LATENCY = args.api_latency
+    if args.replay:
+        with open(args.replay, encoding="utf-8") as f:
+            traffic = [json.loads(line) for line in f if line.strip()]
+    else:
+        traffic = generate(args.messages, parse_mix(args.mix), args.seed)
+    if args.record:
+        with open(args.record, "w", encoding="utf-8") as f:
+            for item in traffic:
+                f.write(json.dumps(item) + "\n")
+        print(f"wrote {len(traffic)} messages to {args.record}")
+        return
+    asyncio.run(run(traffic, args.guilds, args.concurrency, args.alloc, args.seed))
+
+if __name__ == "__main__":
+    main()
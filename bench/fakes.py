@@ -0,0 +1,168 @@
+"""
+Lightweight stand-ins for discord.py models, good enough to drive the real dispatch path
+(AhriBot.on_message, feature listeners, trigger handlers) without a gateway or HTTP.
+Every outbound call is an awaitable no-op that records itself in `calls`.
+"""
+import asyncio, itertools
+from collections import Counter
+from typing import List, Optional
+
+_ids = itertools.count(900000000000000000)
+calls: Counter = Counter()
+API_LATENCY = 0.0       # seconds each fake REST call sleeps (0 = just yield)
+
+def next_id() -> int:
+    return next(_ids)
+
+async def _api(name: str):
+    calls[name] += 1
+    await asyncio.sleep(API_LATENCY)
+
+class FakeRole:
+    def __init__(self, name: str, id: Optional[int] = None, position: int = 1):
+        self.id = id or next_id()
+        self.name = name
+        self.position = position
+        self.mention = f"<@&{self.id}>"
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+class FakeMember:
+    def __init__(self, guild: "FakeGuild", id: Optional[int] = None, name: str = "user", bot: bool = False):
+        self.id = id or next_id()
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.guild = guild
+        self.roles: List[FakeRole] = []
+        self.mention = f"<@{self.id}>"
+        self.avatar = None
+        self.created_at = None
+        self.joined_at = None
+
+    def __str__(self):
+        return self.name
+
+    async def add_roles(self, *roles, reason=None):
+        await _api("add_roles")
+        self.roles += [r for r in roles if r not in self.roles]
+
+    async def remove_roles(self, *roles, reason=None):
+        await _api("remove_roles")
+        self.roles = [r for r in self.roles if r not in roles]
+
+    async def edit(self, **kwargs):
+        await _api("member_edit")
+        if "roles" in kwargs:
+            self.roles = list(kwargs["roles"])
+
+    async def timeout(self, until, reason=None):
+        await _api("timeout")
+
+class FakeMessage:
+    def __init__(self, channel: "FakeChannel", author: FakeMember, content: str = "", attachments=None, state=None):
+        self.id = next_id()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.attachments = attachments or []
+        self.embeds = []
+        self.mentions = []
+        self.role_mentions = []
+        self.channel_mentions = []
+        self.reactions = []
+        self._state = state
+        self.jump_url = f"https://discord.com/channels/{self.guild.id}/{channel.id}/{self.id}"
+
+    async def delete(self, delay=None):
+        await _api("message_delete")
+
+    async def add_reaction(self, emoji):
+        await _api("add_reaction")
+
+    async def edit(self, **kwargs):
+        await _api("message_edit")
+        if "content" in kwargs:
+            self.content = kwargs["content"]
+
+class FakeChannel:
+    def __init__(self, guild: "FakeGuild", id: Optional[int] = None, name: str = "general"):
+        self.id = id or next_id()
+        self.name = name
+        self.guild = guild
+        self.mention = f"<#{self.id}>"
+        self.sent: List[str] = []
+        self._bot_member = None
+
+    async def send(self, content=None, **kwargs):
+        await _api("channel_send")
+        if len(self.sent) < 1000:
+            self.sent.append(content)
+        return FakeMessage(self, self._bot_member, content or "")
+
+    async def fetch_message(self, message_id: int):
+        await _api("fetch_message")
+        return FakeMessage(self, self._bot_member, "")
+
+class FakeGuild:
+    def __init__(self, id: Optional[int] = None, name: str = "bench", members: int = 100):
+        self.id = id or next_id()
+        self.name = name
+        self.roles: List[FakeRole] = [FakeRole("@everyone", id=self.id, position=0)]
+        self.channels: List[FakeChannel] = [FakeChannel(self)]
+        self._members = {}
+        self.owner = self.add_member("owner")
+        self.owner_id = self.owner.id
+        self.me = self.add_member("ahri", bot=True)
+        for ch in self.channels:
+            ch._bot_member = self.me
+        for i in range(members):
+            self.add_member(f"user{i}")
+        self.member_count = len(self._members)
+
+    def add_member(self, name: str, bot: bool = False) -> FakeMember:
+        m = FakeMember(self, name=name, bot=bot)
+        self._members[m.id] = m
+        return m
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def get_member(self, user_id: int):
+        return self._members.get(user_id)
+
+    async def fetch_member(self, user_id: int):
+        await _api("fetch_member")
+        return self._members.get(user_id)
+
+    def get_channel(self, channel_id: int):
+        return next((c for c in self.channels if c.id == channel_id), None)
+
+    def get_role(self, role_id: int):
+        return next((r for r in self.roles if r.id == role_id), None)
+
+    async def kick(self, user, reason=None):
+        await _api("kick")
+
+    async def ban(self, user, reason=None, delete_message_days=0, delete_message_seconds=0):
+        await _api("ban")
+
+    async def unban(self, user, reason=None):
+        await _api("unban")
+
+class FakeAttachment:
+    def __init__(self, filename: str = "image.png", width: int = 1280, height: int = 720, size: int = 400_000, content_type: str = "image/png"):
+        self.id = next_id()
+        self.filename = filename
+        self.width = width
+        self.height = height
+        self.size = size
+        self.content_type = content_type
+        self.url = f"https://cdn.discordapp.com/attachments/1/{self.id}/{filename}"
+        self.proxy_url = f"https://media.discordapp.net/attachments/1/{self.id}/{filename}"
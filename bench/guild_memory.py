@@ -0,0 +1,53 @@
+"""
+Memory held by the guild document cache: plain dicts (as json.load returns them) versus
+the slotted models in core.models. Documents are realistic but small: a few admins, a
+handful of banned words, one reaction-role panel, NSFW settings with two channels.
+
+    python -m bench.guild_memory [--guilds 10000]
+"""
+import argparse, gc, json, tracemalloc
+
+from core.models import Guild, Panel
+
+def _document(i: int) -> dict:
+    g = Guild(guild_id=300000000000000000 + i, activated=True)
+    g.admins = [400000000000000000 + i, 400000000000000001 + i]
+    g.admin_roles = [500000000000000000 + i] if i % 2 else []
+    g.automod.enabled = bool(i % 3)
+    g.automod.banned_words = [f"word{j}" for j in range(i % 6)]
+    g.reaction_roles.panels = [Panel(600000000000000000 + i, 700000000000000000 + i, {"🍎": 800000000000000000 + i, "🍌": 800000000000000001 + i})]
+    g.logging.channel_id = 700000000000000001 + i
+    g.nsfw.active_channel_ids = [700000000000000000 + i, 700000000000000002 + i]
+    g.nsfw.log_channel_id = 700000000000000001 + i
+    g.last_updated = "2025-01-01T00:00:00Z"
+    return g.to_dict()
+
+def _measure(build, count: int) -> int:
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    held = [build(i) for i in range(count)]
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del held
+    return used
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--guilds", type=int, default=10000)
+    args = ap.parse_args()
+
+    # serialise once so both sides are built from identical JSON text, like a cold cache fill
+    texts = [json.dumps(_document(i)) for i in range(args.guilds)]
+    as_dict = _measure(lambda i: json.loads(texts[i]), args.guilds)
+    as_model = _measure(lambda i: Guild.from_dict(json.loads(texts[i]))[0], args.guilds)
+
+    mb = 1024 * 1024
+    print(f"{args.guilds} guilds")
+    print(f"  dict   {as_dict / mb:8.1f} MB   {as_dict / args.guilds:7.0f} B/guild")
+    print(f"  model  {as_model / mb:8.1f} MB   {as_model / args.guilds:7.0f} B/guild")
+    print(f"  saved  {(1 - as_model / as_dict) * 100:7.0f} %")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+RSS cost of the member cache under each memory profile.
+
+Feeds synthetic GUILD_MEMBERS_CHUNK-style payloads for one guild through discord.py's own
+Member/User constructors, caching them the way the profile's MemberCacheFlags would, and
+reports resident-set growth per 10k members. Each profile runs in a fresh subprocess.
+
+    python -m bench.member_memory [--members 50000]
+"""
+import argparse, gc, json, os, subprocess, sys
+
+def _rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def _member_payload(i: int) -> dict:
+    uid = 100000000000000000 + i
+    return {
+        "user": {"id": str(uid), "username": f"user{i}", "discriminator": "0", "global_name": f"User {i}", "avatar": "a" * 32 if i % 3 else None},
+        "roles": [str(200000000000000000 + (i % 7))] if i % 2 else [],
+        "joined_at": "2023-01-01T00:00:00+00:00",
+        "nick": None if i % 5 else f"nick{i}",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+def _run_profile(name: str, count: int) -> dict:
+    import discord
+    from core import members
+
+    prof = members.PROFILES[name]
+    intents = discord.Intents.default()
+    intents.members = True
+    client = discord.Client(intents=intents, **members.client_options(prof))
+    state = client._connection
+    guild = discord.Guild(data={"id": "1", "name": "bench", "member_count": count, "roles": [], "emojis": [], "stickers": []}, state=state)
+
+    gc.collect()
+    before = _rss_bytes()
+    cache = prof.chunk_guilds_at_startup or state.member_cache_flags.joined
+    for i in range(count):
+        m = discord.Member(data=_member_payload(i), guild=guild, state=state)
+        if cache and (prof.chunk_guilds_at_startup or i % 20 == 0):
+            # without startup chunking only members seen joining/active get cached; assume 5%
+            guild._add_member(m)
+    gc.collect()
+    after = _rss_bytes()
+    cached = len(guild._members)
+    return {
+        "profile": name,
+        "members": count,
+        "cached": cached,
+        "rss_delta_mb": round((after - before) / 1048576, 2),
+        "rss_mb_per_10k": round((after - before) / 1048576 / (count / 10000), 2),
+        "max_messages": prof.max_messages,
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--members", type=int, default=50000)
+    ap.add_argument("--profile", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.profile:
+        print(json.dumps(_run_profile(args.profile, args.members)))
+        return
+
+    from core.members import PROFILES
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    print(f"{'profile':<10} {'cached':>8} {'RSS MB':>8} {'MB/10k':>8} {'max_messages':>13}")
+    for name in PROFILES:
+        out = subprocess.run([sys.executable, "-m", "bench.member_memory", "--profile", name, "--members", str(args.members)],
+                             cwd=root, capture_output=True, text=True, check=True)
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{r['profile']:<10} {r['cached']:>8} {r['rss_delta_mb']:>8} {r['rss_mb_per_10k']:>8} {str(r['max_messages']):>13}")
+
+if __name__ == "__main__":
+    main()
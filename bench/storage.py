@@ -0,0 +1,280 @@
+"""
+Storage benchmark and stress test for core/db.py, run against a temporary data directory.
+
+Phases:
+  populate   save_guild for every guild (first write creates the shard directories)
+  mixed      random load/save traffic at --concurrency, with the configured cache size
+  cold       load_guild with the cache disabled, so every read goes to disk
+  hot        --hot-writers coroutines doing read-modify-write on one guild while reader
+             threads parse its file in a loop. Runs with --hot-cache-size (0 by default,
+             so the guild is evicted between operations) and db.update_guild; with
+             --hot-api load-save it uses load_guild + save_guild instead, which only
+             keeps every update while the guild stays cached
+
+Reports throughput, latency histograms, default-executor saturation (queue wait, busy
+workers) and guild-lock wait. Checks that no update is lost: every hot write must be in
+the final document as reloaded from disk. Checks that no read is torn: every read of
+the file must parse as a complete document. Exits 1 if either check fails.
+
+    python -m bench.storage --guilds 2000 --ops 20000 --write-ratio 0.2
+    python -m bench.storage --words 500 --panels 20 --workers 4 --json before.json
+    python -m bench.storage --hot-api load-save --hot-cache-size 4096
+"""
+import argparse, asyncio, json, os, pathlib, random, sys, tempfile, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from core import config, db, metrics
+from core.models import Guild, Panel
+
+class _Executor(ThreadPoolExecutor):
+    """Default executor that records how long jobs wait for a worker and how busy workers are."""
+
+    def __init__(self, workers: int):
+        super().__init__(max_workers=workers, thread_name_prefix="bench-io")
+        self.workers = workers
+        self.wait = metrics.Histogram()
+        self.queued = 0
+        self.max_queued = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+        def job():
+            start = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.wait.observe(start - submitted)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.busy += time.perf_counter() - start
+        return super().submit(job)
+
+    def reset(self):
+        with self._lock:
+            self.wait = metrics.Histogram()
+            self.max_queued = self.queued
+            self.busy = 0.0
+
+class _TimedLock(asyncio.Lock):
+    """Guild lock that records how long save_guild waited to acquire it."""
+    wait = metrics.Histogram()
+
+    async def acquire(self):
+        t0 = time.perf_counter()
+        try:
+            return await super().acquire()
+        finally:
+            _TimedLock.wait.observe(time.perf_counter() - t0)
+
+def _document(gid: int, words: int, panels: int) -> Guild:
+    g = Guild(guild_id=gid, activated=True)
+    g.admins = [gid + 1, gid + 2]
+    g.automod.enabled = True
+    g.automod.banned_words = [f"word{j}" for j in range(words)]
+    g.reaction_roles.panels = [Panel(gid + 10 + p, gid + 5, {f"e{k}": gid + 100 + k for k in range(5)}) for p in range(panels)]
+    g.logging.channel_id = gid + 5
+    g.nsfw.active_channel_ids = [gid + 5]
+    return g
+
+def _print_phase(name: str, ops: int, elapsed: float, hists: Dict[str, metrics.Histogram]):
+    print(f"\n[{name}] {ops} ops in {elapsed:.2f}s -> {ops / elapsed:,.0f} ops/s")
+    print(f"  {'op':<6} {'count':>7} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'meanms':>8}")
+    for op, h in hists.items():
+        if h.count:
+            print(f"  {op:<6} {h.count:>7} {h.quantile(0.5) * 1000:>8.3f} {h.quantile(0.95) * 1000:>8.3f} "
+                  f"{h.quantile(0.99) * 1000:>8.3f} {h.total / h.count * 1000:>8.3f}")
+    for op, h in hists.items():
+        if h.count:
+            cells = [f"<={b * 1000:g}ms:{c}" if b != float("inf") else f">{metrics.BUCKETS[-2] * 1000:g}ms:{c}"
+                     for b, c in zip(metrics.BUCKETS, h.counts) if c]
+            print(f"  {op} histogram: " + "  ".join(cells))
+
+def _summary(h: metrics.Histogram) -> Dict[str, float]:
+    return {"count": h.count, "p50": h.quantile(0.5), "p95": h.quantile(0.95), "p99": h.quantile(0.99),
+            "mean": h.total / h.count if h.count else 0.0}
+
+def _executor_report(ex: _Executor, elapsed: float) -> Dict[str, float]:
+    util = ex.busy / (ex.workers * elapsed) if elapsed else 0.0
+    print(f"  executor: {ex.workers} workers, {util * 100:.0f}% busy, max {ex.max_queued} queued, "
+          f"queue wait p50 {ex.wait.quantile(0.5) * 1000:.3f}ms p99 {ex.wait.quantile(0.99) * 1000:.3f}ms")
+    return {"workers": ex.workers, "utilization": util, "max_queued": ex.max_queued, **{f"wait_{k}": v for k, v in _summary(ex.wait).items()}}
+
+async def _timed(h: metrics.Histogram, coro):
+    t0 = time.perf_counter()
+    await coro
+    h.observe(time.perf_counter() - t0)
+
+async def run(args) -> Dict[str, dict]:
+    loop = asyncio.get_running_loop()
+    ex = _Executor(args.workers)
+    loop.set_default_executor(ex)
+    rnd = random.Random(args.seed)
+    results: Dict[str, dict] = {}
+    ids = [800000000000000000 + i * 4096 for i in range(args.guilds)]
+
+    # populate
+    for gid in ids:
+        db._locks[gid] = _TimedLock()
+    docs = {gid: _document(gid, args.words, args.panels) for gid in ids}
+    size = len(json.dumps(next(iter(docs.values())).to_dict(), indent=2))
+    print(f"guilds: {args.guilds}  document: ~{size / 1024:.1f} KiB  workers: {args.workers}  "
+          f"concurrency: {args.concurrency}  cache: {args.cache_size}")
+    sem = asyncio.Semaphore(args.concurrency)
+    async def limited(coro):
+        async with sem:
+            await coro
+    h = metrics.Histogram()
+    ex.reset()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(limited(_timed(h, db.save_guild(gid, doc))) for gid, doc in docs.items()))
+    elapsed = time.perf_counter() - t0
+    _print_phase("populate", len(ids), elapsed, {"save": h})
+    results["populate"] = {"ops_per_s": len(ids) / elapsed, "save": _summary(h), "executor": _executor_report(ex, elapsed)}
+    del docs
+
+    # mixed
+    db.CACHE_SIZE = args.cache_size
+    db._cache.clear()
+    hists = {"load": metrics.Histogram(), "save": metrics.Histogram()}
+    _TimedLock.wait = metrics.Histogram()
+    async def mixed_op():
+        gid = rnd.choice(ids)
+        if rnd.random() < args.write_ratio:
+            t0 = time.perf_counter()
+            g = await db.load_guild(gid)
+            g.last_updated = str(time.time())
+            await db.save_guild(gid, g)
+            hists["save"].observe(time.perf_counter() - t0)
+        else:
+            await _timed(hists["load"], db.load_guild(gid))
+    ex.reset()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(limited(mixed_op()) for _ in range(args.ops)))
+    elapsed = time.perf_counter() - t0
+    _print_phase("mixed", args.ops, elapsed, hists)
+    print(f"  guild lock wait: p50 {_TimedLock.wait.quantile(0.5) * 1000:.3f}ms p99 {_TimedLock.wait.quantile(0.99) * 1000:.3f}ms")
+    results["mixed"] = {"ops_per_s": args.ops / elapsed, **{k: _summary(v) for k, v in hists.items()},
+                        "lock_wait": _summary(_TimedLock.wait), "executor": _executor_report(ex, elapsed)}
+
+    # cold: nothing survives in the cache, every load reads and parses the file
+    db.CACHE_SIZE = 0
+    db._cache.clear()
+    h = metrics.Histogram()
+    n = min(args.ops, args.guilds * 4)
+    ex.reset()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(limited(_timed(h, db.load_guild(rnd.choice(ids)))) for _ in range(n)))
+    elapsed = time.perf_counter() - t0
+    _print_phase("cold", n, elapsed, {"load": h})
+    results["cold"] = {"ops_per_s": n / elapsed, "load": _summary(h), "executor": _executor_report(ex, elapsed)}
+    db.CACHE_SIZE = args.cache_size
+
+    results["hot"] = await _hot(args, ex, ids[0])
+    return results
+
+async def _hot(args, ex: _Executor, gid: int) -> dict:
+    """Concurrent read-modify-write on one guild while threads read its file raw."""
+    db.CACHE_SIZE = args.hot_cache_size
+    db._cache.clear()
+    path = db._path(gid)
+    stop = threading.Event()
+    reads = [0]
+    torn: List[str] = []
+
+    def reader():
+        while not stop.is_set():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    doc = json.load(f)
+                if doc.get("guild_id") != gid:
+                    torn.append("wrong document")
+            except (ValueError, FileNotFoundError) as e:
+                torn.append(type(e).__name__)
+            reads[0] += 1
+
+    threads = [threading.Thread(target=reader, daemon=True) for _ in range(args.readers)]
+    for t in threads:
+        t.start()
+    written = set()
+    h = metrics.Histogram()
+    _TimedLock.wait = metrics.Histogram()
+
+    async def writer(w: int):
+        for i in range(args.hot_writes):
+            t0 = time.perf_counter()
+            tag = f"hot-{w}-{i}"
+            written.add(tag)
+            if args.hot_api == "update":
+                await db.update_guild(gid, lambda g: g.automod.banned_words.append(tag))
+            else:
+                g = await db.load_guild(gid)
+                g.automod.banned_words.append(tag)
+                await db.save_guild(gid, g)
+            h.observe(time.perf_counter() - t0)
+            # the loop reads too, through load_guild with nothing cached
+            if i % 5 == 0 and args.hot_cache_size == 0:
+                await db.load_guild(gid)
+
+    ex.reset()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(writer(w) for w in range(args.hot_writers)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    for t in threads:
+        t.join()
+
+    ops = args.hot_writers * args.hot_writes
+    _print_phase(f"hot: {args.hot_writers} writers x {args.hot_writes} on one guild "
+                 f"({args.hot_api}, cache {args.hot_cache_size})", ops, elapsed, {"rmw": h})
+    print(f"  guild lock wait: p50 {_TimedLock.wait.quantile(0.5) * 1000:.3f}ms p99 {_TimedLock.wait.quantile(0.99) * 1000:.3f}ms")
+    executor = _executor_report(ex, elapsed)
+
+    db._cache.clear()
+    on_disk = set((await db.load_guild(gid)).automod.banned_words)
+    lost = len(written - on_disk)
+    print(f"  integrity: {len(written)} updates, {lost} lost; {reads[0]} raw reads, {len(torn)} torn"
+          + (f" ({', '.join(sorted(set(torn)))})" if torn else ""))
+    return {"ops_per_s": ops / elapsed, "rmw": _summary(h), "lock_wait": _summary(_TimedLock.wait), "executor": executor,
+            "updates": len(written), "lost": lost, "raw_reads": reads[0], "torn": len(torn)}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--guilds", type=int, default=1000)
+    ap.add_argument("--ops", type=int, default=10000, help="operations in the mixed phase")
+    ap.add_argument("--write-ratio", type=float, default=0.2)
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--workers", type=int, default=min(32, (os.cpu_count() or 1) + 4), help="default executor threads")
+    ap.add_argument("--cache-size", type=int, default=db.CACHE_SIZE, help="db cache entries during the mixed phase")
+    ap.add_argument("--words", type=int, default=5, help="banned words per document (document size)")
+    ap.add_argument("--panels", type=int, default=1, help="reaction-role panels per document (document size)")
+    ap.add_argument("--hot-writers", type=int, default=50)
+    ap.add_argument("--hot-writes", type=int, default=20, help="writes per hot writer")
+    ap.add_argument("--hot-cache-size", type=int, default=0, help="db cache entries during the hot phase")
+    ap.add_argument("--hot-api", choices=("update", "load-save"), default="update",
+                    help="update_guild, or load_guild + save_guild")
+    ap.add_argument("--readers", type=int, default=2, help="threads reading the hot guild's file during the hot phase")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", help="also write the results here, for comparing runs")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        config.DATA_DIR = db.DATA_DIR = pathlib.Path(data_dir)
+        results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    hot = results["hot"]
+    if hot["lost"] or hot["torn"]:
+        print("FAIL: lost updates or torn reads", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
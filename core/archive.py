@@ -0,0 +1,85 @@
+"""
+Streaming export/import of all guild documents as one newline-delimited JSON archive.
+One document is in memory at a time, so this works the same for ten guilds or a million.
+
+    python -m core.archive export backup.ndjson.gz [--include-archived]
+    python -m core.archive import backup.ndjson.gz [--overwrite]
+
+Run import while the bot is stopped: it writes files directly and bypasses the cache.
+The first line is a header; every other line is {"guild_id", "archived", "doc"}.
+"""
+import argparse, gzip, io, json, os, sys
+from typing import IO, Tuple
+
+from . import db
+
+FORMAT = "ahri-guilds"
+VERSION = 1
+
+def _open(path: str, mode: str) -> IO[str]:
+    if path == "-":
+        return sys.stdout if "w" in mode else sys.stdin
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, mode + "b"), encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def export_ndjson(out: IO[str], include_archived: bool = False) -> int:
+    out.write(json.dumps({"format": FORMAT, "version": VERSION}) + "\n")
+    count = 0
+    areas = [(db.GUILDS, False)] + ([(db.ARCHIVE, True)] if include_archived else [])
+    for area, archived in areas:
+        for gid, path in db.iter_guild_files(area):
+            with open(path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+            out.write(json.dumps({"guild_id": gid, "archived": archived, "doc": doc}, ensure_ascii=False, separators=(",", ":")) + "\n")
+            count += 1
+    return count
+
+def import_ndjson(src: IO[str], overwrite: bool = False) -> Tuple[int, int]:
+    """Returns (written, skipped). Raises ValueError on a malformed archive."""
+    header = json.loads(src.readline() or "{}")
+    if header.get("format") != FORMAT or header.get("version", 0) > VERSION:
+        raise ValueError(f"not a {FORMAT} v{VERSION} archive: {header!r}")
+    written = skipped = 0
+    for n, line in enumerate(src, start=2):
+        if not line.strip():
+            continue
+        rec = json.loads(line)
+        gid = int(rec["guild_id"])
+        if not isinstance(rec.get("doc"), dict):
+            raise ValueError(f"line {n}: missing document for guild {gid}")
+        dest = db._path(gid, db.ARCHIVE if rec.get("archived") else db.GUILDS)
+        if dest.exists() and not overwrite:
+            skipped += 1
+            continue
+        db._ensure_parent(dest)
+        tmp = dest.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(rec["doc"], f, ensure_ascii=False, indent=2)
+        os.replace(tmp, dest)
+        written += 1
+    return written, skipped
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("export")
+    ex.add_argument("path", help="output file (.gz to compress, - for stdout)")
+    ex.add_argument("--include-archived", action="store_true", help="also export guilds the bot has left")
+    im = sub.add_parser("import")
+    im.add_argument("path", help="input file (.gz if compressed, - for stdin)")
+    im.add_argument("--overwrite", action="store_true", help="replace documents that already exist")
+    args = ap.parse_args()
+
+    db.migrate_layout()
+    if args.cmd == "export":
+        with _open(args.path, "w") as out:
+            n = export_ndjson(out, args.include_archived)
+        print(f"exported {n} guilds", file=sys.stderr)
+    else:
+        with _open(args.path, "r") as src:
+            written, skipped = import_ndjson(src, args.overwrite)
+        print(f"imported {written} guilds, skipped {skipped} existing", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
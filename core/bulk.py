@@ -0,0 +1,160 @@
+"""
+Bulk moderation: target parsing (mentions, raw IDs, an attached .txt of IDs) and a bounded
+concurrent executor that reports progress in a single edited status message.
+"""
+import asyncio, logging, re
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import discord
+from . import metrics, outbound, permissions
+
+MAX_TARGETS = 1000
+MAX_ID_FILE_BYTES = 256 * 1024
+STATUS_EVERY = 2.0          # seconds between status edits (message edits share a 5/5s bucket)
+MAX_RETRIES = 3             # extra attempts after a 429 that discord.py gave up on
+# requests in flight per (guild, route). discord.py already queues within a rate-limit bucket;
+# this keeps one big job from hogging the global limit while the bot has other work to do.
+ROUTE_CONCURRENCY = {"ban": 2, "kick": 2, "timeout": 3, "roles": 3}
+ROUTE_CLASS = {"ban": outbound.ENFORCEMENT, "kick": outbound.ENFORCEMENT, "timeout": outbound.ENFORCEMENT, "roles": outbound.ADMIN}
+
+_ID_RE = re.compile(r"\b\d{17,20}\b")
+_MENTION_RE = re.compile(r"<@!?(\d{17,20})>")
+_route_sems: Dict[Tuple[int, str], asyncio.Semaphore] = {}
+_running: Set[int] = set()          # guilds with a bulk job in flight
+_tasks: Set[asyncio.Task] = set()
+
+log = logging.getLogger(__name__)
+
+# returns False when the target was skipped (e.g. not a member), raises on failure
+Action = Callable[[int], Awaitable[Optional[bool]]]
+
+def is_snowflake(tok: str) -> bool:
+    return tok.isdigit() and 17 <= len(tok) <= 20
+
+async def parse_targets(message: discord.Message, args: List[str]) -> List[int]:
+    """User IDs from <@id> mentions and bare IDs in the arguments and from .txt/.csv attachments,
+    deduplicated in order. message.mentions isn't used: it also holds the author of the message
+    being replied to. The guild owner, the bot itself and bot admins are never returned."""
+    ids = [int(m) for a in args for m in _MENTION_RE.findall(a)]
+    ids += [int(a) for a in args if is_snowflake(a)]
+    for att in message.attachments:
+        if att.filename.lower().endswith((".txt", ".csv")) and att.size <= MAX_ID_FILE_BYTES:
+            text = (await att.read()).decode("utf-8", "replace")
+            ids += [int(x) for x in _ID_RE.findall(text)]
+    guild = message.guild
+    grants = await permissions.admin_grants(guild.id)
+    protected = {guild.owner_id, guild.me.id if guild.me else None} | grants.users
+
+    def is_protected(uid: int) -> bool:
+        if uid in protected:
+            return True
+        member = guild.get_member(uid) if grants.roles else None
+        return member is not None and any(r.id in grants.roles for r in member.roles)
+    return [i for i in dict.fromkeys(ids) if not is_protected(i)]
+
+@dataclass
+class BulkResult:
+    total: int
+    ok: int = 0
+    skipped: int = 0
+    failed: Dict[int, str] = field(default_factory=dict)
+
+    @property
+    def done(self) -> int:
+        return self.ok + self.skipped + len(self.failed)
+
+def _reason(e: Exception) -> str:
+    if isinstance(e, discord.Forbidden):
+        return "missing permissions"
+    if isinstance(e, discord.NotFound):
+        return "unknown user"
+    if isinstance(e, discord.HTTPException):
+        return f"HTTP {e.status}"
+    return type(e).__name__
+
+def _route_sem(guild_id: int, route: str) -> asyncio.Semaphore:
+    key = (guild_id, route)
+    sem = _route_sems.get(key)
+    if sem is None:
+        sem = _route_sems[key] = asyncio.Semaphore(ROUTE_CONCURRENCY.get(route, 2))
+    return sem
+
+async def run(guild_id: int, route: str, targets: List[int], action: Action, res: BulkResult):
+    sem = _route_sem(guild_id, route)
+    cls = ROUTE_CLASS.get(route, outbound.ADMIN)
+
+    async def one(tid: int):
+        async with sem:
+            for attempt in range(MAX_RETRIES + 1):
+                try:
+                    if await outbound.run(cls, lambda: action(tid), key=(guild_id, route)) is False:
+                        res.skipped += 1
+                    else:
+                        res.ok += 1
+                    return
+                except discord.HTTPException as e:
+                    if e.status == 429 and attempt < MAX_RETRIES:
+                        metrics.inc("bulk_retries")
+                        await asyncio.sleep(getattr(e, "retry_after", None) or 2 ** attempt)
+                        continue
+                    res.failed[tid] = _reason(e)
+                    return
+                except Exception as e:
+                    res.failed[tid] = _reason(e)
+                    return
+
+    await asyncio.gather(*(one(t) for t in targets))
+
+def _progress(verb: str, res: BulkResult) -> str:
+    return f"⏳ {verb}: {res.done}/{res.total} ({res.ok} ok, {len(res.failed)} failed)"
+
+def report(verb: str, res: BulkResult) -> str:
+    head = "✅" if not res.failed else "⚠️"
+    text = f"{head} {verb}: {res.ok}/{res.total} done"
+    if res.skipped:
+        text += f", {res.skipped} skipped"
+    if res.failed:
+        text += f", {len(res.failed)} failed:\n" + "\n".join(f"`{tid}` — {why}" for tid, why in list(res.failed.items())[:15])
+        if len(res.failed) > 15:
+            text += f"\n…and {len(res.failed) - 15} more"
+    return text
+
+async def _job(channel, guild_id: int, route: str, verb: str, targets: List[int], action: Action):
+    res = BulkResult(total=len(targets))
+    worker = None
+    try:
+        status = await outbound.run(outbound.ADMIN, lambda: channel.send(_progress(verb, res)))
+        worker = asyncio.ensure_future(run(guild_id, route, targets, action, res))
+        last = -1
+        while not worker.done():
+            await asyncio.wait({worker}, timeout=STATUS_EVERY)
+            if not worker.done() and res.done != last:
+                last = res.done
+                text = _progress(verb, res)
+                try:
+                    # awaited, so a late progress edit can't overwrite the final report
+                    await outbound.run(outbound.ADMIN, lambda: status.edit(content=text))
+                except discord.HTTPException:
+                    pass
+        await worker
+        await outbound.run(outbound.ADMIN, lambda: status.edit(content=report(verb, res)))
+    finally:
+        if worker is not None:
+            worker.cancel()
+        _running.discard(guild_id)
+        log.info("Bulk %s finished: %d ok, %d skipped, %d failed", route, res.ok, res.skipped, len(res.failed),
+                 extra={"guild_id": guild_id, "route": route, "total": res.total})
+
+def start(message: discord.Message, route: str, verb: str, targets: List[int], action: Action) -> bool:
+    """Run `action` over `targets` in the background (bulk jobs outlive the handler timeout).
+    Returns False if this guild already has a bulk job running."""
+    gid = message.guild.id
+    if gid in _running:
+        return False
+    _running.add(gid)
+    metrics.inc("bulk_jobs")
+    task = asyncio.ensure_future(_job(message.channel, gid, route, verb, targets[:MAX_TARGETS], action))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return True
@@ -8,6 +8,17 @@ DATA_DIR = pathlib.Path("data")
 class Config:
     token: str
     app_id: str | None = None
+    metrics_port: int | None = None
+    metrics_host: str = "127.0.0.1"
+
+def _port(name: str) -> int | None:
+    raw = os.getenv(name)
+    if not raw:
+        return None
+    if raw.strip().isdigit() and 0 < int(raw) < 65536:
+        return int(raw)
+    logging.getLogger().error("%s=%r is not a valid port; metrics endpoint disabled", name, raw)
+    return None
 
 def load_env() -> Config:
     load_dotenv()
@@ -16,7 +27,12 @@ def load_env() -> Config:
     if not token:
         raise RuntimeError("DISCORD_TOKEN missing in env")
     logging.getLogger().info("Loaded env (app_id=%s)", app_id)
-    return Config(token=token, app_id=app_id)
+    return Config(
+        token=token,
+        app_id=app_id,
+        metrics_port=_port("AHRI_METRICS_PORT"),
+        metrics_host=os.getenv("AHRI_METRICS_HOST", "127.0.0.1"),
+    )
 
 def ensure_data_dir():
     DATA_DIR.mkdir(parents=True, exist_ok=True)
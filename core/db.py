@@ -1,58 +1,250 @@
-import os, json, asyncio, time, pathlib
-from typing import Dict, Any
+import os, json, asyncio, time, pathlib, hashlib, logging, shutil
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
 from .config import DATA_DIR
+from .models import Guild
+from . import metrics
 
 _locks: dict[int, asyncio.Lock] = {}
 
-def _path(guild_id: int) -> pathlib.Path:
-    return DATA_DIR / f"{guild_id}.json"
-
-def _default(guild_id: int) -> Dict[str, Any]:
-    return {
-        "guild_id": guild_id,
-        "activated": False,
-        "admins": [],
-        "settings": {
-            "automod": {"enabled": False, "banned_words": [], "spam_threshold": 5},
-            "reaction_roles": {"panels": []},
-            "logging": {"channel_id": None},
-        },
-        "last_updated": None,
-    }
-
-async def ensure_guild(guild_id: int) -> Dict[str, Any]:
+# read-through cache of guild documents; this process is the only writer, so a saved
+# document is the cached one. Callers get the cached object itself, not a copy.
+# load_guild + save_guild is only safe against concurrent changes while the entry stays
+# cached: once it is evicted, two callers load separate copies and the later save drops
+# the other's change. Use update_guild where that matters.
+CACHE_SIZE = int(os.getenv("AHRI_DB_CACHE_SIZE", "4096"))
+_cache: "OrderedDict[int, Guild]" = OrderedDict()
+metrics.gauge("db_cache_size", lambda: len(_cache))
+
+# --- bookkeeping for core/snapshot.py ---
+_dirty: Set[int] = set()                        # saved since the last snapshot took its view
+_inflight: Dict[int, dict] = {}                 # serialised documents still waiting for their write
+# the last document each dirty guild had written, newest last and capped at CACHE_SIZE; a
+# dirty guild missing here is read back from disk
+_last_saved: "OrderedDict[int, dict]" = OrderedDict()
+# guilds a running snapshot still has to read from disk; a writer that gets there first
+# stores the file's previous bytes here (b"" if there was none) before replacing it
+_frozen: Dict[int, Optional[bytes]] = {}
+
+def _preserve(guild_id: int, p: pathlib.Path):
+    """Called under the guild lock (on the executor) right before `p` is replaced or moved."""
+    if guild_id in _frozen and _frozen[guild_id] is None:
+        _frozen[guild_id] = p.read_bytes() if p.exists() else b""
+
+def _cache_put(guild_id: int, data: Guild):
+    _cache[guild_id] = data
+    _cache.move_to_end(guild_id)
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+
+# data/guilds/<shard>/<guild_id>.json, and data/archive/<shard>/<guild_id>.json for guilds
+# the bot has left. Two hex chars of a hash give 256 shards with an even spread (snowflake
+# low bits are a per-process counter and cluster badly).
+GUILDS = "guilds"
+ARCHIVE = "archive"
+_made_dirs: set = set()
+
+log = logging.getLogger(__name__)
+
+def shard(guild_id: int) -> str:
+    return hashlib.blake2b(str(guild_id).encode(), digest_size=1).hexdigest()
+
+def _path(guild_id: int, area: str = GUILDS) -> pathlib.Path:
+    return DATA_DIR / area / shard(guild_id) / f"{guild_id}.json"
+
+def _ensure_parent(p: pathlib.Path):
+    if p.parent not in _made_dirs:
+        p.parent.mkdir(parents=True, exist_ok=True)
+        _made_dirs.add(p.parent)
+
+def iter_guild_files(area: str = GUILDS) -> Iterator[Tuple[int, pathlib.Path]]:
+    """(guild_id, path) for every stored document, one shard directory at a time."""
+    root = DATA_DIR / area
+    if not root.is_dir():
+        return
+    for sd in sorted(root.iterdir()):
+        if not sd.is_dir():
+            continue
+        for f in sd.iterdir():
+            if f.suffix == ".json" and f.stem.isdigit():
+                yield int(f.stem), f
+
+def migrate_layout() -> Tuple[int, int]:
+    """
+    Move flat data/<id>.json files into their shards and delete orphaned .json.tmp files.
+    Synchronous; run at startup before anything writes. Returns (moved, temp files removed).
+    """
+    moved = cleaned = 0
+    if not DATA_DIR.is_dir():
+        return moved, cleaned
+    tmp_files = list(DATA_DIR.glob("*.json.tmp"))
+    for area in (GUILDS, ARCHIVE):
+        if (DATA_DIR / area).is_dir():
+            tmp_files += list((DATA_DIR / area).glob("*/*.json.tmp"))
+    for f in tmp_files:
+        # a crash between write and rename; the .json next to it is the last complete version
+        f.unlink(missing_ok=True)
+        cleaned += 1
+    for f in DATA_DIR.glob("*.json"):
+        if not f.stem.isdigit():
+            continue        # _app_commands.json and friends stay where they are
+        dest = _path(int(f.stem))
+        _ensure_parent(dest)
+        if dest.exists() and dest.stat().st_mtime >= f.stat().st_mtime:
+            f.unlink()
+        else:
+            os.replace(f, dest)
+        moved += 1
+    if moved or cleaned:
+        log.info("Data layout: moved %d guild files into shards, removed %d orphaned temp files", moved, cleaned)
+    return moved, cleaned
+
+def _default(guild_id: int) -> Guild:
+    return Guild(guild_id=guild_id)
+
+async def ensure_guild(guild_id: int) -> Guild:
+    """Give a guild the bot (re)joined a stored document: its archived one if there is one."""
     p = _path(guild_id)
+    if not p.exists() and await _unarchive(guild_id):
+        _cache.pop(guild_id, None)      # may hold a default load_guild handed out meanwhile
+        return await load_guild(guild_id)
     if not p.exists():
-        data = _default(guild_id)
+        data = _cache.get(guild_id) or _default(guild_id)
         await save_guild(guild_id, data)
         return data
     return await load_guild(guild_id)
 
-async def load_guild(guild_id: int) -> Dict[str, Any]:
+async def _read(guild_id: int) -> Optional[Tuple[Guild, bool]]:
+    """(document, outdated) as stored on disk, or None if there is none. Leaves the cache alone."""
     p = _path(guild_id)
     if not p.exists():
-        return await ensure_guild(guild_id)
-    loop = asyncio.get_running_loop()
-    def _read():
+        return None
+    def _load():
         with open(p, "r", encoding="utf-8") as f:
             return json.load(f)
-    return await loop.run_in_executor(None, _read)
+    raw = await asyncio.get_running_loop().run_in_executor(None, _load)
+    data, outdated = Guild.from_dict(raw)
+    data.guild_id = guild_id
+    return data, outdated
 
-async def save_guild(guild_id: int, data: Dict[str, Any]):
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
+@metrics.timed("db.load_guild")
+async def load_guild(guild_id: int) -> Guild:
+    cached = _cache.get(guild_id)
+    if cached is not None:
+        _cache.move_to_end(guild_id)
+        metrics.inc("db_cache_hits")
+        return cached
+    metrics.inc("db_cache_misses")
+    stored = await _read(guild_id)
+    if stored is None:
+        # nothing stored (or only archived, which ensure_guild restores on join): a default
+        # that isn't written until someone saves it
+        data = _cache.get(guild_id) or _default(guild_id)
+        _cache_put(guild_id, data)
+        return data
+    # another coroutine may have loaded/saved it while we were reading
+    cached = _cache.get(guild_id)
+    if cached is not None:
+        return cached
+    data, outdated = stored
+    _cache_put(guild_id, data)
+    if outdated:
+        # one-time migration to the current schema
+        metrics.inc("db_migrated")
+        await save_guild(guild_id, data)
+    return data
+
+async def find_guild(guild_id: int) -> Optional[Guild]:
+    """The guild's document if it has one, else None. Unlike load_guild, never creates one."""
+    cached = _cache.get(guild_id)
+    if cached is not None:
+        return cached
+    if not _path(guild_id).exists():
+        return None
+    return await load_guild(guild_id)
+
+def _stage(guild_id: int, data: Guild) -> dict:
+    _cache_put(guild_id, data)
+    # serialise on the loop: the object may be mutated again while the write runs
+    doc = data.to_dict()
+    _dirty.add(guild_id)
+    _inflight[guild_id] = doc
+    return doc
+
+async def _write(guild_id: int, data: Guild, doc: dict):
+    """
+    Replace the stored document. The caller holds the guild lock. If the write fails the
+    cache entry is dropped, so the next load sees what is actually on disk.
+    """
     p = _path(guild_id)
+    _ensure_parent(p)
+    def _do():
+        tmp = p.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(doc, f, ensure_ascii=False, indent=2)
+        _preserve(guild_id, p)
+        os.replace(tmp, p)
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, _do)
+        _last_saved[guild_id] = doc
+        _last_saved.move_to_end(guild_id)
+        while len(_last_saved) > CACHE_SIZE:
+            _last_saved.popitem(last=False)
+    except BaseException:
+        if _cache.get(guild_id) is data:
+            del _cache[guild_id]
+        metrics.inc("db_write_failures")
+        raise
+    finally:
+        if _inflight.get(guild_id) is doc:
+            del _inflight[guild_id]
+
+@metrics.timed("db.save_guild")
+async def save_guild(guild_id: int, data: Guild):
+    doc = _stage(guild_id, data)
+    async with _locks.setdefault(guild_id, asyncio.Lock()):
+        await _write(guild_id, data, doc)
+
+@metrics.timed("db.update_guild")
+async def update_guild(guild_id: int, fn: Callable[[Guild], None]) -> Guild:
+    """
+    Load, apply `fn` and save, all under the guild lock, so concurrent updates can't
+    overwrite each other even when the document isn't cached. `fn` must not await.
+    """
+    async with _locks.setdefault(guild_id, asyncio.Lock()):
+        data = _cache.get(guild_id)
+        if data is None:
+            stored = await _read(guild_id)
+            # a load_guild that finished meanwhile put its copy in the cache; keep that one
+            data = _cache.get(guild_id) or (stored[0] if stored else _default(guild_id))
+        fn(data)
+        await _write(guild_id, data, _stage(guild_id, data))
+    return data
+
+async def set_activated(guild_id: int, value: bool):
+    def apply(data: Guild):
+        data.activated = bool(value)
+        data.last_updated = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    await update_guild(guild_id, apply)
+
+async def _move(guild_id: int, src: pathlib.Path, dest: pathlib.Path, live_src: bool) -> bool:
     lock = _locks.setdefault(guild_id, asyncio.Lock())
     async with lock:
-        loop = asyncio.get_running_loop()
-        def _write():
-            tmp = p.with_suffix(".json.tmp")
-            with open(tmp, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            os.replace(tmp, p)
-        await loop.run_in_executor(None, _write)
+        if not src.exists():
+            return False
+        _ensure_parent(dest)
+        def _do():
+            if live_src:
+                _preserve(guild_id, src)
+            shutil.move(src, dest)
+        await asyncio.get_running_loop().run_in_executor(None, _do)
+        return True
 
-async def set_activated(guild_id: int, value: bool):
-    data = await load_guild(guild_id)
-    data["activated"] = bool(value)
-    data["last_updated"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-    await save_guild(guild_id, data)
+async def archive_guild(guild_id: int) -> bool:
+    """Move a departed guild's document out of the live set. Rejoining restores it."""
+    _cache.pop(guild_id, None)
+    _last_saved.pop(guild_id, None)
+    return await _move(guild_id, _path(guild_id), _path(guild_id, ARCHIVE), live_src=True)
+
+async def _unarchive(guild_id: int) -> bool:
+    return await _move(guild_id, _path(guild_id, ARCHIVE), _path(guild_id), live_src=False)
@@ -0,0 +1,123 @@
+"""
+On-demand introspection of the running process. Nothing here runs, hooks or allocates until
+a command asks for it: tracemalloc stays off until `mem start`, and the sampling profiler is
+a thread that exists only for the duration of one profile.
+"""
+import asyncio, os, sys, threading, time, tracemalloc
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from . import db
+
+PROFILE_INTERVAL = 0.005    # seconds between samples (~200 Hz); the sampler holds the GIL only briefly
+MAX_PROFILE_SECONDS = 120
+MAX_STACK_DEPTH = 64
+
+# --- memory: tracemalloc snapshots diffed against a baseline ---
+_baseline: Optional[tracemalloc.Snapshot] = None
+
+_NOISE = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+def mem_tracing() -> bool:
+    return tracemalloc.is_tracing()
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_NOISE)
+
+async def mem_start(frames: int = 10):
+    """Start tracing (if needed) and take the baseline everything is diffed against."""
+    global _baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(max(1, min(frames, 50)))
+    _baseline = await asyncio.get_running_loop().run_in_executor(None, _snapshot)
+
+def mem_stop():
+    global _baseline
+    _baseline = None
+    tracemalloc.stop()
+
+async def mem_diff(limit: int = 10, key: str = "lineno") -> Tuple[List[str], int, int]:
+    """Top allocation growth since the baseline: (lines, traced bytes now, peak)."""
+    if _baseline is None:
+        raise RuntimeError("tracing not started")
+    def work():
+        stats = _snapshot().compare_to(_baseline, key)
+        lines = []
+        for st in stats[:limit]:
+            frame = st.traceback[0]
+            lines.append(f"{st.size_diff / 1024:+9.1f} KiB {st.count_diff:+7d}  {_short(frame.filename)}:{frame.lineno}")
+        return lines
+    lines = await asyncio.get_running_loop().run_in_executor(None, work)
+    current, peak = tracemalloc.get_traced_memory()
+    return lines, current, peak
+
+def _short(path: str) -> str:
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and path.startswith(prefix + os.sep):
+            return path[len(prefix) + 1:]
+    return path
+
+# --- CPU: sampling profiler writing collapsed stacks ---
+_profiling = threading.Lock()
+
+def _label(code) -> str:
+    return f"{_short(code.co_filename)}:{code.co_name}".replace(";", ":").replace(" ", "_")
+
+def _sample(thread_id: int, seconds: float) -> Tuple[Counter, int]:
+    stacks: Counter = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            names = []
+            while frame is not None and len(names) < MAX_STACK_DEPTH:
+                names.append(_label(frame.f_code))
+                frame = frame.f_back
+            stacks[";".join(reversed(names))] += 1
+            samples += 1
+        time.sleep(PROFILE_INTERVAL)
+    return stacks, samples
+
+def _write_folded(stacks: Counter) -> str:
+    out = db.DATA_DIR / "profiles"
+    out.mkdir(parents=True, exist_ok=True)
+    p = out / time.strftime("profile-%Y%m%dT%H%M%SZ.folded", time.gmtime())
+    with open(p, "w", encoding="utf-8") as f:
+        for stack, n in stacks.most_common():
+            f.write(f"{stack} {n}\n")
+    return str(p)
+
+async def profile(seconds: float) -> Tuple[str, int, List[Tuple[str, int]]]:
+    """
+    Sample the event-loop thread for `seconds`. Returns (path of the collapsed-stack file,
+    sample count, top functions by self time). The file loads in flamegraph.pl or speedscope.
+    """
+    if not _profiling.acquire(blocking=False):
+        raise RuntimeError("a profile is already running")
+    try:
+        loop_thread = threading.get_ident()
+        seconds = max(1.0, min(float(seconds), MAX_PROFILE_SECONDS))
+        # its own thread rather than the default executor, which the bot needs meanwhile
+        fut = asyncio.get_running_loop().create_future()
+        def run():
+            try:
+                res = _sample(loop_thread, seconds)
+            except BaseException as e:
+                fut.get_loop().call_soon_threadsafe(fut.set_exception, e)
+            else:
+                fut.get_loop().call_soon_threadsafe(fut.set_result, res)
+        threading.Thread(target=run, name="ahri-profiler", daemon=True).start()
+        stacks, samples = await fut
+        path = await asyncio.get_running_loop().run_in_executor(None, _write_folded, stacks)
+        leaf: Counter = Counter()
+        for stack, n in stacks.items():
+            leaf[stack.rsplit(";", 1)[-1]] += n
+        return path, samples, leaf.most_common(10)
+    finally:
+        _profiling.release()
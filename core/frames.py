@@ -0,0 +1,226 @@
+"""
+Representative-frame sampling for animated images (GIF/WebP/APNG) and short videos.
+
+Decoding runs in a small process pool so a huge animation never blocks the event loop.
+Pillow is needed for animations, PyAV (`av`) for video (both in requirements.txt). Without
+Pillow an animation gets a single-verdict scan; without PyAV videos aren't scanned at all.
+Either case is logged once.
+"""
+import asyncio, io, math, multiprocessing, struct, time, logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+try:
+    from PIL import Image, ImageChops, ImageStat
+except ImportError:  # optional
+    Image = None
+
+try:
+    import av
+except ImportError:  # optional
+    av = None
+
+MAX_INPUT_BYTES = 16 * 1024 * 1024      # don't even download bigger files
+MAX_OUT_FRAMES = 6                      # frames handed to the provider per file
+MAX_DECODE_FRAMES = 240                 # frames inspected per file (strided above this)
+MAX_DECODE_PIXELS = 120_000_000         # total decoded pixels per file
+DECODE_TIMEOUT = 8.0                    # seconds, enforced in the worker and the caller
+WORKER_MEMORY_BUDGET = 512 * 1024 * 1024    # address space a worker may add on top of what it maps at start
+SNIFF_BYTES = 64 * 1024                 # header bytes read to tell an animation from a still image
+POOL_WORKERS = 2
+
+THUMB_EDGE = 48                         # scene-change comparison size
+SCENE_THRESHOLD = 12.0                  # mean abs luma diff (0-255) that counts as a new scene
+OUT_EDGE = 640
+OUT_QUALITY = 80
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+_warned_missing: set = set()
+
+def available(kind: str) -> bool:
+    ok = (av is not None) if kind == "video" else (Image is not None)
+    if not ok and kind not in _warned_missing:
+        _warned_missing.add(kind)
+        logging.getLogger(__name__).warning("No frame sampling for %s: %s isn't installed; %s", kind,
+                                            "PyAV (av)" if kind == "video" else "Pillow",
+                                            "videos are not scanned" if kind == "video" else "only one verdict per file")
+    return ok
+
+def _init_worker():
+    # RLIMIT_AS counts everything already mapped (interpreter, Pillow, PyAV's codecs), so the
+    # cap is relative to the worker's own size rather than an absolute number
+    try:
+        import resource
+        with open("/proc/self/statm") as f:
+            mapped = int(f.read().split()[0]) * resource.getpagesize()
+        limit = mapped + WORKER_MEMORY_BUDGET
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except Exception:
+        pass
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: a forked child would inherit the bot's whole address space
+        _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                    initializer=_init_worker)
+    return _pool
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def sniff_animated(head: bytes) -> Optional[bool]:
+    """
+    From the first bytes of a GIF, WebP or PNG: True if animated, False if it's a still
+    image, None if the header doesn't say (unknown format, or not enough bytes yet).
+    """
+    try:
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            fourcc = head[12:16]
+            if fourcc in (b"VP8 ", b"VP8L"):
+                return False
+            if fourcc == b"VP8X" and len(head) > 20:
+                return bool(head[20] & 0x02)
+            return None
+        if head[:8] == b"\x89PNG\r\n\x1a\n":
+            pos = 8
+            while pos + 8 <= len(head):
+                length, kind = struct.unpack(">I4s", head[pos:pos + 8])
+                if kind == b"acTL":
+                    return True
+                if kind == b"IDAT":
+                    return False
+                pos += 12 + length
+            return None
+        if head[:6] in (b"GIF87a", b"GIF89a"):
+            return _sniff_gif(head)
+    except (IndexError, struct.error):
+        return None
+    return None
+
+def _skip_sub_blocks(head: bytes, pos: int) -> int:
+    while head[pos]:
+        pos += head[pos] + 1
+    return pos + 1
+
+def _sniff_gif(head: bytes) -> Optional[bool]:
+    packed = head[10]
+    pos = 13 + (3 << ((packed & 7) + 1) if packed & 0x80 else 0)
+    images = 0
+    while pos < len(head):
+        block = head[pos]
+        if block == 0x21:       # extension
+            if head[pos + 1] == 0xFF and head[pos + 3:pos + 14] == b"NETSCAPE2.0":
+                return True     # looping extension
+            pos = _skip_sub_blocks(head, pos + 2)
+        elif block == 0x2C:     # image
+            images += 1
+            if images > 1:
+                return True
+            local = head[pos + 9]
+            pos += 10 + (3 << ((local & 7) + 1) if local & 0x80 else 0)
+            pos = _skip_sub_blocks(head, pos + 1)   # after the LZW minimum code size
+        elif block == 0x3B:     # trailer
+            return False
+        else:
+            return None
+    return None
+
+# --- worker side (must stay picklable / top-level) ---
+class _Picker:
+    """Keeps the first frame plus the strongest scene changes, bounded to max_frames."""
+
+    def __init__(self, max_frames: int):
+        self.max_frames = max_frames
+        self.picked: List[tuple] = []   # (score, index, image)
+        self.last_thumb = None
+
+    def feed(self, index: int, frame) -> None:
+        rgb = frame.convert("RGB")
+        thumb = rgb.resize((THUMB_EDGE, THUMB_EDGE)).convert("L")
+        if self.last_thumb is None:
+            score = float("inf")
+        else:
+            score = ImageStat.Stat(ImageChops.difference(thumb, self.last_thumb)).mean[0]
+            if score < SCENE_THRESHOLD:
+                return
+        self.last_thumb = thumb
+        rgb.thumbnail((OUT_EDGE, OUT_EDGE))
+        self.picked.append((score, index, rgb))
+        if len(self.picked) > self.max_frames:
+            # drop the weakest scene change, never the first frame
+            weakest = min(range(1, len(self.picked)), key=lambda i: self.picked[i][0])
+            self.picked.pop(weakest)
+
+    def encode(self) -> List[bytes]:
+        out = []
+        for _, _, img in sorted(self.picked, key=lambda p: p[1]):
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=OUT_QUALITY)
+            out.append(buf.getvalue())
+        return out
+
+def _sample_animation(data: bytes, max_frames: int, deadline: float) -> List[bytes]:
+    im = Image.open(io.BytesIO(data))
+    n = getattr(im, "n_frames", 1)
+    if not getattr(im, "is_animated", False) or n < 2:
+        return []
+    step = max(1, math.ceil(n / MAX_DECODE_FRAMES))
+    per_frame = im.size[0] * im.size[1]
+    budget = MAX_DECODE_PIXELS
+    picker = _Picker(max_frames)
+    for i in range(0, n, step):
+        if time.monotonic() > deadline or budget < per_frame:
+            break
+        im.seek(i)
+        budget -= per_frame
+        picker.feed(i, im)
+    return picker.encode()
+
+def _sample_video(data: bytes, max_frames: int, deadline: float) -> List[bytes]:
+    picker = _Picker(max_frames)
+    with av.open(io.BytesIO(data)) as container:
+        stream = next((s for s in container.streams if s.type == "video"), None)
+        if stream is None:
+            return []
+        stream.codec_context.skip_frame = "NONKEY"  # keyframes are plenty for scene picks
+        budget = MAX_DECODE_PIXELS
+        for i, frame in enumerate(container.decode(stream)):
+            if time.monotonic() > deadline or i >= MAX_DECODE_FRAMES:
+                break
+            per_frame = frame.width * frame.height
+            if budget < per_frame:
+                break
+            budget -= per_frame
+            picker.feed(i, frame.to_image())
+    return picker.encode()
+
+def _sample(data: bytes, kind: str, max_frames: int, timeout: float) -> List[bytes]:
+    deadline = time.monotonic() + timeout
+    if kind == "video":
+        return _sample_video(data, max_frames, deadline)
+    return _sample_animation(data, max_frames, deadline)
+
+# --- caller side ---
+async def sample(data: bytes, kind: str = "image", max_frames: int = MAX_OUT_FRAMES) -> List[bytes]:
+    """
+    Return up to `max_frames` JPEG-encoded representative frames, or [] when the file is
+    static, unsupported, over budget or the optional decoder is missing.
+    """
+    if not available(kind) or len(data) > MAX_INPUT_BYTES:
+        return []
+    loop = asyncio.get_running_loop()
+    fut = loop.run_in_executor(_get_pool(), _sample, data, kind, max_frames, DECODE_TIMEOUT)
+    try:
+        # small grace on top of the worker's own deadline for pickling the result back
+        return await asyncio.wait_for(fut, timeout=DECODE_TIMEOUT + 2.0)
+    except asyncio.TimeoutError:
+        logging.getLogger(__name__).warning("Frame sampling timed out (%s, %d bytes)", kind, len(data))
+        return []
+    except Exception as e:
+        logging.getLogger(__name__).warning("Frame sampling failed (%s): %s", kind, e)
+        return []
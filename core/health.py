@@ -0,0 +1,70 @@
+"""
+Optional local HTTP endpoint: /metrics (Prometheus text format) and /healthz.
+Enabled when AHRI_METRICS_PORT is set; binds to 127.0.0.1 unless AHRI_METRICS_HOST says otherwise.
+"""
+import asyncio, json, logging, math
+from typing import Optional
+
+from aiohttp import web
+
+from . import metrics
+
+LAG_INTERVAL = 1.0          # seconds between event-loop lag probes
+LAG_UNHEALTHY = 1.0         # worst recent lag (s) before /healthz fails
+GATEWAY_UNHEALTHY = 10.0    # websocket heartbeat latency (s) before /healthz fails
+_LAG_WINDOW = 30            # probes kept for the "recent" lag
+
+class HealthServer:
+    def __init__(self, bot, host: str, port: int):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.recent_lag: list[float] = []
+        self._runner: Optional[web.AppRunner] = None
+        self._probe: Optional[asyncio.Task] = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._metrics)
+        app.router.add_get("/healthz", self._healthz)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._probe = asyncio.create_task(self._lag_probe(), name="ahri-lag-probe")
+        metrics.gauge("event_loop_lag_seconds", lambda: self.recent_lag[-1] if self.recent_lag else 0.0)
+        metrics.gauge("gateway_latency_seconds", self._gateway_latency)
+        logging.getLogger(__name__).info("Metrics/health endpoint on http://%s:%d", self.host, self.port)
+
+    async def stop(self):
+        if self._probe:
+            self._probe.cancel()
+            self._probe = None
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _lag_probe(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            lag = max(0.0, loop.time() - t0 - LAG_INTERVAL)
+            metrics.observe("event_loop.lag", lag)
+            self.recent_lag.append(lag)
+            if len(self.recent_lag) > _LAG_WINDOW:
+                del self.recent_lag[0]
+
+    def _gateway_latency(self) -> float:
+        lat = self.bot.latency
+        return lat if math.isfinite(lat) else -1.0
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    async def _healthz(self, request: web.Request) -> web.Response:
+        lag = max(self.recent_lag[-5:], default=0.0)
+        gw = self._gateway_latency()
+        ready = self.bot.is_ready() and not self.bot.is_closed()
+        ok = ready and lag < LAG_UNHEALTHY and 0.0 <= gw < GATEWAY_UNHEALTHY
+        body = {"ok": ok, "ready": ready, "loop_lag": round(lag, 4), "gateway_latency": round(gw, 4)}
+        return web.Response(text=json.dumps(body), status=200 if ok else 503, content_type="application/json")
@@ -1,19 +1,244 @@
-import importlib, pkgutil, logging
+import importlib, pkgutil, logging, os, ast, time, asyncio, sys
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# AHRI_LAZY_FEATURES=1: register triggers/listeners from each module's FEATURE_INFO
+# (read from source, not imported) and import the module on first use.
+LAZY = os.getenv("AHRI_LAZY_FEATURES", "0").lower() in ("1", "true", "yes", "on")
+
+log = logging.getLogger(__name__)
+
+@dataclass
+class FeatureRecord:
+    name: str                                   # short module name, e.g. "automod"
+    module: Any = None                          # None while only the manifest is registered
+    triggers: List[str] = field(default_factory=list)
+    listeners: List[Tuple[str, Callable]] = field(default_factory=list)
+    stubs: List[Tuple[str, Callable]] = field(default_factory=list)    # lazy listener stubs
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    import_ms: float = 0.0
+    setup_ms: float = 0.0
+
+def _records(bot) -> Dict[str, FeatureRecord]:
+    if getattr(bot, "feature_records", None) is None:
+        bot.feature_records = {}
+    return bot.feature_records
+
+def _qualname(name: str) -> str:
+    import features
+    return features.__name__ + "." + name
+
+def read_manifest(path: str) -> Optional[Dict[str, Any]]:
+    """FEATURE_INFO from a module's source without importing it (literal dicts only)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename=path)
+    except (OSError, SyntaxError):
+        return None
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == "FEATURE_INFO" for t in node.targets):
+            try:
+                info = ast.literal_eval(node.value)
+            except ValueError:
+                return None
+            return info if isinstance(info, dict) else None
+    return None
+
+def _record_info(bot, default_name: str, info: Optional[Dict[str, Any]]):
+    if info:
+        bot.feature_info[info.get("name", default_name)] = {"triggers": info.get("triggers", [])}
+
+async def _maybe_await(res):
+    if hasattr(res, "__await__"):
+        await res
+
+async def _import_and_setup(bot, rec: FeatureRecord, mod: Any = None):
+    """Import (unless given) + setup, recording which triggers and listeners the module registered."""
+    before_triggers = dict(bot.trigger_handlers)
+    before_listeners = {ev: list(fns) for ev, fns in bot.extra_events.items()}
+
+    t0 = time.perf_counter()
+    if mod is None:
+        mod = importlib.import_module(_qualname(rec.name))
+    t1 = time.perf_counter()
+    if hasattr(mod, "setup"):
+        await _maybe_await(mod.setup(bot))
+    t2 = time.perf_counter()
+
+    rec.module = mod
+    rec.import_ms = (t1 - t0) * 1000
+    rec.setup_ms = (t2 - t1) * 1000
+    rec.triggers = [k for k, v in bot.trigger_handlers.items() if before_triggers.get(k) is not v]
+    rec.listeners = [
+        (ev, fn) for ev, fns in bot.extra_events.items() for fn in fns
+        if not any(fn is old for old in before_listeners.get(ev, []))
+    ]
+    _record_info(bot, rec.name, getattr(mod, "FEATURE_INFO", None))
+    log.info("Loaded feature %s (import %.1f ms, setup %.1f ms)", rec.name, rec.import_ms, rec.setup_ms,
+             extra={"feature": rec.name, "import_ms": round(rec.import_ms, 2), "setup_ms": round(rec.setup_ms, 2)})
+
+async def ensure_loaded(bot, name: str) -> Optional[FeatureRecord]:
+    rec = _records(bot).get(name)
+    if rec is None:
+        return None
+    async with rec.lock:
+        if rec.module is not None:
+            return rec
+        # drop the stubs before setup registers the real listeners, so no event reaches both
+        for ev, fn in rec.stubs:
+            bot.remove_listener(fn, ev)
+        rec.stubs = []
+        try:
+            await _import_and_setup(bot, rec)
+        except Exception as e:
+            log.exception("Failed to load feature %s: %s", _qualname(name), e)
+            bot.failed_modules.append(name)
+            for k in [k for k, v in bot.trigger_handlers.items() if getattr(v, "_lazy_module", None) == name]:
+                del bot.trigger_handlers[k]
+            return None
+        return rec
+
+async def materialize(bot, cmd: str, handler: Callable) -> Optional[Callable]:
+    """Resolve a lazy trigger stub to the real handler, importing its module if needed."""
+    name = getattr(handler, "_lazy_module", None)
+    if name is None:
+        return handler
+    if await ensure_loaded(bot, name) is None:
+        return None
+    real = bot.trigger_handlers.get(cmd)
+    return None if getattr(real, "_lazy_module", None) else real
+
+def _make_trigger_stub(name: str, trigger: str):
+    async def stub(bot, message, args):
+        handler = await materialize(bot, trigger, stub)
+        if handler is not None:
+            await handler(bot, message, args)
+    stub._lazy_module = name
+    return stub
+
+def _make_listener_stub(bot, name: str, event: str):
+    async def stub(*args):
+        rec = await ensure_loaded(bot, name)
+        if rec is None:
+            return
+        for ev, fn in rec.listeners:
+            if ev == event:
+                await fn(*args)
+    stub.__name__ = event
+    return stub
+
+def _register_lazy(bot, name: str, info: Dict[str, Any]):
+    rec = FeatureRecord(name=name)
+    _records(bot)[name] = rec
+    for trig in info.get("triggers", []):
+        # trigger stubs are simply overwritten when setup registers the real handlers
+        bot.trigger_handlers[trig] = _make_trigger_stub(name, trig)
+    for ev in info.get("listeners", []):
+        stub = _make_listener_stub(bot, name, ev)
+        bot.add_listener(stub, ev)
+        rec.stubs.append((ev, stub))
+    _record_info(bot, name, info)
 
 async def load_features(bot):
     import features
-    prefix = features.__name__ + "."
+    t_start = time.perf_counter()
     for m in pkgutil.iter_modules(features.__path__):
-        name = prefix + m.name
+        name = _qualname(m.name)
         try:
-            mod = importlib.import_module(name)
-            if hasattr(mod, "setup"):
-                res = mod.setup(bot)
-                if hasattr(res, "__await__"):
-                    await res
-            info = getattr(mod, "FEATURE_INFO", None)
-            if info:
-                bot.feature_info[info.get("name", m.name)] = {"triggers": info.get("triggers", [])}
+            if LAZY:
+                info = read_manifest(os.path.join(m.module_finder.path, m.name + ".py"))
+                if info and info.get("lazy", True):
+                    _register_lazy(bot, m.name, info)
+                    continue
+            rec = _records(bot)[m.name] = FeatureRecord(name=m.name)
+            await _import_and_setup(bot, rec)
         except Exception as e:
             logging.exception("Failed to load feature %s: %s", name, e)
             bot.failed_modules.append(m.name)
+    log.info("Features registered in %.1f ms (lazy=%s)", (time.perf_counter() - t_start) * 1000, LAZY)
+
+def _unregister(bot, triggers: Dict[str, Callable], listeners: List[Tuple[str, Callable]]):
+    for k, fn in triggers.items():
+        if bot.trigger_handlers.get(k) is fn:
+            del bot.trigger_handlers[k]
+    for ev, fn in listeners:
+        bot.remove_listener(fn, ev)
+
+def _reregister(bot, triggers: Dict[str, Callable], listeners: List[Tuple[str, Callable]]):
+    bot.trigger_handlers.update(triggers)
+    for ev, fn in listeners:
+        bot.add_listener(fn, ev)
+
+async def _teardown(bot, mod: Any):
+    if mod is not None and hasattr(mod, "teardown"):
+        try:
+            await _maybe_await(mod.teardown(bot))
+        except Exception as e:
+            log.exception("Teardown of %s failed: %s", mod.__name__, e)
+
+async def reload_feature(bot, name: str) -> Tuple[bool, str]:
+    """
+    Re-import a feature module and re-run its setup without touching the gateway.
+    The new module is imported and set up before the old one is torn down; on any
+    failure the old module, handlers and listeners are put back.
+    """
+    rec = _records(bot).get(name)
+    if rec is None:
+        return False, f"No feature named `{name}`."
+    async with rec.lock:
+        if rec.module is None:
+            # lazily registered and never used: a plain first load picks up the new code
+            for ev, fn in rec.stubs:
+                bot.remove_listener(fn, ev)
+            rec.stubs = []
+            try:
+                await _import_and_setup(bot, rec)
+            except Exception as e:
+                log.exception("Reload of %s failed: %s", name, e)
+                return False, f"Load failed: {e}"
+            return True, f"Loaded `{name}` ({rec.import_ms:.0f} ms import)."
+
+        qual = _qualname(name)
+        old_mod = rec.module
+        old_triggers = {k: bot.trigger_handlers[k] for k in rec.triggers if k in bot.trigger_handlers}
+        old_listeners = list(rec.listeners)
+
+        # import into a fresh module object so the old one stays intact for rollback
+        sys.modules.pop(qual, None)
+        importlib.invalidate_caches()
+        t0 = time.perf_counter()
+        try:
+            new_mod = importlib.import_module(qual)
+        except Exception as e:
+            sys.modules[qual] = old_mod
+            log.exception("Reload of %s failed at import: %s", name, e)
+            return False, f"Import failed, kept the old version: {e}"
+        import_ms = (time.perf_counter() - t0) * 1000
+
+        _unregister(bot, old_triggers, old_listeners)
+        base_triggers = dict(bot.trigger_handlers)
+        base_listeners = {ev: list(fns) for ev, fns in bot.extra_events.items()}
+        try:
+            await _import_and_setup(bot, rec, new_mod)
+        except Exception as e:
+            log.exception("Reload of %s failed in setup: %s", name, e)
+            # drop whatever the half-finished setup registered, then restore the old module
+            _unregister(
+                bot,
+                {k: v for k, v in bot.trigger_handlers.items() if base_triggers.get(k) is not v},
+                [(ev, fn) for ev, fns in bot.extra_events.items() for fn in list(fns)
+                 if not any(fn is old for old in base_listeners.get(ev, []))],
+            )
+            await _teardown(bot, new_mod)
+            _reregister(bot, old_triggers, old_listeners)
+            sys.modules[qual] = old_mod
+            setattr(sys.modules["features"], name, old_mod)
+            return False, f"Setup failed, rolled back: {e}"
+
+        rec.import_ms = import_ms
+        await _teardown(bot, old_mod)
+        return True, f"Reloaded `{name}` (import {rec.import_ms:.0f} ms, setup {rec.setup_ms:.0f} ms)."
+
+async def unload_all(bot):
+    for rec in _records(bot).values():
+        await _teardown(bot, rec.module)
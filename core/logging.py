@@ -1,18 +1,92 @@
-import logging, sys, time, json
+import logging, logging.handlers, sys, time, json, queue, atexit, copy
+
+try:
+    import ujson as _fastjson
+except ImportError:  # optional
+    _fastjson = None
+
+QUEUE_SIZE = 10000      # records buffered between the loop and the writer thread
+
+# attributes every LogRecord has; anything else came in through `extra=` and is logged as a field
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+def _dumps(data) -> str:
+    if _fastjson is not None:
+        try:
+            return _fastjson.dumps(data, ensure_ascii=False)
+        except (TypeError, OverflowError, ValueError):
+            pass
+    return json.dumps(data, ensure_ascii=False, default=str)
 
 class JsonFormatter(logging.Formatter):
     def format(self, record):
         data = {"level": record.levelname, "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(record.created)), "msg": record.getMessage(), "logger": record.name}
+        for k, v in record.__dict__.items():
+            if k not in _RESERVED and not k.startswith("_"):
+                data[k] = v if isinstance(v, (str, int, float, bool, type(None))) else str(v)
         if record.exc_info:
             data["exc"] = self.formatException(record.exc_info)
-        return json.dumps(data)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return _dumps(data)
+
+_exc_formatter = logging.Formatter()
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: when the queue is full the record is counted and dropped."""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # JSON encoding happens on the listener thread, but args and exc_info can reference
+        # live objects that change (or hold frames alive) before it gets there: resolve the
+        # message and traceback now, as QueueHandler.prepare does
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener = None
+_queue_handler = None
+
+def dropped() -> int:
+    return _queue_handler.dropped if _queue_handler else 0
+
+def _stop():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        if dropped():
+            sys.stdout.write(_dumps({"level": "WARNING", "msg": f"log queue dropped {dropped()} records", "logger": __name__}) + "\n")
 
 def configure_logging():
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(JsonFormatter())
+    global _listener, _queue_handler
     root = logging.getLogger()
     root.setLevel(logging.INFO)
-    if not root.handlers:
-        root.addHandler(handler)
+    if root.handlers:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    _queue_handler = DroppingQueueHandler(queue.Queue(QUEUE_SIZE))
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, handler, respect_handler_level=True)
+    _listener.start()
+    root.addHandler(_queue_handler)
+    atexit.register(_stop)
+
+    from . import metrics
+    metrics.gauge("log_dropped_records", dropped)
+    metrics.gauge("log_queue_depth", lambda: _queue_handler.queue.qsize())
 
 configure_logging()
@@ -0,0 +1,87 @@
+"""
+Memory profiles for the gateway cache, plus a fetch-on-miss member lookup so features
+keep working when the member cache is trimmed.
+
+AHRI_MEMORY_PROFILE=full|balanced|low (default: full). See README for measured RSS.
+"""
+import os, time, logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import discord
+from dotenv import load_dotenv
+
+@dataclass(frozen=True)
+class MemoryProfile:
+    name: str
+    member_cache: str           # "all" | "joined" | "none"
+    chunk_guilds_at_startup: bool
+    max_messages: Optional[int]
+
+PROFILES = {
+    # everything cached and chunked at startup (discord.py defaults)
+    "full": MemoryProfile("full", "all", True, 1000),
+    # keep members we see join/update while online, no startup chunking
+    "balanced": MemoryProfile("balanced", "joined", False, 500),
+    # no member cache at all; lookups go through get_member() below
+    "low": MemoryProfile("low", "none", False, 200),
+}
+
+def current_profile() -> MemoryProfile:
+    load_dotenv()
+    name = os.getenv("AHRI_MEMORY_PROFILE", "full").lower()
+    prof = PROFILES.get(name)
+    if prof is None:
+        logging.getLogger(__name__).warning("Unknown AHRI_MEMORY_PROFILE %r, using 'full'", name)
+        prof = PROFILES["full"]
+    return prof
+
+def client_options(profile: MemoryProfile) -> dict:
+    """Keyword arguments for discord.Client / commands.Bot."""
+    if profile.member_cache == "all":
+        flags = discord.MemberCacheFlags.all()
+    elif profile.member_cache == "joined":
+        flags = discord.MemberCacheFlags.none()
+        flags.joined = True
+    else:
+        flags = discord.MemberCacheFlags.none()
+    return {
+        "member_cache_flags": flags,
+        "chunk_guilds_at_startup": profile.chunk_guilds_at_startup,
+        "max_messages": profile.max_messages,
+    }
+
+# --- fetch-on-miss lookup ---
+LRU_SIZE = 512
+LRU_TTL = 120.0         # roles/nicks go stale, keep entries short-lived
+_lru: "OrderedDict[Tuple[int, int], Tuple[float, Optional[discord.Member]]]" = OrderedDict()
+
+async def get_member(guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+    """guild.get_member, falling back to a REST fetch kept in a small TTL'd LRU (misses included)."""
+    m = guild.get_member(user_id)
+    if m is not None:
+        return m
+    key = (guild.id, user_id)
+    now = time.monotonic()
+    hit = _lru.get(key)
+    if hit is not None and now - hit[0] < LRU_TTL:
+        _lru.move_to_end(key)
+        return hit[1]
+    try:
+        m = await guild.fetch_member(user_id)
+    except discord.NotFound:
+        m = None
+    except discord.HTTPException:
+        return None     # transient; don't cache
+    remember(guild.id, user_id, m)
+    return m
+
+def remember(guild_id: int, user_id: int, member: Optional[discord.Member]):
+    _lru[(guild_id, user_id)] = (time.monotonic(), member)
+    _lru.move_to_end((guild_id, user_id))
+    while len(_lru) > LRU_SIZE:
+        _lru.popitem(last=False)
+
+def forget(guild_id: int, user_id: int):
+    _lru.pop((guild_id, user_id), None)
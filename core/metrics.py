@@ -0,0 +1,174 @@
+"""
+Lightweight in-process timing: fixed-bucket latency histograms per named span.
+Set AHRI_METRICS=0 to disable; `span()` then returns a shared no-op and `timed()`
+returns the function untouched, so the disabled cost is one attribute lookup.
+"""
+import os, time, bisect, functools
+from typing import Callable, Dict, List, Tuple
+
+ENABLED = os.getenv("AHRI_METRICS", "1").lower() not in ("0", "false", "no", "off")
+
+# upper bounds in seconds; the last bucket catches everything slower
+BUCKETS: Tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"),
+)
+
+class Histogram:
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        """Estimate by linear interpolation inside the bucket holding the q-th sample."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo = BUCKETS[i - 1] if i else 0.0
+                hi = BUCKETS[i] if BUCKETS[i] != float("inf") else lo * 2 or 1.0
+                return lo + (hi - lo) * ((rank - seen) / c)
+            seen += c
+        return BUCKETS[-2]
+
+_spans: Dict[str, Histogram] = {}
+_counters: Dict[str, int] = {}
+_gauges: Dict[str, Callable[[], float]] = {}
+
+def histogram(name: str) -> Histogram:
+    h = _spans.get(name)
+    if h is None:
+        h = _spans[name] = Histogram()
+    return h
+
+def observe(name: str, seconds: float) -> None:
+    if ENABLED:
+        histogram(name).observe(seconds)
+
+def inc(name: str, n: int = 1) -> None:
+    if ENABLED:
+        _counters[name] = _counters.get(name, 0) + n
+
+def gauge(name: str, fn: Callable[[], float]) -> None:
+    """Register a callback sampled at export time (queue depths, cache sizes...)."""
+    _gauges[name] = fn
+
+class _Span:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        histogram(self.name).observe(time.perf_counter() - self.t0)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+_NOOP = _NoSpan()
+
+def span(name: str):
+    return _Span(name) if ENABLED else _NOOP
+
+def timed(name: str):
+    """Decorator for coroutine functions; a no-op when metrics are disabled."""
+    def deco(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram(name).observe(time.perf_counter() - t0)
+        return wrapper
+    return deco
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    return {
+        name: {
+            "count": h.count,
+            "sum": h.total,
+            "p50": h.quantile(0.50),
+            "p95": h.quantile(0.95),
+            "p99": h.quantile(0.99),
+        }
+        for name, h in sorted(_spans.items())
+    }
+
+def counters() -> Dict[str, int]:
+    return dict(_counters)
+
+def gauges() -> Dict[str, float]:
+    out = {}
+    for name, fn in _gauges.items():
+        try:
+            out[name] = float(fn())
+        except Exception:
+            pass
+    return out
+
+def _label(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus(prefix: str = "ahri") -> str:
+    """Text exposition format (version 0.0.4)."""
+    lines: List[str] = []
+    for name, value in sorted(_counters.items()):
+        metric = f"{prefix}_{name}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    for name, value in sorted(gauges().items()):
+        metric = f"{prefix}_{name}"
+        lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+    if _spans:
+        metric = f"{prefix}_span_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for name, h in sorted(_spans.items()):
+            lbl = _label(name)
+            cum = 0
+            for le, c in zip(BUCKETS, h.counts):
+                cum += c
+                le_s = "+Inf" if le == float("inf") else repr(le)
+                lines.append(f'{metric}_bucket{{span="{lbl}",le="{le_s}"}} {cum}')
+            lines.append(f'{metric}_sum{{span="{lbl}"}} {h.total}')
+            lines.append(f'{metric}_count{{span="{lbl}"}} {h.count}')
+    return "\n".join(lines) + "\n"
+
+def reset() -> None:
+    _spans.clear()
+    _counters.clear()
@@ -0,0 +1,256 @@
+"""
+Typed guild documents. Defaults live here once instead of being re-applied on every read,
+and slotted instances are much smaller than the equivalent nested dicts (see README).
+
+The on-disk JSON layout is unchanged apart from `schema_version`; documents written before
+it existed are normalised by Guild.from_dict and saved back once. Keys this code doesn't
+know are kept where they were, and a value of the wrong type falls back to the default.
+"""
+from __future__ import annotations
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+SCHEMA_VERSION = 1
+
+log = logging.getLogger(__name__)
+
+def _ids(values) -> List[int]:
+    out = []
+    for v in values or ():
+        try:
+            out.append(int(v))
+        except (TypeError, ValueError):
+            pass
+    return out
+
+class _Reader:
+    """Reads one stored document leniently, collecting unknown keys and logging bad values."""
+
+    def __init__(self, guild_id: Any):
+        self.guild_id = guild_id
+        self.extra: Dict[str, Any] = {}
+
+    def section(self, parent: Dict[str, Any], key: str, path: str) -> Dict[str, Any]:
+        v = parent.get(key)
+        if v is None:
+            return {}
+        if not isinstance(v, dict):
+            self.bad(path, v)
+            return {}
+        return v
+
+    def get(self, d: Dict[str, Any], key: str, conv: Callable[[Any], Any], default: Any, path: str) -> Any:
+        v = d.get(key, default)
+        if v is None or v is default:
+            return default
+        try:
+            return conv(v)
+        except (TypeError, ValueError):
+            self.bad(f"{path}.{key}", v)
+            return default
+
+    def keep(self, d: Dict[str, Any], known: set, path: Tuple[str, ...]):
+        """Remember keys of `d` not in `known`, nested under `path`, for to_dict to write back."""
+        unknown = {k: v for k, v in d.items() if k not in known}
+        if not unknown:
+            return
+        node = self.extra
+        for p in path:
+            node = node.setdefault(p, {})
+        node.update(unknown)
+
+    def bad(self, where: str, value: Any):
+        log.warning("Guild %s: ignoring invalid %s=%r, using the default", self.guild_id, where, value,
+                    extra={"guild_id": self.guild_id})
+
+def _merge(dst: Dict[str, Any], extra: Dict[str, Any]):
+    for k, v in extra.items():
+        if isinstance(v, dict) and isinstance(dst.get(k), dict):
+            _merge(dst[k], v)
+        elif k not in dst:
+            dst[k] = v
+
+def _str_list(v: Any) -> List[str]:
+    if not isinstance(v, list):
+        raise TypeError(v)
+    return [str(w) for w in v]
+
+@dataclass(slots=True)
+class Automod:
+    enabled: bool = False
+    banned_words: List[str] = field(default_factory=list)
+    spam_threshold: int = 5
+
+@dataclass(slots=True)
+class Panel:
+    message_id: int
+    channel_id: int
+    # emoji -> role id; a str is a legacy role name that couldn't be resolved yet
+    map: Dict[str, Union[int, str]] = field(default_factory=dict)
+
+@dataclass(slots=True)
+class ReactionRoles:
+    panels: List[Panel] = field(default_factory=list)
+    reconcile: Optional[Dict[str, Any]] = None      # {"started", "done": [role ids]} of an interrupted startup resync
+    # startup resync may take panel roles from members not reacting; off because it can't
+    # tell panel grants from roles given by hand, by `ahri assign` or by a timer
+    resync_removals: bool = False
+
+@dataclass(slots=True)
+class Logging:
+    channel_id: Optional[int] = None
+
+@dataclass(slots=True)
+class AntiRaid:
+    enabled: bool = False
+    action: str = "timeout"         # or "kick"
+    joins: int = 10                 # joins within `window` seconds that count as a wave
+    window: int = 10
+    min_account_age_days: int = 7
+
+@dataclass(slots=True)
+class Thresholds:
+    nsfw: float = 0.80
+    suggestive: float = 0.90
+    # illustrations (anime/comics) get more headroom
+    nsfw_illustration: float = 0.90
+    suggestive_illustration: float = 0.95
+
+@dataclass(slots=True)
+class NSFW:
+    enabled: bool = True
+    log_channel_id: Optional[int] = None
+    active_channel_ids: List[int] = field(default_factory=list)
+    whitelist_user_ids: List[int] = field(default_factory=list)
+    blacklist_user_ids: List[int] = field(default_factory=list)
+    everyone_blacklisted: bool = False
+    thresholds: Thresholds = field(default_factory=Thresholds)
+    last_updated: Optional[str] = None
+
+@dataclass(slots=True)
+class Guild:
+    guild_id: int
+    activated: bool = False
+    admins: List[int] = field(default_factory=list)
+    admin_roles: List[int] = field(default_factory=list)
+    automod: Automod = field(default_factory=Automod)
+    reaction_roles: ReactionRoles = field(default_factory=ReactionRoles)
+    logging: Logging = field(default_factory=Logging)
+    antiraid: AntiRaid = field(default_factory=AntiRaid)
+    nsfw: NSFW = field(default_factory=NSFW)
+    last_updated: Optional[str] = None
+    schema_version: int = SCHEMA_VERSION
+    extra: Optional[Dict[str, Any]] = None          # unknown keys at any level, nested as stored
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> Tuple["Guild", bool]:
+        """Build from a stored document. The flag is True if it needs saving back (old schema)."""
+        r = _Reader(d.get("guild_id"))
+        settings = r.section(d, "settings", "settings")
+        am = r.section(settings, "automod", "settings.automod")
+        rr = r.section(settings, "reaction_roles", "settings.reaction_roles")
+        lg = r.section(settings, "logging", "settings.logging")
+        ar = r.section(settings, "antiraid", "settings.antiraid")
+        ns = r.section(d, "nsfw_moderator", "nsfw_moderator")
+        th = r.section(ns, "thresholds", "nsfw_moderator.thresholds")
+        panels = []
+        for p in rr.get("panels") or ():
+            if not isinstance(p, dict) or "message_id" not in p or "channel_id" not in p:
+                continue
+            try:
+                panels.append(Panel(int(p["message_id"]), int(p["channel_id"]), dict(p.get("map") or {})))
+            except (TypeError, ValueError):
+                r.bad("settings.reaction_roles.panels[]", p)
+        g = cls(
+            guild_id=r.get(d, "guild_id", int, 0, "guild"),
+            activated=bool(d.get("activated", False)),
+            admins=_ids(d.get("admins")),
+            admin_roles=_ids(d.get("admin_roles")),
+            automod=Automod(
+                enabled=bool(am.get("enabled", False)),
+                banned_words=r.get(am, "banned_words", _str_list, [], "settings.automod"),
+                spam_threshold=r.get(am, "spam_threshold", int, 5, "settings.automod"),
+            ),
+            reaction_roles=ReactionRoles(
+                panels=panels,
+                reconcile=rr.get("reconcile"),
+                resync_removals=bool(rr.get("resync_removals", False)),
+            ),
+            logging=Logging(channel_id=r.get(lg, "channel_id", int, None, "settings.logging")),
+            antiraid=AntiRaid(
+                enabled=bool(ar.get("enabled", False)),
+                action="kick" if ar.get("action") == "kick" else "timeout",
+                joins=r.get(ar, "joins", int, 10, "settings.antiraid"),
+                window=r.get(ar, "window", int, 10, "settings.antiraid"),
+                min_account_age_days=r.get(ar, "min_account_age_days", int, 7, "settings.antiraid"),
+            ),
+            nsfw=NSFW(
+                enabled=bool(ns.get("enabled", True)),
+                log_channel_id=r.get(ns, "log_channel_id", int, None, "nsfw_moderator"),
+                active_channel_ids=_ids(ns.get("active_channel_ids")),
+                whitelist_user_ids=_ids(ns.get("whitelist_user_ids")),
+                blacklist_user_ids=_ids(ns.get("blacklist_user_ids")),
+                everyone_blacklisted=bool(ns.get("everyone_blacklisted", False)),
+                thresholds=Thresholds(
+                    nsfw=r.get(th, "nsfw", float, 0.80, "nsfw_moderator.thresholds"),
+                    suggestive=r.get(th, "suggestive", float, 0.90, "nsfw_moderator.thresholds"),
+                    nsfw_illustration=r.get(th, "nsfw_illustration", float, 0.90, "nsfw_moderator.thresholds"),
+                    suggestive_illustration=r.get(th, "suggestive_illustration", float, 0.95, "nsfw_moderator.thresholds"),
+                ),
+                last_updated=ns.get("last_updated"),
+            ),
+            last_updated=d.get("last_updated"),
+        )
+        r.keep(d, _KNOWN, ())
+        r.keep(settings, {"automod", "reaction_roles", "logging", "antiraid"}, ("settings",))
+        r.keep(am, {"enabled", "banned_words", "spam_threshold"}, ("settings", "automod"))
+        r.keep(rr, {"panels", "reconcile", "resync_removals"}, ("settings", "reaction_roles"))
+        r.keep(lg, {"channel_id"}, ("settings", "logging"))
+        r.keep(ar, {"enabled", "action", "joins", "window", "min_account_age_days"}, ("settings", "antiraid"))
+        r.keep(ns, {"enabled", "log_channel_id", "active_channel_ids", "whitelist_user_ids", "blacklist_user_ids",
+                    "everyone_blacklisted", "thresholds", "last_updated"}, ("nsfw_moderator",))
+        r.keep(th, {"nsfw", "suggestive", "nsfw_illustration", "suggestive_illustration"}, ("nsfw_moderator", "thresholds"))
+        g.extra = r.extra or None
+        return g, d.get("schema_version") != SCHEMA_VERSION
+
+    def to_dict(self) -> Dict[str, Any]:
+        am, rr, ar, ns, th = self.automod, self.reaction_roles, self.antiraid, self.nsfw, self.nsfw.thresholds
+        reaction_roles: Dict[str, Any] = {"panels": [
+            {"message_id": p.message_id, "channel_id": p.channel_id, "map": dict(p.map)} for p in rr.panels
+        ], "resync_removals": rr.resync_removals}
+        if rr.reconcile is not None:
+            reaction_roles["reconcile"] = rr.reconcile
+        d = {
+            "schema_version": self.schema_version,
+            "guild_id": self.guild_id,
+            "activated": self.activated,
+            "admins": list(self.admins),
+            "admin_roles": list(self.admin_roles),
+            "settings": {
+                "automod": {"enabled": am.enabled, "banned_words": list(am.banned_words), "spam_threshold": am.spam_threshold},
+                "reaction_roles": reaction_roles,
+                "logging": {"channel_id": self.logging.channel_id},
+                "antiraid": {"enabled": ar.enabled, "action": ar.action, "joins": ar.joins, "window": ar.window,
+                             "min_account_age_days": ar.min_account_age_days},
+            },
+            "nsfw_moderator": {
+                "enabled": ns.enabled,
+                "log_channel_id": ns.log_channel_id,
+                "active_channel_ids": list(ns.active_channel_ids),
+                "whitelist_user_ids": list(ns.whitelist_user_ids),
+                "blacklist_user_ids": list(ns.blacklist_user_ids),
+                "everyone_blacklisted": ns.everyone_blacklisted,
+                "thresholds": {
+                    "nsfw": th.nsfw, "suggestive": th.suggestive,
+                    "nsfw_illustration": th.nsfw_illustration, "suggestive_illustration": th.suggestive_illustration,
+                },
+                "last_updated": ns.last_updated,
+            },
+            "last_updated": self.last_updated,
+        }
+        if self.extra:
+            _merge(d, self.extra)
+        return d
+
+_KNOWN = {"schema_version", "guild_id", "activated", "admins", "admin_roles", "settings", "nsfw_moderator", "last_updated"}
@@ -0,0 +1,190 @@
+"""
+Priority scheduler for outbound REST calls. Enforcement (deletes, timeouts, bans) always goes
+first, then replies to admins, then cosmetic traffic (persona quips, NSFW feedback, log-channel
+posts). All classes draw from SHARED_LIMIT slots, the last ENFORCEMENT_RESERVE of which only
+enforcement may use, and each class is also capped at CLASS_LIMIT. Jobs may carry a key (a
+guild, a channel, a guild+route): at most KEY_LIMIT jobs per key are in flight, so one guild's
+bulk job can't take every slot. A call still running after STALL_AFTER is almost always
+sleeping in discord.py's rate limiter; it gives its slot back (its key stays held) so other
+guilds keep moving. While enforcement or admin work is queued or stalled, buckets are
+saturated: no cosmetic job starts, queued ones are shed after COSMETIC_SATURATED_AGE, and
+log-channel posts keep merging into one message per channel while they wait.
+"""
+import asyncio, logging, time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+from . import metrics
+
+ENFORCEMENT, ADMIN, COSMETIC = 0, 1, 2
+CLASS_NAMES = ("enforcement", "admin", "cosmetic")
+
+SHARED_LIMIT = 12           # slot-holding calls across all classes
+ENFORCEMENT_RESERVE = 4     # slots of SHARED_LIMIT that only enforcement may use
+CLASS_LIMIT = (12, 6, 4)    # slots per class, within the shared budget
+KEY_LIMIT = 2               # in flight per job key
+STALL_AFTER = 1.0           # seconds before a running call gives its class slot back
+SCAN_LIMIT = 64             # queued jobs looked at per class per pump when heads are key-blocked
+COSMETIC_QUEUE_MAX = 256    # beyond this the oldest cosmetic send is dropped
+COSMETIC_MAX_AGE = 15.0     # a quip that waited this long is no longer worth sending
+COSMETIC_SATURATED_AGE = 3.0    # ...or this long, while higher classes are backed up
+LOG_BATCH_CHARS = 1900      # merged log posts stay under the 2000 char limit
+
+log = logging.getLogger(__name__)
+
+@dataclass
+class _Job:
+    cls: int
+    fn: Callable[[], Awaitable[Any]]
+    fut: Optional[asyncio.Future]       # None for fire-and-forget
+    key: Optional[Hashable] = None
+    enqueued: float = field(default_factory=time.monotonic)
+    holds_slot: bool = False
+    stalled: bool = False
+    stall: Optional[asyncio.TimerHandle] = None
+
+@dataclass
+class _LogBatch:
+    channel: Any
+    lines: List[str] = field(default_factory=list)
+    size: int = 0
+
+class Scheduler:
+    def __init__(self):
+        self._queues: List[Deque[_Job]] = [deque(), deque(), deque()]
+        self._inflight = [0, 0, 0]
+        self._stalled = [0, 0, 0]       # calls that gave their slot back while rate limited
+        self._keyed: Dict[Hashable, int] = {}
+        self._tasks = set()
+        self._log_batches: Dict[int, _LogBatch] = {}     # channel id -> batch waiting in the queue
+        for i, name in enumerate(CLASS_NAMES):
+            metrics.gauge(f"outbound_queue_{name}", lambda i=i: len(self._queues[i]))
+            metrics.gauge(f"outbound_inflight_{name}", lambda i=i: self._inflight[i])
+            metrics.gauge(f"outbound_stalled_{name}", lambda i=i: self._stalled[i])
+
+    def depth(self, cls: int) -> int:
+        return len(self._queues[cls])
+
+    async def run(self, cls: int, fn: Callable[[], Awaitable[Any]], key: Optional[Hashable] = None) -> Any:
+        """Queue `fn` under `cls` and wait for its result (exceptions propagate)."""
+        fut = asyncio.get_running_loop().create_future()
+        self._enqueue(_Job(cls, fn, fut, key))
+        return await fut
+
+    def fire(self, cls: int, fn: Callable[[], Awaitable[Any]], key: Optional[Hashable] = None):
+        """Queue `fn` without waiting; failures are only logged."""
+        self._enqueue(_Job(cls, fn, None, key))
+
+    def post_log(self, channel, text: str, **kwargs):
+        """Cosmetic log-channel post; lines queued for the same channel go out as one message."""
+        batch = self._log_batches.get(channel.id)
+        if batch is not None and batch.size + len(text) + 1 <= LOG_BATCH_CHARS:
+            batch.lines.append(text)
+            batch.size += len(text) + 1
+            metrics.inc("outbound_coalesced")
+            return
+        batch = self._log_batches[channel.id] = _LogBatch(channel, [text], len(text))
+
+        async def send():
+            # later lines can't join once the batch is on its way
+            if self._log_batches.get(channel.id) is batch:
+                del self._log_batches[channel.id]
+            await channel.send("\n".join(batch.lines), **kwargs)
+        self.fire(COSMETIC, send)
+
+    def _enqueue(self, job: _Job):
+        q = self._queues[job.cls]
+        if job.cls == COSMETIC and len(q) >= COSMETIC_QUEUE_MAX:
+            self._shed(q.popleft())
+        q.append(job)
+        metrics.inc(f"outbound_submitted_{CLASS_NAMES[job.cls]}")
+        self._pump()
+
+    def _shed(self, job: _Job):
+        metrics.inc("outbound_shed_cosmetic")
+        if job.fut is not None and not job.fut.done():
+            job.fut.cancel()
+
+    def saturated(self) -> bool:
+        """Enforcement or admin calls are waiting for a slot or sleeping on a rate limit."""
+        return bool(self._queues[ENFORCEMENT] or self._queues[ADMIN] or self._stalled[ENFORCEMENT] or self._stalled[ADMIN])
+
+    def _pump(self):
+        now = time.monotonic()
+        for cls, q in enumerate(self._queues):
+            if cls == COSMETIC:
+                # checked after the higher classes took what they could
+                busy = self.saturated()
+                max_age = COSMETIC_SATURATED_AGE if busy else COSMETIC_MAX_AGE
+                while q and now - q[0].enqueued > max_age:
+                    self._shed(q.popleft())
+                if busy:
+                    continue
+            budget = SHARED_LIMIT if cls == ENFORCEMENT else SHARED_LIMIT - ENFORCEMENT_RESERVE
+            blocked = []
+            scanned = 0
+            while (q and self._inflight[cls] < CLASS_LIMIT[cls] and sum(self._inflight) < budget
+                   and scanned < SCAN_LIMIT):
+                job = q.popleft()
+                scanned += 1
+                if job.key is not None and self._keyed.get(job.key, 0) >= KEY_LIMIT:
+                    blocked.append(job)     # keeps its place; others behind it may go
+                    continue
+                self._start(job, now)
+            q.extendleft(reversed(blocked))
+
+    def _start(self, job: _Job, now: float):
+        self._inflight[job.cls] += 1
+        job.holds_slot = True
+        if job.key is not None:
+            self._keyed[job.key] = self._keyed.get(job.key, 0) + 1
+        job.stall = asyncio.get_running_loop().call_later(STALL_AFTER, self._release, job, True)
+        metrics.observe(f"outbound.wait.{CLASS_NAMES[job.cls]}", now - job.enqueued)
+        task = asyncio.ensure_future(self._execute(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _release(self, job: _Job, stalled: bool = False):
+        if job.holds_slot:
+            job.holds_slot = False
+            self._inflight[job.cls] -= 1
+            if stalled:
+                job.stalled = True
+                self._stalled[job.cls] += 1
+                metrics.inc("outbound_stalled")
+                self._pump()
+
+    async def _execute(self, job: _Job):
+        try:
+            res = await job.fn()
+        except Exception as e:
+            if job.fut is None:
+                log.debug("Outbound %s call failed: %s", CLASS_NAMES[job.cls], e)
+            elif not job.fut.done():
+                job.fut.set_exception(e)
+        else:
+            if job.fut is not None and not job.fut.done():
+                job.fut.set_result(res)
+        finally:
+            job.stall.cancel()
+            self._release(job)
+            if job.stalled:
+                self._stalled[job.cls] -= 1
+            if job.key is not None:
+                n = self._keyed[job.key] - 1
+                if n:
+                    self._keyed[job.key] = n
+                else:
+                    del self._keyed[job.key]
+            self._pump()
+
+scheduler = Scheduler()
+
+# module-level shortcuts used by features
+run = scheduler.run
+fire = scheduler.fire
+post_log = scheduler.post_log
+
+async def enforce(fn: Callable[[], Awaitable[Any]], key: Optional[Hashable] = None) -> Any:
+    return await scheduler.run(ENFORCEMENT, fn, key)
@@ -1,6 +1,33 @@
-from typing import Any
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Set
 from . import db
 
+@dataclass(slots=True)
+class AdminIndex:
+    users: Set[int] = field(default_factory=set)
+    roles: Set[int] = field(default_factory=set)
+
+# guild_id -> admin grants; built from the guild document once, then kept in sync by the
+# mutators below so permission checks never touch storage
+_index: Dict[int, AdminIndex] = {}
+
+async def _get_index(guild_id: int) -> AdminIndex:
+    idx = _index.get(guild_id)
+    if idx is None:
+        idx = _build(guild_id, await db.load_guild(guild_id))
+    return idx
+
+def _build(guild_id: int, data) -> AdminIndex:
+    idx = _index[guild_id] = AdminIndex(users=set(data.admins), roles=set(data.admin_roles))
+    return idx
+
+def invalidate(guild_id: Optional[int] = None):
+    """Drop cached grants (after the document was replaced behind our back, e.g. a restore)."""
+    if guild_id is None:
+        _index.clear()
+    else:
+        _index.pop(guild_id, None)
+
 async def is_guild_admin(user: Any, guild_id: int) -> bool:
     # owner is always admin
     try:
@@ -8,13 +35,58 @@ async def is_guild_admin(user: Any, guild_id: int) -> bool:
             return True
     except Exception:
         pass
-    data = await db.load_guild(guild_id)
-    return int(user.id) in set(int(x) for x in data.get("admins", []))
+    idx = _index.get(guild_id) or await _get_index(guild_id)
+    if int(user.id) in idx.users:
+        return True
+    if idx.roles:
+        return any(r.id in idx.roles for r in getattr(user, "roles", ()))
+    return False
+
+async def _update(guild_id: int, key: str, value: int, add: bool) -> bool:
+    """Add/remove one grant in both the document and the index. Returns False if nothing changed."""
+    idx = await _get_index(guild_id)
+    attr = "users" if key == "admins" else "roles"
+    if (value in getattr(idx, attr)) == add:
+        return False
+    def apply(data):
+        grants = set(getattr(data, key))
+        if add:
+            grants.add(value)
+        else:
+            grants.discard(value)
+        setattr(data, key, sorted(grants))
+    data = await db.update_guild(guild_id, apply)
+    # only once the document is on disk
+    setattr(idx, attr, set(getattr(data, key)))
+    return True
+
+async def add_admin_user(guild_id: int, user_id: int) -> bool:
+    return await _update(guild_id, "admins", int(user_id), True)
+
+async def remove_admin_user(guild_id: int, user_id: int) -> bool:
+    return await _update(guild_id, "admins", int(user_id), False)
+
+async def add_admin_role(guild_id: int, role_id: int) -> bool:
+    return await _update(guild_id, "admin_roles", int(role_id), True)
+
+async def remove_admin_role(guild_id: int, role_id: int) -> bool:
+    # called for every deleted role in every guild: most have no grants, or no document at all
+    idx = _index.get(guild_id)
+    if idx is None:
+        data = await db.find_guild(guild_id)
+        if data is None:
+            return False
+        idx = _build(guild_id, data)
+    if int(role_id) not in idx.roles:
+        return False
+    return await _update(guild_id, "admin_roles", int(role_id), False)
+
+async def admin_grants(guild_id: int) -> AdminIndex:
+    return await _get_index(guild_id)
 
 async def ensure_owner_admin(guild):
     if not guild:
         return
     data = await db.load_guild(guild.id)
-    if not data.get("admins"):
-        data["admins"] = [guild.owner_id]
-        await db.save_guild(guild.id, data)
+    if not data.admins:
+        await add_admin_user(guild.id, guild.owner_id)
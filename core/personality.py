@@ -8,6 +8,9 @@ LINES = {
     "deactivated": ["Going quiet. Call me when you need me~", "Shh… I’ll curl up for a nap now."],
     "help_intro": "Nine tails, many tricks. Here’s what I can do:",
     "done": ["Done~", "As you wish, darling."],
+    "cooldown": ["Patience, darling~ Try again in {secs}s.", "So eager~ Give me {secs}s to catch my breath."],
+    "busy": ["I'm juggling too many spells here right now. Try again in a moment~", "Too many tails in the air—one moment, please."],
+    "timeout": ["That took too long, so I let it go. Try again?", "My charm fizzled out waiting. Try again later~"],
 }
 
 def ahri_say(key: str, **kwargs) -> str:
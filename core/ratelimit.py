@@ -0,0 +1,111 @@
+import asyncio, time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+GUILD_MAX_CONCURRENT = 3        # trigger handlers running at once per guild
+BUSY_NOTICE_EVERY = 10.0        # seconds between "busy" replies in one guild
+DEFAULT_TIMEOUT = 30.0          # seconds before a handler is cancelled
+_PRUNE_EVERY = 1024             # bucket inserts between idle-bucket sweeps
+
+@dataclass
+class Limits:
+    per_user: Optional[Tuple[int, float]] = None    # (uses, seconds)
+    per_guild: Optional[Tuple[int, float]] = None
+    timeout: float = DEFAULT_TIMEOUT
+
+DEFAULT_LIMITS = Limits()
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "per", "tokens", "stamp", "noticed")
+
+    def __init__(self, uses: int, per: float):
+        self.capacity = float(uses)
+        self.rate = uses / per
+        self.per = per
+        self.tokens = float(uses)
+        self.stamp = time.monotonic()
+        self.noticed = float("-inf")    # when a rejection was last reported to the user
+
+    def wait(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is), without consuming it."""
+        if now > self.stamp:
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+    def take(self, now: float) -> float:
+        """Consume one token. Returns 0 on success, else seconds until one is available."""
+        wait = self.wait(now)
+        if not wait:
+            self.tokens -= 1.0
+        return wait
+
+    def notice(self, now: float) -> bool:
+        """True at most once per window: whether this rejection should be reported."""
+        if now - self.noticed < self.per:
+            return False
+        self.noticed = now
+        return True
+
+    def idle(self, now: float) -> bool:
+        return self.tokens + (now - self.stamp) * self.rate >= self.capacity
+
+_buckets: Dict[tuple, TokenBucket] = {}
+_inserts = 0
+_guild_sems: Dict[int, asyncio.Semaphore] = {}
+_busy_noticed: Dict[int, float] = {}
+
+def _bucket(key: tuple, spec: Tuple[int, float]) -> TokenBucket:
+    global _inserts
+    b = _buckets.get(key)
+    if b is None:
+        b = _buckets[key] = TokenBucket(*spec)
+        _inserts += 1
+        if _inserts % _PRUNE_EVERY == 0:
+            # full buckets carry no state, drop them so the map stays small
+            now = time.monotonic()
+            for k in [k for k, v in _buckets.items() if v.idle(now)]:
+                del _buckets[k]
+            _buckets[key] = b
+    return b
+
+def limits_for(handler) -> Limits:
+    return getattr(handler, "_limits", DEFAULT_LIMITS)
+
+def check_cooldown(cmd: str, handler, guild_id: int, user_id: int) -> Tuple[float, bool]:
+    """
+    (0, False) if the call may proceed, which takes a token from every bucket that applies.
+    Otherwise (retry-after in seconds, whether to tell the user) and nothing is taken; the
+    user is told at most once per window of the bucket that refused.
+    """
+    lim = limits_for(handler)
+    now = time.monotonic()
+    buckets = []
+    if lim.per_guild:
+        buckets.append(_bucket((cmd, "g", guild_id), lim.per_guild))
+    if lim.per_user:
+        buckets.append(_bucket((cmd, "u", guild_id, user_id), lim.per_user))
+    waits = [b.wait(now) for b in buckets]
+    if any(waits):
+        wait, refused = max(zip(waits, buckets), key=lambda wb: wb[0])
+        return wait, refused.notice(now)
+    for b in buckets:
+        b.take(now)
+    return 0.0, False
+
+def guild_slot(guild_id: int) -> Optional[asyncio.Semaphore]:
+    """The guild's concurrency semaphore, or None if it is already saturated."""
+    sem = _guild_sems.get(guild_id)
+    if sem is None:
+        sem = _guild_sems[guild_id] = asyncio.Semaphore(GUILD_MAX_CONCURRENT)
+    if sem.locked():
+        return None
+    return sem
+
+def busy_notice(guild_id: int) -> bool:
+    """Whether a refused call in a saturated guild should be answered (once per BUSY_NOTICE_EVERY)."""
+    now = time.monotonic()
+    if now - _busy_noticed.get(guild_id, float("-inf")) < BUSY_NOTICE_EVERY:
+        return False
+    _busy_noticed[guild_id] = now
+    return True
@@ -0,0 +1,120 @@
+"""
+Per-member debounce for role changes. Deltas collected within a short window collapse to
+the final intended state, so rapid reaction toggling costs only the net change instead of
+one call per click (and can't race into the wrong state). Each net change goes out as its
+own add/remove call: those don't depend on our possibly stale copy of the member, so roles
+other people or bots added meanwhile are never overwritten. Flushes for one member never
+overlap: deltas arriving during one wait for it and are diffed against what it applied.
+"""
+import asyncio, logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Set, Tuple
+
+from . import members, metrics
+
+DEBOUNCE_WINDOW = 0.75      # seconds from the first delta until the batch is applied
+
+log = logging.getLogger(__name__)
+
+@dataclass
+class _Pending:
+    member: Any
+    reason: Optional[str]
+    deltas: Dict[int, bool] = field(default_factory=dict)     # role_id -> wanted
+
+class RoleEditBatcher:
+    def __init__(self, window: float = DEBOUNCE_WINDOW):
+        self.window = window
+        self._pending: Dict[Tuple[int, int], _Pending] = {}
+        self._flushing: Set[Tuple[int, int]] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.requested = 0      # role changes asked for
+        self.calls = 0          # REST calls actually made
+        self.failed = 0         # changes that errored; not counted as saved
+
+    @property
+    def saved(self) -> int:
+        return max(0, self.requested - self.calls - self.failed - sum(len(p.deltas) for p in self._pending.values()))
+
+    def add(self, member, role, reason: Optional[str] = None):
+        self._queue(member, role.id, True, reason)
+
+    def remove(self, member, role, reason: Optional[str] = None):
+        self._queue(member, role.id, False, reason)
+
+    def _queue(self, member, role_id: int, wanted: bool, reason: Optional[str]):
+        key = (member.guild.id, member.id)
+        p = self._pending.get(key)
+        if p is None:
+            p = self._pending[key] = _Pending(member=member, reason=reason)
+            if key not in self._flushing:       # otherwise the running flush picks it up
+                asyncio.get_running_loop().call_later(self.window, self._schedule_flush, key)
+        else:
+            p.member = member   # keep the freshest snapshot
+        p.deltas[role_id] = wanted
+        self.requested += 1
+        metrics.inc("role_edits_requested")
+
+    def _schedule_flush(self, key: Tuple[int, int], applied: Optional[Dict[int, bool]] = None):
+        task = asyncio.ensure_future(self._flush(key, applied))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush_all(self):
+        for key in list(self._pending):
+            await self._flush(key)
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def _flush(self, key: Tuple[int, int], applied: Optional[Dict[int, bool]] = None):
+        """`applied`: what the previous flush for this member just did, which the gateway copy
+        of the member may not show yet."""
+        if key in self._flushing:
+            return
+        p = self._pending.pop(key, None)
+        if p is None:
+            return
+        self._flushing.add(key)
+        guild = p.member.guild
+        live = guild.get_member(p.member.id)
+        member = live or p.member
+        changes = p.deltas.items()
+        if live is not None:
+            # gateway-cached members are current, so no-op deltas can be skipped
+            current = {r.id for r in live.roles if not _is_default(r)}
+            for rid, held in (applied or {}).items():
+                (current.add if held else current.discard)(rid)
+            changes = [(rid, want) for rid, want in changes if want != (rid in current)]
+        done: Dict[int, bool] = {}
+        try:
+            for rid, want in changes:
+                role = guild.get_role(rid)
+                if role is None:
+                    continue
+                try:
+                    if want:
+                        await member.add_roles(role, reason=p.reason)
+                    else:
+                        await member.remove_roles(role, reason=p.reason)
+                except Exception as e:
+                    self.failed += 1
+                    log.warning("Role update for member %s failed: %s", member.id, e, extra={"guild_id": guild.id})
+                    continue
+                done[rid] = want
+                self.calls += 1
+                metrics.inc("role_edit_calls")
+        finally:
+            self._flushing.discard(key)
+            # the fetch-on-miss copy (if any) no longer reflects the member's roles
+            members.forget(guild.id, member.id)
+            if key in self._pending:
+                # toggles that arrived meanwhile have already waited out their window
+                self._schedule_flush(key, {**(applied or {}), **done})
+
+def _is_default(role) -> bool:
+    fn = getattr(role, "is_default", None)
+    return bool(fn()) if fn else False
+
+# shared instance used by features
+batcher = RoleEditBatcher()
+metrics.gauge("role_edits_pending", lambda: len(batcher._pending))
@@ -0,0 +1,207 @@
+"""
+Incremental, point-in-time snapshots of every live guild document.
+
+    data/snapshots/objects/<aa>/<sha256>.json.gz     one compressed document, named by content
+    data/snapshots/manifests/<UTC stamp>.json         guild_id -> [sha256, mtime_ns, size]
+
+The view is taken in one loop step. Documents saved since the last snapshot are serialised
+from memory. Everything else is the file on disk; a writer that reaches one of those before
+the snapshot reads it hands over the previous bytes first (db._preserve, under the guild
+lock). Files whose mtime/size match the previous manifest are not read again, and an object
+that already exists is not rewritten, so a snapshot costs roughly the number of changed guilds.
+"""
+import asyncio, gzip, hashlib, json, logging, os, pathlib, time
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import db, metrics, permissions
+from .models import Guild
+
+KEEP = int(os.getenv("AHRI_SNAPSHOT_KEEP", "14"))       # manifests kept by prune()
+
+log = logging.getLogger(__name__)
+_lock = asyncio.Lock()      # one snapshot/restore/prune at a time
+
+def _root() -> pathlib.Path:
+    return db.DATA_DIR / "snapshots"
+
+def _object_path(digest: str) -> pathlib.Path:
+    return _root() / "objects" / digest[:2] / f"{digest}.json.gz"
+
+def _manifest_dir() -> pathlib.Path:
+    return _root() / "manifests"
+
+def _canonical(doc: Dict[str, Any]) -> bytes:
+    return json.dumps(doc, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def _store(blob: bytes) -> Tuple[str, bool]:
+    """Write a content-addressed object unless it exists. Returns (digest, written)."""
+    digest = hashlib.sha256(blob).hexdigest()
+    p = _object_path(digest)
+    if p.exists():
+        return digest, False
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        f.write(gzip.compress(blob, compresslevel=6))
+    os.replace(tmp, p)
+    return digest, True
+
+def list_manifests() -> List[str]:
+    d = _manifest_dir()
+    return sorted(p.stem for p in d.glob("*.json")) if d.is_dir() else []
+
+def _read_manifest(name: str) -> Dict[str, Any]:
+    with open(_manifest_dir() / f"{name}.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _scan() -> Dict[int, Tuple[int, int]]:
+    out = {}
+    for gid, p in db.iter_guild_files():
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            continue
+        out[gid] = (st.st_mtime_ns, st.st_size)
+    return out
+
+async def take() -> Dict[str, Any]:
+    """Write a new manifest. Returns a summary (name, guilds, read, written, ms)."""
+    async with _lock:
+        t0 = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        names = list_manifests()
+        prev = (await loop.run_in_executor(None, _read_manifest, names[-1]))["guilds"] if names else {}
+        stats = await loop.run_in_executor(None, _scan)
+
+        # --- the point in time: no awaits until the view is fixed ---
+        dirty, db._dirty = db._dirty, set()
+        docs: Dict[int, Dict[str, Any]] = {}
+        for gid in dirty:
+            if gid in db._inflight:
+                docs[gid] = db._inflight[gid]
+            elif gid in db._last_saved:
+                # not the cached object: that may carry changes nobody has saved yet
+                docs[gid] = db._last_saved.pop(gid)
+        reuse: Dict[int, list] = {}
+        to_read: List[int] = []
+        for gid, st in stats.items():
+            if gid in docs:
+                continue
+            old = prev.get(str(gid))
+            if gid not in dirty and old and (old[1], old[2]) == st:
+                reuse[gid] = old
+            else:
+                to_read.append(gid)
+        for gid in to_read:
+            db._frozen[gid] = None
+        # ------------------------------------------------------------
+
+        entries: Dict[str, list] = {str(gid): v for gid, v in reuse.items()}
+        written = 0
+        try:
+            for gid, doc in docs.items():
+                digest, new = await loop.run_in_executor(None, _store, _canonical(doc))
+                entries[str(gid)] = [digest, None, None]
+                written += new
+            for gid in to_read:
+                lock = db._locks.setdefault(gid, asyncio.Lock())
+                async with lock:
+                    digest, new, st = await loop.run_in_executor(None, _capture, gid)
+                    db._frozen.pop(gid, None)
+                if digest:
+                    entries[str(gid)] = [digest, *st]
+                    written += new
+        except BaseException:
+            # nothing recorded: the next snapshot has to look at these again
+            db._dirty |= dirty
+            for gid in to_read:
+                db._frozen.pop(gid, None)
+            raise
+
+        name = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        if names and name <= names[-1]:
+            name = names[-1] + "a"      # same second; keep manifest names sortable and unique
+        manifest = {"created": time.time(), "guilds": entries}
+        await loop.run_in_executor(None, _write_manifest, name, manifest)
+        ms = (time.perf_counter() - t0) * 1000
+        metrics.inc("snapshot_objects_written", written)
+        log.info("Snapshot %s: %d guilds, %d read from disk, %d new objects (%.0f ms)", name, len(entries), len(to_read), written, ms,
+                 extra={"snapshot": name, "guilds": len(entries), "objects_written": written})
+        return {"name": name, "guilds": len(entries), "read": len(to_read), "written": written, "ms": ms}
+
+def _capture(gid: int) -> Tuple[Optional[str], bool, Tuple[Optional[int], Optional[int]]]:
+    """Runs under the guild lock: the preserved pre-write bytes if a writer got there first, else the file."""
+    p = db._path(gid)
+    raw = db._frozen.get(gid)
+    st = (None, None)
+    if raw is None:
+        try:
+            raw = p.read_bytes()
+            s = p.stat()
+            st = (s.st_mtime_ns, s.st_size)
+        except FileNotFoundError:
+            raw = b""
+    if not raw:
+        return None, False, st
+    digest, new = _store(_canonical(json.loads(raw)))
+    return digest, new, st
+
+def _write_manifest(name: str, manifest: Dict[str, Any]):
+    d = _manifest_dir()
+    d.mkdir(parents=True, exist_ok=True)
+    tmp = d / f"{name}.json.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(tmp, d / f"{name}.json")
+
+def _load_object(digest: str) -> Dict[str, Any]:
+    with open(_object_path(digest), "rb") as f:
+        return json.loads(gzip.decompress(f.read()))
+
+async def restore(name: str, guild_id: Optional[int] = None) -> List[int]:
+    """
+    Put guild documents back as they were in snapshot `name` (all guilds, or just one).
+    Goes through db.save_guild so the cache and the file agree. Guilds created after the
+    snapshot are left alone. Returns the restored guild ids.
+    """
+    async with _lock:
+        loop = asyncio.get_running_loop()
+        if name not in list_manifests():
+            raise KeyError(name)
+        entries = (await loop.run_in_executor(None, _read_manifest, name))["guilds"]
+        if guild_id is not None:
+            entries = {k: v for k, v in entries.items() if int(k) == guild_id}
+        restored = []
+        for key, (digest, *_rest) in entries.items():
+            doc = await loop.run_in_executor(None, _load_object, digest)
+            g, _ = Guild.from_dict(doc)
+            gid = int(key)
+            g.guild_id = gid
+            await db.save_guild(gid, g)
+            permissions.invalidate(gid)
+            restored.append(gid)
+        log.info("Restored %d guilds from snapshot %s", len(restored), name, extra={"snapshot": name})
+        return restored
+
+async def prune(keep: int = KEEP) -> Tuple[int, int]:
+    """Drop all but the newest `keep` manifests, then objects no remaining manifest uses."""
+    async with _lock:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, _prune, max(1, keep))
+
+def _prune(keep: int) -> Tuple[int, int]:
+    names = list_manifests()
+    drop, kept = names[:-keep], names[-keep:]
+    for n in drop:
+        (_manifest_dir() / f"{n}.json").unlink(missing_ok=True)
+    live = set()
+    for n in kept:
+        live.update(v[0] for v in _read_manifest(n)["guilds"].values())
+    removed = 0
+    objects = _root() / "objects"
+    if objects.is_dir():
+        for p in objects.glob("*/*.json.gz"):
+            if p.name[:-len(".json.gz")] not in live:
+                p.unlink(missing_ok=True)
+                removed += 1
+    return len(drop), removed
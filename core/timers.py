@@ -0,0 +1,363 @@
+"""
+Persistent deferred moderation actions: temporary bans, mutes longer than Discord's 28-day
+timeout and time-limited roles.
+
+Pending timers sit on a hierarchical timing wheel (LEVELS x 64 one-second slots, ~2000 years
+of range). Insert and cancel are dict operations; one task advances the wheel each second and
+cascades a higher-level slot down when the level below wraps, and a few workers run whatever
+came due. Every change is appended to data/timers.jsonl. On start the journal is replayed and
+compacted, and anything that came due while the bot was down runs as soon as it's ready.
+"""
+import asyncio, datetime, json, logging, os, time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import discord
+
+from . import db, members, metrics, outbound
+
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+LEVELS = 6
+REBUILD_GAP = SLOTS * SLOTS         # clock jumped further than this: re-place instead of ticking through
+WORKERS = 4
+RETRY_DELAYS = (60, 300, 1800)      # seconds before retrying a failed action; dropped after the last
+COMPACT_SLACK = 10000               # journal lines beyond twice the live count before it is rewritten
+
+MAX_TIMEOUT = 28 * 24 * 3600        # Discord's cap on a member timeout
+RENEW_MARGIN = 3600                 # long mutes are re-applied this long before the current timeout ends
+ABSENT_RECHECK = 24 * 3600          # a long-muted member who left is looked for again this often
+
+log = logging.getLogger(__name__)
+
+class Timer:
+    __slots__ = ("id", "at", "kind", "guild_id", "target", "data", "attempts", "slot")
+
+    def __init__(self, id: str, at: int, kind: str, guild_id: int, target: int, data: Optional[Dict[str, Any]] = None, attempts: int = 0):
+        self.id = id
+        self.at = at
+        self.kind = kind
+        self.guild_id = guild_id
+        self.target = target
+        self.data = data or {}
+        self.attempts = attempts
+        self.slot: Optional[Dict[str, "Timer"]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "at": self.at, "kind": self.kind, "guild": self.guild_id, "target": self.target,
+                "data": self.data, "attempts": self.attempts}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Timer":
+        return cls(d["id"], int(d["at"]), d["kind"], int(d["guild"]), int(d["target"]), d.get("data"), d.get("attempts", 0))
+
+def timer_id(kind: str, guild_id: int, target: int, sub: Any = None) -> str:
+    """One pending timer per (kind, guild, target[, sub]); scheduling again replaces it."""
+    return f"{kind}:{guild_id}:{target}" + (f":{sub}" if sub is not None else "")
+
+class Wheel:
+    def __init__(self, now: int):
+        self.now = now
+        self.levels: List[List[Dict[str, Timer]]] = [[{} for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self.timers: Dict[str, Timer] = {}
+        self.due: Deque[Timer] = deque()
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def add(self, t: Timer):
+        self.cancel(t.id)
+        self.timers[t.id] = t
+        self._place(t)
+
+    def cancel(self, tid: str) -> Optional[Timer]:
+        t = self.timers.pop(tid, None)
+        if t is not None and t.slot is not None:
+            del t.slot[tid]
+            t.slot = None
+        # a timer already in `due` is skipped by pop_due once it's gone from self.timers
+        return t
+
+    def _place(self, t: Timer):
+        delta = t.at - self.now
+        if delta <= 0:
+            t.slot = None
+            self.due.append(t)
+            return
+        level = 0
+        while level < LEVELS - 1 and delta >= SLOTS << (SLOT_BITS * level):
+            level += 1
+        at = min(t.at, self.now + (SLOTS << (SLOT_BITS * level)) - 1)    # beyond the top level: re-placed on cascade
+        slot = self.levels[level][(at >> (SLOT_BITS * level)) & (SLOTS - 1)]
+        slot[t.id] = t
+        t.slot = slot
+
+    def _tick(self):
+        self.now += 1
+        top = 0
+        while top + 1 < LEVELS and self.now & ((1 << (SLOT_BITS * (top + 1))) - 1) == 0:
+            top += 1
+        # highest level first, so timers it hands down land before the slot below is emptied
+        for level in range(top, 0, -1):
+            slot = self.levels[level][(self.now >> (SLOT_BITS * level)) & (SLOTS - 1)]
+            moving = list(slot.values())
+            slot.clear()
+            for t in moving:
+                self._place(t)
+        slot = self.levels[0][self.now & (SLOTS - 1)]
+        for t in slot.values():
+            t.slot = None
+            self.due.append(t)
+        slot.clear()
+
+    def advance(self, now: int):
+        if now - self.now > REBUILD_GAP or not self.timers:
+            pending = [t for t in self.timers.values() if t.slot is not None]
+            for t in pending:
+                del t.slot[t.id]
+            self.now = max(self.now, now)
+            for t in pending:
+                self._place(t)
+            return
+        while self.now < now:
+            self._tick()
+
+    def pop_due(self) -> Optional[Timer]:
+        while self.due:
+            t = self.due.popleft()
+            if self.timers.get(t.id) is t:
+                del self.timers[t.id]
+                return t
+        return None
+
+# --- actions: return a new due time to run again later, or None when finished ---
+Handler = Callable[[discord.Guild, Timer], Awaitable[Optional[int]]]
+
+async def _unban(guild: discord.Guild, t: Timer) -> Optional[int]:
+    try:
+        await outbound.run(outbound.ENFORCEMENT, lambda: guild.unban(discord.Object(t.target), reason="Temporary ban expired"), key=(guild.id, "ban"))
+    except discord.NotFound:
+        pass    # already unbanned by hand
+    return None
+
+async def _timeout(guild: discord.Guild, t: Timer) -> Optional[int]:
+    until = int(t.data["until"])
+    now = int(time.time())
+    if until <= now:
+        return None
+    member = await members.get_member(guild, t.target)
+    if member is None:
+        return now + ABSENT_RECHECK if until > now + ABSENT_RECHECK else None
+    end = min(until, now + MAX_TIMEOUT)
+    stamp = datetime.datetime.fromtimestamp(end, datetime.timezone.utc)
+    await outbound.run(outbound.ENFORCEMENT, lambda: member.timeout(stamp, reason="Long mute renewed"), key=(guild.id, "timeout"))
+    return end - RENEW_MARGIN if until > end else None
+
+async def _unrole(guild: discord.Guild, t: Timer) -> Optional[int]:
+    role = guild.get_role(int(t.data["role"]))
+    member = await members.get_member(guild, t.target)
+    if role is not None and member is not None and role in member.roles:
+        # awaited rather than batched: a failure has to reach the retry schedule
+        await outbound.run(outbound.ENFORCEMENT, lambda: member.remove_roles(role, reason="Temporary role expired"),
+                           key=(guild.id, "roles"))
+        members.forget(guild.id, member.id)
+    return None
+
+HANDLERS: Dict[str, Handler] = {"unban": _unban, "timeout": _timeout, "unrole": _unrole}
+
+class TimerService:
+    def __init__(self):
+        self.wheel = Wheel(int(time.time()))
+        self._bot = None
+        self._tasks: List[asyncio.Task] = []
+        self._ready = asyncio.Event()
+        self._buffer: List[str] = []
+        self._written: Optional[asyncio.Future] = None     # resolved once _buffer is on disk
+        self._wake = asyncio.Event()
+        self._lines = 0
+        metrics.gauge("timers_pending", lambda: len(self.wheel))
+        metrics.gauge("timers_due", lambda: len(self.wheel.due))
+
+    @property
+    def path(self):
+        return db.DATA_DIR / "timers.jsonl"
+
+    # --- journal ---
+    def _replay(self) -> List[Dict[str, Any]]:
+        live: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for n, line in enumerate(f, start=1):
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        log.warning("Skipping unreadable line %d of %s", n, self.path)     # torn final append
+                        continue
+                    if rec.get("op") == "del":
+                        live.pop(rec["id"], None)
+                    else:
+                        live[rec["id"]] = rec
+        except FileNotFoundError:
+            pass
+        return list(live.values())
+
+    def _rewrite(self, records: List[Dict[str, Any]]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".jsonl.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps({"op": "add", **rec}, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _append(self, lines: List[str]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def _journal(self, rec: Dict[str, Any]):
+        self._buffer.append(json.dumps(rec, separators=(",", ":")))
+        if self._written is None:
+            self._written = asyncio.get_running_loop().create_future()
+            self._wake.set()
+        await asyncio.shield(self._written)
+
+    async def _writer(self):
+        """The only task touching the journal: batches appends, and compacts when it's mostly dead lines."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            lines, fut = self._buffer, self._written
+            self._buffer, self._written = [], None
+            try:
+                if self._lines + len(lines) > 2 * len(self.wheel) + COMPACT_SLACK:
+                    # the wheel already reflects the buffered lines
+                    live = [t.to_dict() for t in self.wheel.timers.values()]
+                    await loop.run_in_executor(None, self._rewrite, live)
+                    self._lines = len(live)
+                    metrics.inc("timers_compactions")
+                elif lines:
+                    await loop.run_in_executor(None, self._append, lines)
+                    self._lines += len(lines)
+            except Exception as e:
+                log.exception("Timer journal write failed")
+                if fut is not None:
+                    fut.set_exception(e)
+                continue
+            if fut is not None:
+                fut.set_result(None)
+
+    # --- public API ---
+    async def schedule(self, kind: str, guild_id: int, target: int, at: float, sub: Any = None, **data) -> Timer:
+        """Run `kind` for `target` at unix time `at`, replacing any pending timer with the same key."""
+        t = Timer(timer_id(kind, guild_id, target, sub), int(at), kind, guild_id, target, data)
+        self.wheel.add(t)
+        if self.wheel.due:
+            self._ready.set()
+        metrics.inc("timers_scheduled")
+        await self._journal({"op": "add", **t.to_dict()})
+        return t
+
+    async def cancel(self, kind: str, guild_id: int, target: int, sub: Any = None) -> bool:
+        t = self.wheel.cancel(timer_id(kind, guild_id, target, sub))
+        if t is None:
+            return False
+        await self._journal({"op": "del", "id": t.id})
+        return True
+
+    def pending(self, guild_id: Optional[int] = None) -> List[Timer]:
+        return [t for t in self.wheel.timers.values() if guild_id is None or t.guild_id == guild_id]
+
+    async def start(self, bot):
+        self._bot = bot
+        loop = asyncio.get_running_loop()
+        records = await loop.run_in_executor(None, self._replay)
+        self.wheel = Wheel(int(time.time()))
+        for rec in records:
+            self.wheel.add(Timer.from_dict(rec))
+        await loop.run_in_executor(None, self._rewrite, records)
+        self._lines = len(records)
+        log.info("Loaded %d timers (%d overdue)", len(self.wheel), len(self.wheel.due))
+        self._tasks = [asyncio.ensure_future(self._writer()), asyncio.ensure_future(self._drive())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._buffer:
+            await asyncio.get_running_loop().run_in_executor(None, self._append, self._buffer)
+            self._lines += len(self._buffer)
+            self._buffer = []
+        if self._written is not None and not self._written.done():
+            self._written.set_result(None)
+        self._written = None
+
+    async def _drive(self):
+        await self._bot.wait_until_ready()
+        self._tasks += [asyncio.ensure_future(self._worker()) for _ in range(WORKERS)]
+        while True:
+            now = time.time()
+            self.wheel.advance(int(now))
+            if self.wheel.due:
+                self._ready.set()
+            await asyncio.sleep(int(now) + 1 - now)
+
+    async def _worker(self):
+        while True:
+            t = self.wheel.pop_due()
+            if t is None:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            try:
+                await self._fire(t)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Timer %s failed", t.id, extra={"guild_id": t.guild_id})
+
+    async def _fire(self, t: Timer):
+        again: Optional[int] = None
+        handler = HANDLERS.get(t.kind)
+        if handler is None:
+            log.warning("Dropping timer %s: unknown kind %r", t.id, t.kind, extra={"guild_id": t.guild_id})
+            await self._journal({"op": "del", "id": t.id})
+            return
+        try:
+            guild = self._bot.get_guild(t.guild_id)
+            if guild is None:
+                raise LookupError(f"guild {t.guild_id} unavailable")
+            again = await handler(guild, t)
+            t.attempts = 0
+            metrics.inc("timers_fired")
+        except Exception as e:
+            if t.attempts >= len(RETRY_DELAYS):
+                log.warning("Dropping timer %s after %d attempts: %s", t.id, t.attempts + 1, e, extra={"guild_id": t.guild_id})
+                metrics.inc("timers_dropped")
+            else:
+                again = int(time.time()) + RETRY_DELAYS[t.attempts]
+                t.attempts += 1
+        if t.id in self.wheel.timers:
+            return      # rescheduled by a command while this one ran; that one is in the journal
+        if again is not None:
+            t.at = again
+            self.wheel.add(t)
+            await self._journal({"op": "add", **t.to_dict()})
+        else:
+            await self._journal({"op": "del", "id": t.id})
+
+service = TimerService()
+schedule = service.schedule
+cancel = service.cancel
+
+async def apply_timeout(member: discord.Member, until: float, reason: str):
+    """Time a member out until `until` (unix seconds), renewing past Discord's 28-day cap on a timer."""
+    now = time.time()
+    end = min(until, now + MAX_TIMEOUT)
+    await member.timeout(datetime.datetime.fromtimestamp(end, datetime.timezone.utc), reason=reason)
+    if until > end:
+        await schedule("timeout", member.guild.id, member.id, end - RENEW_MARGIN, until=int(until))
+    else:
+        await cancel("timeout", member.guild.id, member.id)
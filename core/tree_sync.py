@@ -0,0 +1,49 @@
+import os, json, time, hashlib, logging, asyncio
+from typing import Any, Dict, Optional
+from .config import DATA_DIR
+
+# AHRI_FORCE_SYNC=1 syncs even when the command tree is unchanged
+STATE_FILE = "_app_commands.json"
+
+log = logging.getLogger(__name__)
+
+def fingerprint(tree, app_id: Optional[int]) -> str:
+    payload = sorted((c.to_dict(tree) for c in tree.get_commands()), key=lambda d: (d.get("type", 1), d["name"]))
+    blob = json.dumps({"app_id": app_id, "commands": payload}, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def _load_state() -> Dict[str, Any]:
+    try:
+        with open(DATA_DIR / STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_state(state: Dict[str, Any]):
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    p = DATA_DIR / STATE_FILE
+    tmp = p.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, p)
+
+async def sync_if_changed(bot, force: bool = False) -> bool:
+    """Sync the global command tree only if its fingerprint differs from the last sync. Returns True if synced."""
+    force = force or os.getenv("AHRI_FORCE_SYNC", "0").lower() in ("1", "true", "yes", "on")
+    loop = asyncio.get_running_loop()
+    fp = fingerprint(bot.tree, bot.application_id)
+    state = await loop.run_in_executor(None, _load_state)
+    if not force and state.get("fingerprint") == fp:
+        log.info("Slash commands unchanged (%s…), skipped sync; saved ~%.2fs", fp[:12], state.get("sync_seconds", 0.0))
+        return False
+    t0 = time.perf_counter()
+    await bot.tree.sync()
+    took = time.perf_counter() - t0
+    state = {
+        "fingerprint": fp,
+        "synced_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "sync_seconds": round(took, 3),
+    }
+    await loop.run_in_executor(None, _save_state, state)
+    log.info("Slash commands synced in %.2fs (%s…, forced=%s)", took, fp[:12], force, extra={"latency": round(took, 3)})
+    return True
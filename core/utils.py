@@ -1,5 +1,6 @@
-import shlex, functools
-from typing import List
+import re, shlex, functools
+from typing import List, Optional, Tuple
+from .ratelimit import Limits, DEFAULT_TIMEOUT
 
 def tokenize(text: str) -> List[str]:
     try:
@@ -7,6 +8,31 @@ def tokenize(text: str) -> List[str]:
     except Exception:
         return text.split()
 
+_DURATION = re.compile(r"(?:\d+[smhdw])+")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+def parse_duration(tok: str) -> Optional[int]:
+    """'90m', '12h', '7d', '1w2d' -> seconds; None if `tok` isn't a duration."""
+    tok = tok.lower()
+    if not _DURATION.fullmatch(tok):
+        return None
+    return sum(int(n) * _UNITS[u] for n, u in re.findall(r"(\d+)([smhdw])", tok))
+
 def admin_only(func):
     func._needs_admin = True
     return func
+
+def owner_only(func):
+    # bot application owner(s), not the guild owner
+    func._needs_owner = True
+    return func
+
+def limited(per_user: Optional[Tuple[int, float]] = None, per_guild: Optional[Tuple[int, float]] = None, timeout: float = DEFAULT_TIMEOUT):
+    """
+    Token-bucket cooldowns for a trigger handler: per_user / per_guild are (uses, seconds).
+    The handler is cancelled after `timeout` seconds. Checked by AhriBot.on_message.
+    """
+    def deco(func):
+        func._limits = Limits(per_user=per_user, per_guild=per_guild, timeout=timeout)
+        return func
+    return deco
@@ -1,9 +1,10 @@
 from __future__ import annotations
-from typing import List, Any
+import datetime, time
+from typing import List, Any, Optional
 import discord
-from core import db, personality, utils
+from core import db, personality, utils, permissions, bulk, members, timers
 
-FEATURE_INFO = {"name": "admin_tools", "triggers": ["setadmin", "removeadmin", "listadmins", "kick", "ban", "mute", "unmute", "create", "assign", "remove", "rename", "log"]}
+FEATURE_INFO = {"name": "admin_tools", "triggers": ["setadmin", "removeadmin", "listadmins", "kick", "ban", "mute", "unmute", "create", "assign", "remove", "rename", "log"], "listeners": ["on_guild_role_delete"]}
 
 def register(bot, key, func):
     bot.trigger_handlers[key] = func
@@ -11,83 +12,133 @@ def register(bot, key, func):
 def _admin(func):
     return utils.admin_only(func)
 
+MAX_MUTE_SECONDS = 365 * 24 * 3600     # past Discord's 28-day cap the timeout is renewed by core.timers
+
+def _duration(args: List[str]) -> Optional[int]:
+    """First `30m` / `12h` / `7d` style token in args, in seconds."""
+    for a in args:
+        d = utils.parse_duration(a)
+        if d:
+            return d
+    return None
+
+async def _apply(message: discord.Message, targets: List[int], route: str, verb: str, act: bulk.Action, fail_text: str):
+    """One target: act inline like before. Several: hand off to a background bulk job."""
+    if len(targets) == 1:
+        try:
+            if await act(targets[0]) is False:
+                raise LookupError(targets[0])
+            await message.channel.send(personality.ahri_say("done"))
+        except Exception:
+            await message.channel.send(fail_text)
+        return
+    if len(targets) > bulk.MAX_TARGETS:
+        await message.channel.send(f"That's {len(targets)} users; I'll take the first {bulk.MAX_TARGETS}.")
+    if not bulk.start(message, route, verb, targets, act):
+        await message.channel.send("A bulk action is already running here. Wait for it to finish~")
+
+def _member_filter(spec: str, role: discord.Role):
+    """Predicate for `ahri assign @Role <filter>`, or None if the spec isn't a filter."""
+    spec = spec.lower()
+    if spec in ("everyone", "all"):
+        pred = lambda m: True
+    elif spec == "humans":
+        pred = lambda m: not m.bot
+    elif spec == "bots":
+        pred = lambda m: m.bot
+    elif spec == "noroles":
+        pred = lambda m: len(m.roles) <= 1
+    elif spec.startswith("joined:") and spec[7:].isdigit():
+        since = discord.utils.utcnow() - datetime.timedelta(days=int(spec[7:]))
+        pred = lambda m: m.joined_at is not None and m.joined_at >= since
+    elif spec.startswith("name:") and len(spec) > 5:
+        needle = spec[5:]
+        pred = lambda m: needle in m.name.lower() or needle in (m.display_name or "").lower()
+    else:
+        return None
+    return lambda m: role not in m.roles and pred(m)
+
 async def setup(bot):
     @_admin
     async def setadmin(bot, message: discord.Message, args: List[str]):
-        if not message.mentions:
-            await message.channel.send("Mention a user to set as admin.")
+        if not message.mentions and not message.role_mentions:
+            await message.channel.send("Mention a user or role to set as admin.")
             return
-        target = message.mentions[0]
-        g = await db.load_guild(message.guild.id)
-        admins = set(int(x) for x in g.get("admins", []))
-        admins.add(target.id)
-        g["admins"] = list(admins)
-        await db.save_guild(message.guild.id, g)
+        gid = message.guild.id
+        for u in message.mentions:
+            await permissions.add_admin_user(gid, u.id)
+        for r in message.role_mentions:
+            await permissions.add_admin_role(gid, r.id)
         await message.channel.send(personality.ahri_say("done"))
 
     @_admin
     async def removeadmin(bot, message: discord.Message, args: List[str]):
-        if not message.mentions:
-            await message.channel.send("Mention a user to remove from admins.")
+        if not message.mentions and not message.role_mentions:
+            await message.channel.send("Mention a user or role to remove from admins.")
             return
-        target = message.mentions[0]
-        g = await db.load_guild(message.guild.id)
-        admins = set(int(x) for x in g.get("admins", []))
-        admins.discard(target.id)
-        g["admins"] = list(admins)
-        await db.save_guild(message.guild.id, g)
+        gid = message.guild.id
+        for u in message.mentions:
+            await permissions.remove_admin_user(gid, u.id)
+        for r in message.role_mentions:
+            await permissions.remove_admin_role(gid, r.id)
         await message.channel.send(personality.ahri_say("done"))
 
+    @utils.limited(per_user=(2, 10), per_guild=(4, 30))
     async def listadmins(bot, message: discord.Message, args: List[str]):
-        g = await db.load_guild(message.guild.id)
-        ids = g.get("admins", [])
-        if not ids:
+        grants = await permissions.admin_grants(message.guild.id)
+        if not grants.users and not grants.roles:
             await message.channel.send("No special charmers yet~")
             return
-        names = []
-        for i in ids:
-            m = message.guild.get_member(int(i))
-            names.append(m.mention if m else f"`{i}`")
-        await message.channel.send("Admins: " + ", ".join(names))
+        # <@id> renders the same as member.mention, so no member cache/fetch is needed
+        names = [f"<@{i}>" for i in sorted(grants.users)] + [f"<@&{i}>" for i in sorted(grants.roles)]
+        await message.channel.send("Admins: " + ", ".join(names), allowed_mentions=discord.AllowedMentions.none())
 
     @_admin
+    @utils.limited(per_user=(10, 30))
     async def kick(bot, message: discord.Message, args: List[str]):
-        if not message.mentions:
-            await message.channel.send("Mention a user to kick.")
+        targets = await bulk.parse_targets(message, args)
+        if not targets:
+            await message.channel.send("Mention users, give IDs or attach a .txt of IDs to kick.")
             return
-        try:
-            await message.guild.kick(message.mentions[0], reason="Kicked by AhriBot")
-            await message.channel.send(personality.ahri_say("done"))
-        except Exception:
-            await message.channel.send("I couldn't kick them (missing perms?).")
+        async def act(uid: int):
+            await message.guild.kick(discord.Object(uid), reason="Kicked by AhriBot")
+        await _apply(message, targets, "kick", "Kicking", act, "I couldn't kick them (missing perms?).")
 
     @_admin
+    @utils.limited(per_user=(10, 30))
     async def ban(bot, message: discord.Message, args: List[str]):
-        if not message.mentions:
-            await message.channel.send("Mention a user to ban.")
+        targets = await bulk.parse_targets(message, args)
+        if not targets:
+            await message.channel.send("Mention users, give IDs or attach a .txt of IDs to ban.")
             return
-        try:
-            await message.guild.ban(message.mentions[0], reason="Banned by AhriBot", delete_message_days=0)
-            await message.channel.send(personality.ahri_say("done"))
-        except Exception:
-            await message.channel.send("I couldn't ban them (missing perms?).")
+        duration = _duration(args)
+        async def act(uid: int):
+            # works for IDs that already left the server too
+            await message.guild.ban(discord.Object(uid), reason="Banned by AhriBot", delete_message_days=0)
+            if duration:
+                await timers.schedule("unban", message.guild.id, uid, time.time() + duration)
+            else:
+                await timers.cancel("unban", message.guild.id, uid)
+        await _apply(message, targets, "ban", "Banning", act, "I couldn't ban them (missing perms?).")
 
     @_admin
+    @utils.limited(per_user=(10, 30))
     async def mute(bot, message: discord.Message, args: List[str]):
-        if not message.mentions:
-            await message.channel.send("Mention a user to mute.")
+        targets = await bulk.parse_targets(message, args)
+        if not targets:
+            await message.channel.send("Mention users, give IDs or attach a .txt of IDs to mute.")
             return
-        minutes = 5
-        for a in args:
-            if a.isdigit():
-                minutes = int(a)
-                break
-        try:
-            until = discord.utils.utcnow() + __import__("datetime").timedelta(minutes=minutes)
-            await message.mentions[0].timeout(until, reason="Muted by AhriBot")
-            await message.channel.send(personality.ahri_say("done"))
-        except Exception:
-            await message.channel.send("Couldn't timeout that user (missing perms?).")
+        seconds = _duration(args)
+        if seconds is None:
+            # a bare number is minutes
+            seconds = next((int(a) * 60 for a in args if a.isdigit() and not bulk.is_snowflake(a)), 5 * 60)
+        until = time.time() + min(seconds, MAX_MUTE_SECONDS)
+        async def act(uid: int):
+            member = await members.get_member(message.guild, uid)
+            if member is None:
+                return False
+            await timers.apply_timeout(member, until, "Muted by AhriBot")
+        await _apply(message, targets, "timeout", "Muting", act, "Couldn't timeout that user (missing perms?).")
 
     @_admin
     async def unmute(bot, message: discord.Message, args: List[str]):
@@ -96,11 +147,13 @@ async def setup(bot):
             return
         try:
             await message.mentions[0].timeout(None, reason="Unmuted by AhriBot")
+            await timers.cancel("timeout", message.guild.id, message.mentions[0].id)
             await message.channel.send(personality.ahri_say("done"))
         except Exception:
             await message.channel.send("Couldn't unmute that user.")
 
     @_admin
+    @utils.limited(per_guild=(5, 60))
     async def create(bot, message: discord.Message, args: List[str]):
         if len(args) >= 2 and args[0].lower() == "role":
             name = " ".join(args[1:]).strip('"')
@@ -115,33 +168,64 @@ async def setup(bot):
 
     @_admin
     async def assign(bot, message: discord.Message, args: List[str]):
-        if not message.mentions or len(args) < 2:
-            await message.channel.send('Use: `ahri assign @user "Role Name"`')
-            return
-        user = message.mentions[0]
-        role_name = " ".join(a for a in args if not a.startswith("<@")).strip('"')
-        role = discord.utils.get(message.guild.roles, name=role_name)
-        if not role:
-            await message.channel.send("Role not found.")
-            return
-        await user.add_roles(role, reason="Assigned by AhriBot")
-        await message.channel.send(personality.ahri_say("done"))
+        usage = 'Use: `ahri assign @user "Role Name"` or `ahri assign @Role <users/IDs/.txt | everyone | humans | bots | noroles | joined:<days> | name:<text>> [30m|12h|7d]`'
+        duration = None
+        if message.role_mentions:
+            role = message.role_mentions[0]
+            duration = _duration(args)
+            targets = await bulk.parse_targets(message, args)
+            if not targets:
+                spec = next((a for a in args if not a.startswith("<@") and not utils.parse_duration(a)), None)
+                pred = _member_filter(spec, role) if spec else None
+                if pred is None:
+                    await message.channel.send(usage)
+                    return
+                if not message.guild.chunked:
+                    await message.channel.send("My member list isn't fully loaded here, so only cached members will match.")
+                targets = [m.id for m in message.guild.members if pred(m)]
+                if not targets:
+                    await message.channel.send("Nobody matches that filter.")
+                    return
+        else:
+            # the user is the first argument; the rest is the role name
+            targets = await bulk.parse_targets(message, args[:1]) if len(args) >= 2 else []
+            if not targets:
+                await message.channel.send(usage)
+                return
+            role_name = " ".join(a for a in args[1:] if not a.startswith("<@")).strip('"')
+            role = discord.utils.get(message.guild.roles, name=role_name)
+            if not role:
+                await message.channel.send("Role not found.")
+                return
+        async def act(uid: int):
+            member = await members.get_member(message.guild, uid)
+            if member is None:
+                return False
+            await member.add_roles(role, reason="Assigned by AhriBot")
+            if duration:
+                await timers.schedule("unrole", message.guild.id, uid, time.time() + duration, sub=role.id, role=role.id)
+            else:
+                await timers.cancel("unrole", message.guild.id, uid, sub=role.id)
+        await _apply(message, targets, "roles", f"Assigning {role.name}", act, "I couldn't assign that role (missing perms?).")
 
     @_admin
     async def remove(bot, message: discord.Message, args: List[str]):
-        if not message.mentions or len(args) < 2:
+        targets = await bulk.parse_targets(message, args[:1]) if len(args) >= 2 else []
+        user = await members.get_member(message.guild, targets[0]) if targets else None
+        if user is None:
             await message.channel.send('Use: `ahri remove @user "Role Name"`')
             return
-        user = message.mentions[0]
-        role_name = " ".join(a for a in args if not a.startswith("<@")).strip('"')
+        role_name = " ".join(a for a in args[1:] if not a.startswith("<@")).strip('"')
         role = discord.utils.get(message.guild.roles, name=role_name)
         if not role:
             await message.channel.send("Role not found.")
             return
         await user.remove_roles(role, reason="Removed by AhriBot")
+        await timers.cancel("unrole", message.guild.id, user.id, sub=role.id)
         await message.channel.send(personality.ahri_say("done"))
 
     @_admin
+    @utils.limited(per_guild=(2, 600))
     async def rename(bot, message: discord.Message, args: List[str]):
         if len(args) >= 3 and args[0].lower() == "channel":
             ch = message.channel_mentions[0] if message.channel_mentions else message.channel
@@ -156,12 +240,16 @@ async def setup(bot):
         if len(args) >= 1 and args[0].lower() == "set" and message.channel_mentions:
             ch = message.channel_mentions[0]
             g = await db.load_guild(message.guild.id)
-            g["settings"]["logging"]["channel_id"] = ch.id
+            g.logging.channel_id = ch.id
             await db.save_guild(message.guild.id, g)
             await message.channel.send(personality.ahri_say("done"))
         else:
             await message.channel.send('Use: `ahri log set #channel`')
 
+    @bot.listen("on_guild_role_delete")
+    async def _drop_admin_role(role: discord.Role):
+        await permissions.remove_admin_role(role.guild.id, role.id)
+
     # register handlers
     for k, fn in {"setadmin": setadmin, "removeadmin": removeadmin, "listadmins": listadmins, "kick": kick, "ban": ban, "mute": mute, "unmute": unmute, "create": create, "assign": assign, "remove": remove, "rename": rename, "log": log}.items():
         register(bot, k, fn)
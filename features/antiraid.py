@@ -0,0 +1,228 @@
+from __future__ import annotations
+import asyncio, datetime, logging, re, time
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+import discord
+from core import bulk, db, metrics, outbound, personality, utils
+
+FEATURE_INFO = {"name": "antiraid", "triggers": ["antiraid"], "listeners": ["on_member_join"]}
+
+JOIN_HISTORY = 200              # recent joins remembered per guild
+SIMILARITY_WINDOW = 120         # seconds a join's name/avatar is compared against later joins
+MAX_TRACKED_GUILDS = 5000       # guilds with join history kept; least recently joined dropped first
+VOLUME_FACTOR = 3               # this many times the threshold is a raid even without other signals
+LOCKDOWN_QUIET = 600            # lockdown ends after this long without a flagged join
+BATCH_EVERY = 2.0               # flagged joins are actioned in batches this often
+RAID_TIMEOUT = datetime.timedelta(hours=24)
+NEW_ISH_DAYS = 30               # a default avatar only counts against accounts younger than this
+
+log = logging.getLogger(__name__)
+
+@dataclass(slots=True)
+class _Join:
+    at: float
+    member: discord.Member
+    age_days: float
+    skeleton: Optional[str]
+    avatar: Optional[str]
+
+@dataclass
+class _State:
+    joins: Deque[_Join] = field(default_factory=deque)
+    names: Counter = field(default_factory=Counter)
+    avatars: Counter = field(default_factory=Counter)
+    lockdown_until: float = 0.0
+    queue: Dict[int, discord.Member] = field(default_factory=dict)     # flagged joins waiting for the next batch
+    handled: set = field(default_factory=set)
+    flagged: Counter = field(default_factory=Counter)         # reason -> count, for the report
+    seen: int = 0
+    task: Optional[asyncio.Task] = None
+
+_states: "OrderedDict[int, _State]" = OrderedDict()
+
+def register(bot, key, func):
+    bot.trigger_handlers[key] = func
+
+def _skeleton(name: str) -> Optional[str]:
+    """'raider_123', 'Raider-9' -> 'raider'; too short to mean anything -> None."""
+    s = re.sub(r"[^a-z]", "", name.lower())[:16]
+    return s if len(s) >= 3 else None
+
+def _state(guild_id: int) -> _State:
+    st = _states.get(guild_id)
+    if st is None:
+        st = _states[guild_id] = _State()
+        if len(_states) > MAX_TRACKED_GUILDS:
+            # never a guild in lockdown: a fresh state would let its next wave start a second one
+            idle = next((gid for gid, old in _states.items() if old.task is None or old.task.done()), None)
+            if idle is not None:
+                del _states[idle]
+    else:
+        _states.move_to_end(guild_id)
+    return st
+
+def _forget(st: _State, j: _Join):
+    for counter, key in ((st.names, j.skeleton), (st.avatars, j.avatar)):
+        if key is not None:
+            counter[key] -= 1
+            if counter[key] <= 0:
+                del counter[key]
+
+def _remember(st: _State, j: _Join):
+    while st.joins and (len(st.joins) >= JOIN_HISTORY or st.joins[0].at < j.at - SIMILARITY_WINDOW):
+        _forget(st, st.joins.popleft())
+    st.joins.append(j)
+    if j.skeleton:
+        st.names[j.skeleton] += 1
+    if j.avatar:
+        st.avatars[j.avatar] += 1
+
+def _reasons(st: _State, j: _Join, min_age: int) -> List[str]:
+    """Why this join looks like part of a raid (empty: it doesn't)."""
+    out = []
+    if j.age_days < min_age:
+        out.append("new account")
+    if (j.skeleton and st.names[j.skeleton] >= 3) or (j.avatar and st.avatars[j.avatar] >= 3):
+        out.append("similar name/avatar")
+    if j.avatar is None and j.age_days < NEW_ISH_DAYS:
+        out.append("default avatar")
+    return out
+
+async def _report(guild: discord.Guild, st: _State, verb: str, res: bulk.BulkResult, started: float):
+    minutes = (time.time() - started) / 60
+    why = ", ".join(f"{n} {r}" for r, n in st.flagged.most_common()) or "none"
+    text = (f"🛡️ Raid lockdown over after {minutes:.0f} min. {st.seen} joins during it; flagged: {why}.\n"
+            + bulk.report(verb, res))
+    log.warning("Raid lockdown ended: %d joins, %d actioned, %d failed", st.seen, res.ok, len(res.failed),
+                extra={"guild_id": guild.id})
+    g = await db.load_guild(guild.id)
+    ch = guild.get_channel(g.logging.channel_id or 0)
+    if ch is None:
+        return
+    try:
+        await outbound.run(outbound.ADMIN, lambda: ch.send(text[:2000]))
+    except discord.HTTPException:
+        pass
+
+async def _lockdown(guild: discord.Guild, st: _State, action: str):
+    route, verb = ("kick", "Kicked") if action == "kick" else ("timeout", "Timed out")
+
+    async def act(member: discord.Member):
+        # the Member kept from on_member_join: no lookup while holding an enforcement slot
+        if route == "kick":
+            await member.kick(reason="Raid lockdown")
+        else:
+            await member.timeout(RAID_TIMEOUT, reason="Raid lockdown")
+
+    res = bulk.BulkResult(total=0)
+    started = time.time()
+    try:
+        while True:
+            await asyncio.sleep(BATCH_EVERY)
+            batch = dict(st.queue)
+            st.queue.clear()
+            if batch:
+                res.total += len(batch)
+                await bulk.run(guild.id, route, list(batch), lambda uid: act(batch[uid]), res)
+            elif time.monotonic() >= st.lockdown_until:
+                break
+    finally:
+        st.lockdown_until = 0.0
+        st.task = None
+        await _report(guild, st, verb, res, started)
+        st.handled.clear()
+        st.flagged.clear()
+        st.seen = 0
+
+def _flag(st: _State, j: _Join, reasons: List[str]):
+    uid = j.member.id
+    if uid in st.handled:
+        return
+    st.handled.add(uid)
+    st.queue[uid] = j.member
+    for r in reasons:
+        st.flagged[r] += 1
+
+async def setup(bot):
+    @bot.listen("on_member_join")
+    async def _on_join(member: discord.Member):
+        if member.bot:
+            return
+        g = await db.load_guild(member.guild.id)
+        cfg = g.antiraid
+        if not g.activated or not cfg.enabled:
+            return
+        now = time.monotonic()
+        st = _state(member.guild.id)
+        j = _Join(at=now, member=member,
+                  age_days=(discord.utils.utcnow() - member.created_at).total_seconds() / 86400,
+                  skeleton=_skeleton(member.name), avatar=member.avatar.key if member.avatar else None)
+        _remember(st, j)
+
+        if st.task is not None:
+            st.seen += 1
+            reasons = _reasons(st, j, cfg.min_account_age_days)
+            if reasons:
+                st.lockdown_until = now + LOCKDOWN_QUIET
+                _flag(st, j, reasons)
+            return
+
+        wave = [w for w in st.joins if w.at >= now - cfg.window]
+        if len(wave) < cfg.joins:
+            return
+        flagged = [(w, r) for w in wave if (r := _reasons(st, w, cfg.min_account_age_days))]
+        if len(flagged) * 2 < len(wave) and len(wave) < VOLUME_FACTOR * cfg.joins:
+            return
+        metrics.inc("antiraid_lockdowns")
+        log.warning("Raid detected: %d joins in %ds, %d flagged; locking down (%s)", len(wave), cfg.window, len(flagged), cfg.action,
+                    extra={"guild_id": member.guild.id})
+        st.seen = len(wave)
+        st.lockdown_until = now + LOCKDOWN_QUIET
+        for w, r in flagged:
+            _flag(st, w, r)
+        st.task = asyncio.ensure_future(_lockdown(member.guild, st, cfg.action))
+
+    USAGE = ("Use: `ahri antiraid on|off|status|end` | `action timeout|kick` | "
+             "`threshold <joins> <seconds>` | `age <days>`")
+
+    @utils.admin_only
+    async def antiraid(bot, message: discord.Message, args: List[str]):
+        sub = args[0].lower() if args else "status"
+        g = await db.load_guild(message.guild.id)
+        cfg = g.antiraid
+        if sub in ("on", "off"):
+            cfg.enabled = sub == "on"
+        elif sub == "action" and len(args) > 1 and args[1].lower() in ("timeout", "kick"):
+            cfg.action = args[1].lower()
+        elif sub == "threshold" and len(args) > 2 and args[1].isdigit() and args[2].isdigit() and int(args[1]) >= 2:
+            cfg.joins, cfg.window = int(args[1]), max(1, min(int(args[2]), SIMILARITY_WINDOW))
+        elif sub == "age" and len(args) > 1 and args[1].isdigit():
+            cfg.min_account_age_days = int(args[1])
+        elif sub == "end":
+            st = _states.get(message.guild.id)
+            if st is None or st.task is None:
+                await message.channel.send("No lockdown running.")
+                return
+            st.queue.clear()
+            st.lockdown_until = 0.0
+            await message.channel.send("Lockdown ending; report coming to the log channel.")
+            return
+        elif sub == "status":
+            st = _states.get(message.guild.id)
+            state = "**LOCKDOWN**" if st is not None and st.task is not None else ("on" if cfg.enabled else "off")
+            await message.channel.send(f"Anti-raid {state}: {cfg.action} when {cfg.joins} join within {cfg.window}s "
+                                       f"(accounts under {cfg.min_account_age_days} days count as suspicious).")
+            return
+        else:
+            await message.channel.send(USAGE)
+            return
+        await db.save_guild(message.guild.id, g)
+        await message.channel.send(personality.ahri_say("done"))
+
+    register(bot, "antiraid", antiraid)
+
+async def teardown(bot):
+    for st in _states.values():
+        if st.task is not None:
+            st.task.cancel()
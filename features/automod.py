@@ -1,37 +1,97 @@
 from __future__ import annotations
-from typing import List
+from typing import List, Optional, Tuple
+import difflib
 import discord
-from core import db, personality, utils
+from core import db, personality, utils, metrics, outbound
 
-FEATURE_INFO = {"name": "automod", "triggers": ["automod"]}
+FEATURE_INFO = {"name": "automod", "triggers": ["automod"], "listeners": ["on_message", "on_raw_message_edit"]}
 
 def register(bot, key, func):
     bot.trigger_handlers[key] = func
 
+def find_banned(words: List[str], text: str) -> Optional[str]:
+    text = text.lower()
+    for w in words:
+        if w and w.lower() in text:
+            return w
+    return None
+
+def changed_windows(before: str, after: str, pad: int) -> List[Tuple[int, int]]:
+    """
+    Spans of `after` that differ from `before`, widened by `pad` chars on each side so a
+    banned word straddling an edit boundary is still caught. Overlapping spans are merged.
+    """
+    sm = difflib.SequenceMatcher(None, before, after, autojunk=False)
+    spans: List[Tuple[int, int]] = []
+    for tag, _, _, j1, j2 in sm.get_opcodes():
+        if tag == "equal":
+            continue
+        lo, hi = max(0, j1 - pad), min(len(after), j2 + pad)
+        if spans and lo <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], hi))
+        else:
+            spans.append((lo, hi))
+    return spans
+
+async def _punish(message: discord.Message):
+    try:
+        await outbound.enforce(message.delete, key=message.channel.id)
+    except Exception:
+        pass
+    outbound.fire(outbound.COSMETIC, lambda: message.channel.send(f"Shh~ That word is banned here, {message.author.mention}."))
+
+async def _load_cfg(guild_id: int):
+    data = await db.load_guild(guild_id)
+    if not data.activated:
+        return None
+    cfg = data.automod
+    if not cfg.enabled:
+        return None
+    return cfg
+
 async def setup(bot):
     @bot.listen("on_message")
     async def _automod(message: discord.Message):
         if message.author.bot or message.guild is None:
             return
-        data = await db.load_guild(message.guild.id)
-        if not data.get("activated", False):
+        with metrics.span("automod.on_message"):
+            cfg = await _load_cfg(message.guild.id)
+            if cfg is None:
+                return
+            if find_banned(cfg.banned_words, message.content or ""):
+                await _punish(message)
+
+    @bot.listen("on_raw_message_edit")
+    async def _automod_edit(payload: discord.RawMessageUpdateEvent):
+        after = payload.message
+        if after.guild is None or after.author.bot:
             return
-        cfg = data["settings"]["automod"]
-        if not cfg.get("enabled", False):
+        before_text = payload.cached_message.content if payload.cached_message else None
+        after_text = after.content or ""
+        if before_text == after_text:
+            # embed resolution / pin / flags update, nothing new to match
             return
-        text = (message.content or "").lower()
-        for w in cfg.get("banned_words", []):
-            if w and w.lower() in text:
-                try:
-                    await message.delete()
-                except Exception:
-                    pass
-                try:
-                    await message.channel.send(f"Shh~ That word is banned here, {message.author.mention}.")
-                except Exception:
-                    pass
-                return
+        cfg = await _load_cfg(after.guild.id)
+        if cfg is None:
+            return
+        words = [w for w in cfg.banned_words if w]
+        if not words:
+            return
+        if before_text is None:
+            # not in the message cache, so we can't diff; check the whole thing
+            hit = find_banned(words, after_text)
+        else:
+            pad = max(len(w) for w in words) - 1
+            lowered = after_text.lower()
+            hit = None
+            for lo, hi in changed_windows(before_text.lower(), lowered, pad):
+                hit = find_banned(words, lowered[lo:hi])
+                if hit:
+                    break
+        if hit:
+            await _punish(after)
 
+    @utils.limited(per_user=(5, 10))
     async def automod_cmd(bot, message: discord.Message, args: List[str]):
         from core import permissions
         if not await permissions.is_guild_admin(message.author, message.guild.id):
@@ -42,22 +102,22 @@ async def setup(bot):
             return
         sub = args[0].lower()
         g = await db.load_guild(message.guild.id)
-        cfg = g["settings"]["automod"]
+        cfg = g.automod
         if sub == "on":
-            cfg["enabled"] = True
+            cfg.enabled = True
         elif sub == "off":
-            cfg["enabled"] = False
+            cfg.enabled = False
         elif sub == "addword" and len(args) >= 2:
             word = args[1]
-            if word not in cfg["banned_words"]:
-                cfg["banned_words"].append(word)
+            if word not in cfg.banned_words:
+                cfg.banned_words.append(word)
         elif sub == "removeword" and len(args) >= 2:
             try:
-                cfg["banned_words"].remove(args[1])
+                cfg.banned_words.remove(args[1])
             except Exception:
                 pass
         elif sub == "list":
-            await message.channel.send("Banned words: " + ", ".join(cfg["banned_words"]) or "none")
+            await message.channel.send("Banned words: " + ", ".join(cfg.banned_words) or "none")
             return
         else:
             await message.channel.send("Usage: `ahri automod on|off|addword <w>|removeword <w>|list`")
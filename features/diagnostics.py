@@ -0,0 +1,90 @@
+from __future__ import annotations
+from typing import List
+import discord
+from core import debug, loader, metrics, utils
+
+FEATURE_INFO = {"name": "diagnostics", "triggers": ["stats", "reload", "debug"]}
+
+def register(bot, key, func):
+    bot.trigger_handlers[key] = func
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f}"
+
+def render_stats(prefix: str = "") -> str:
+    snap = {k: v for k, v in metrics.snapshot().items() if k.startswith(prefix)}
+    if not snap:
+        return "No timings recorded yet~" if metrics.ENABLED else "Timing is disabled (AHRI_METRICS=0)."
+    width = max(4, max(len(k) for k in snap))
+    lines = [f"{'span':<{width}}  {'count':>7}  {'p50ms':>8}  {'p95ms':>8}  {'p99ms':>8}"]
+    for name, s in snap.items():
+        lines.append(f"{name:<{width}}  {s['count']:>7}  {_ms(s['p50']):>8}  {_ms(s['p95']):>8}  {_ms(s['p99']):>8}")
+    # stay under the 2000 char message limit
+    body = "\n".join(lines)
+    if len(body) > 1900:
+        body = body[:1900].rsplit("\n", 1)[0] + "\n…"
+    return "```\n" + body + "\n```"
+
+async def setup(bot):
+    @utils.admin_only
+    @utils.limited(per_user=(3, 30))
+    async def stats(bot, message: discord.Message, args: List[str]):
+        if args and args[0].lower() == "reset":
+            metrics.reset()
+            await message.channel.send("Timings cleared~")
+            return
+        await message.channel.send(render_stats(args[0] if args else ""))
+
+    @utils.owner_only
+    async def reload(bot, message: discord.Message, args: List[str]):
+        if not args:
+            names = ", ".join(sorted(bot.feature_records)) or "(none)"
+            await message.channel.send(f"Use: `ahri reload <feature>` — loaded: {names}")
+            return
+        ok, text = await loader.reload_feature(bot, args[0].lower())
+        await message.channel.send(("✨ " if ok else "⚠️ ") + text)
+
+    DEBUG_USAGE = "Use: `ahri debug mem [start [frames]|reset|stop]` | `ahri debug profile <seconds>`"
+
+    @utils.owner_only
+    @utils.limited(per_user=(3, 30), timeout=debug.MAX_PROFILE_SECONDS + 30)
+    async def debug_cmd(bot, message: discord.Message, args: List[str]):
+        sub = args[0].lower() if args else ""
+        if sub == "mem":
+            action = args[1].lower() if len(args) > 1 else ""
+            if action == "stop":
+                debug.mem_stop()
+                await message.channel.send("Allocation tracing stopped.")
+                return
+            if action in ("start", "reset") or not debug.mem_tracing():
+                frames = int(args[2]) if len(args) > 2 and args[2].isdigit() else 10
+                await debug.mem_start(frames)
+                await message.channel.send("Allocation tracing on, baseline taken. Run `ahri debug mem` later to see what grew (tracing slows allocations; `stop` when done).")
+                return
+            lines, current, peak = await debug.mem_diff()
+            body = "\n".join(lines) or "(no growth)"
+            await message.channel.send(f"Traced {current / 1048576:.1f} MiB (peak {peak / 1048576:.1f} MiB). Growth since baseline:\n```\n{body[:1800]}\n```")
+            return
+        if sub == "profile":
+            if len(args) < 2:
+                await message.channel.send(DEBUG_USAGE)
+                return
+            try:
+                seconds = float(args[1])
+            except ValueError:
+                await message.channel.send(DEBUG_USAGE)
+                return
+            await message.channel.send(f"Sampling the event loop for {min(max(seconds, 1), debug.MAX_PROFILE_SECONDS):.0f}s…")
+            try:
+                path, samples, top = await debug.profile(seconds)
+            except RuntimeError as e:
+                await message.channel.send(f"⚠️ {e}.")
+                return
+            rows = "\n".join(f"{n / max(samples, 1) * 100:5.1f}%  {name}" for name, n in top) or "(no samples)"
+            await message.channel.send(f"{samples} samples → `{path}` (collapsed stacks)\nTop self time:\n```\n{rows[:1800]}\n```")
+            return
+        await message.channel.send(DEBUG_USAGE)
+
+    register(bot, "stats", stats)
+    register(bot, "reload", reload)
+    register(bot, "debug", debug_cmd)
@@ -5,15 +5,19 @@ import random
 import time
 import json
 import asyncio
+import logging
 import re
+from collections import OrderedDict
 from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 
 import aiohttp
 import discord
 from dotenv import load_dotenv
 from discord.ext import commands  # to properly catch CommandNotFound
 
-from core import db, utils, personality, permissions
+from core import db, utils, personality, permissions, frames, metrics, outbound
+from core.models import Thresholds
 
 AHRI_FEEDBACK_RESPONSES = [
     "Mmm~ that was a little too spicy for here ♥ I’ll be taking it down~",
@@ -24,9 +28,12 @@ AHRI_FEEDBACK_RESPONSES = [
 # Load environment variables
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
 FEATURE_INFO = {
     "name": "nsfw_moderator",
     "triggers": ["nsfw"],
+    "listeners": ["on_message", "on_raw_message_edit"],
     "description": "Scan images for NSFW content, delete/report them, and provide admin trigger commands."
 }
 
@@ -35,6 +42,9 @@ class NSFWProvider:
     async def check_image(self, session: aiohttp.ClientSession, url: str) -> Dict[str, Any]:
         raise NotImplementedError()
 
+    async def check_image_bytes(self, session: aiohttp.ClientSession, data: bytes) -> Dict[str, Any]:
+        raise NotImplementedError()
+
 class SightengineProvider(NSFWProvider):
     def __init__(self, api_user: str, api_secret: str):
         self.api_user = api_user
@@ -49,8 +59,22 @@ class SightengineProvider(NSFWProvider):
             "api_secret": self.api_secret,
             "url": url,
         }
+        with metrics.span("provider.check_image"):
+            return await self._request(session.get(self.endpoint, params=params, timeout=aiohttp.ClientTimeout(total=30)))
+
+    async def check_image_bytes(self, session: aiohttp.ClientSession, data: bytes) -> Dict[str, Any]:
+        # used for sampled animation/video frames, which have no public URL
+        form = aiohttp.FormData()
+        form.add_field("models", "nudity-2.0,type")
+        form.add_field("api_user", self.api_user)
+        form.add_field("api_secret", self.api_secret)
+        form.add_field("media", data, filename="frame.jpg", content_type="image/jpeg")
+        with metrics.span("provider.check_image_bytes"):
+            return await self._request(session.post(self.endpoint, data=form, timeout=aiohttp.ClientTimeout(total=30)))
+
+    async def _request(self, req) -> Dict[str, Any]:
         try:
-            async with session.get(self.endpoint, params=params, timeout=aiohttp.ClientTimeout(total=30)) as resp:
+            async with req as resp:
                 text = await resp.text()
                 if resp.status != 200:
                     return {"ok": False, "error": f"Sightengine HTTP {resp.status}: {text[:300]}"}
@@ -67,13 +91,65 @@ class SightengineProvider(NSFWProvider):
 # --- module-level session + semaphore ---
 _session: Optional[aiohttp.ClientSession] = None
 _scan_sem = asyncio.Semaphore(4)
+_scan_waiting = 0       # messages queued behind _scan_sem
+metrics.gauge("nsfw_scan_queue_depth", lambda: _scan_waiting)
+
+# connector tuning: every scan goes to the same provider host, so keep a few
+# warm keep-alive connections around instead of reconnecting (TLS) per image
+CONN_LIMIT = 16
+CONN_LIMIT_PER_HOST = 8
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 60
+
+# bandwidth gates (pixels / bytes come from the attachment metadata, no fetch needed)
+MIN_SCAN_PIXELS = 64 * 64           # emotes, icons, spacer gifs
+MIN_SCAN_BYTES = 2 * 1024
+PROXY_MAX_EDGE = 1024               # providers don't need more than this
+PROXY_MIN_BYTES = 512 * 1024        # below this the original is cheap enough
+
+_net_stats: Dict[str, int] = {
+    "scans": 0,
+    "frames_scanned": 0,
+    "skipped_small": 0,
+    "proxied": 0,
+    "bytes_fetched": 0,             # estimated bytes the provider had to pull
+    "bytes_original": 0,            # what it would have pulled with att.url
+    "conn_created": 0,
+    "conn_reused": 0,
+}
+
+def _make_trace_config() -> aiohttp.TraceConfig:
+    tc = aiohttp.TraceConfig()
+
+    async def _on_create(session, ctx, params):
+        _net_stats["conn_created"] += 1
+
+    async def _on_reuse(session, ctx, params):
+        _net_stats["conn_reused"] += 1
+
+    tc.on_connection_create_end.append(_on_create)
+    tc.on_connection_reuseconn.append(_on_reuse)
+    return tc
 
 async def _get_session() -> aiohttp.ClientSession:
     global _session
     if _session is None or _session.closed:
-        _session = aiohttp.ClientSession()
+        connector = aiohttp.TCPConnector(
+            limit=CONN_LIMIT,
+            limit_per_host=CONN_LIMIT_PER_HOST,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+        )
+        _session = aiohttp.ClientSession(connector=connector, trace_configs=[_make_trace_config()])
     return _session
 
+def net_stats() -> Dict[str, Any]:
+    s = dict(_net_stats)
+    conns = s["conn_created"] + s["conn_reused"]
+    s["reuse_rate"] = (s["conn_reused"] / conns) if conns else 0.0
+    s["avg_bytes_per_scan"] = (s["bytes_fetched"] // s["scans"]) if s["scans"] else 0
+    return s
+
 def _get_env_provider() -> Optional[NSFWProvider]:
     """
     Sightengine only. Expects SIGHTENGINE_USER and SIGHTENGINE_SECRET.
@@ -82,32 +158,12 @@ def _get_env_provider() -> Optional[NSFWProvider]:
     se_secret = os.getenv("SIGHTENGINE_SECRET")
 
     if se_user and se_secret:
-        print("Using Sightengine provider")
+        log.info("Using Sightengine provider")
         return SightengineProvider(se_user, se_secret)
 
-    print("Warning: No NSFW provider configured. Set SIGHTENGINE_USER and SIGHTENGINE_SECRET")
+    log.warning("No NSFW provider configured. Set SIGHTENGINE_USER and SIGHTENGINE_SECRET")
     return None
 
-# --- per-guild config namespace inside core db ---
-NSFW_KEY = "nsfw_moderator"
-
-def _ensure_nsfw_cfg(guild_data: Dict[str, Any]) -> Dict[str, Any]:
-    part = guild_data.setdefault(NSFW_KEY, {})
-    part.setdefault("enabled", True)
-    part.setdefault("log_channel_id", None)
-    part.setdefault("active_channel_ids", [])
-    part.setdefault("whitelist_user_ids", [])
-    part.setdefault("blacklist_user_ids", [])
-    part.setdefault("everyone_blacklisted", False)
-    # thresholds for realistic photos and illustrations (anime/comics)
-    part.setdefault("thresholds", {
-        "nsfw": 0.80,
-        "suggestive": 0.90,
-        "nsfw_illustration": 0.90,
-        "suggestive_illustration": 0.95,
-    })
-    part.setdefault("last_updated", None)
-    return part
 
 # --- helper parsing functions (defensive) ---
 async def _parse_sightengine_scores(data: Dict[str, Any]) -> Tuple[float, float, str]:
@@ -153,12 +209,151 @@ def _is_image_attachment(att: discord.Attachment) -> bool:
     fn = getattr(att, "filename", "") or ""
     return bool(re.search(r"\.(png|jpe?g|gif|webp)$", fn, re.I))
 
+def _is_video_attachment(att: discord.Attachment) -> bool:
+    ct = getattr(att, "content_type", None)
+    if ct and ct.startswith("video/"):
+        return True
+    fn = getattr(att, "filename", "") or ""
+    return bool(re.search(r"\.(mp4|webm|mov|m4v)$", fn, re.I))
+
+def _media_kind(att: discord.Attachment) -> Optional[str]:
+    """'video', 'animated' (may have frames), 'image', or None if not scannable."""
+    if _is_video_attachment(att):
+        return "video"
+    if not _is_image_attachment(att):
+        return None
+    ct = (getattr(att, "content_type", None) or "").lower()
+    fn = (getattr(att, "filename", "") or "").lower()
+    if ct in ("image/gif", "image/webp", "image/apng") or fn.endswith((".gif", ".webp")):
+        return "animated"
+    return "image"
+
+def _scan_target(att: discord.Attachment) -> Optional[Tuple[str, int]]:
+    """
+    Pick the URL the provider should fetch for this attachment.
+    Returns (url, estimated_bytes), or None when the image is too small to be worth a scan.
+    Large images go through Discord's resizing media proxy bounded to PROXY_MAX_EDGE.
+    """
+    w = getattr(att, "width", None) or 0
+    h = getattr(att, "height", None) or 0
+    size = getattr(att, "size", 0) or 0
+
+    if (w and h and w * h < MIN_SCAN_PIXELS) or (size and size < MIN_SCAN_BYTES):
+        return None
+
+    proxy = getattr(att, "proxy_url", None)
+    if not (w and h and proxy) or (max(w, h) <= PROXY_MAX_EDGE and size <= PROXY_MIN_BYTES):
+        return att.url, size
+
+    scale = min(1.0, PROXY_MAX_EDGE / max(w, h))
+    tw, th = max(1, int(w * scale)), max(1, int(h * scale))
+    parts = urlsplit(proxy)
+    query = parse_qsl(parts.query, keep_blank_values=True) + [("width", str(tw)), ("height", str(th))]
+    url = urlunsplit(parts._replace(query=urlencode(query)))
+    return url, int(size * (tw * th) / (w * h))
+
+# --- already-scanned media, so edits don't pay twice. Attachments are keyed by their id;
+# embeds by (message id, url), since the same URL reposted elsewhere must be scanned again ---
+SEEN_CACHE_SIZE = 50_000
+_seen_media: "OrderedDict[Any, None]" = OrderedDict()
+
+def _media_key(att: Any) -> Any:
+    return getattr(att, "id", None) or (att.message_id, att.url)
+
+def _mark_seen(att: Any) -> None:
+    key = _media_key(att)
+    _seen_media[key] = None
+    _seen_media.move_to_end(key)
+    while len(_seen_media) > SEEN_CACHE_SIZE:
+        _seen_media.popitem(last=False)
+
+def _unseen(media: List[Any]) -> List[Any]:
+    return [m for m in media if _media_key(m) not in _seen_media]
+
+class _EmbedMedia:
+    """Attachment-shaped view of an embed image so the scan path treats both alike."""
+    __slots__ = ("id", "message_id", "url", "proxy_url", "width", "height", "size", "filename", "content_type")
+
+    def __init__(self, message_id: int, proxy: Any):
+        self.id = None
+        self.message_id = message_id
+        self.url = proxy.url
+        self.proxy_url = getattr(proxy, "proxy_url", None)
+        self.width = getattr(proxy, "width", None)
+        self.height = getattr(proxy, "height", None)
+        self.size = 0
+        self.filename = ""
+        self.content_type = "image/unknown"
+
+def _embed_media(message: discord.Message) -> List[Any]:
+    out = []
+    for e in message.embeds:
+        for proxy in (e.image, e.thumbnail):
+            if getattr(proxy, "url", None):
+                out.append(_EmbedMedia(message.id, proxy))
+    return out
+
+# --- frame sampling for animations / video ---
+async def _fetch_bytes(session: aiohttp.ClientSession, url: str, limit: int, animated_only: bool = False) -> Optional[bytes]:
+    """Download up to `limit` bytes. animated_only: stop as soon as the header shows a still image."""
+    async with session.get(url, timeout=aiohttp.ClientTimeout(total=20)) as resp:
+        if resp.status != 200 or (resp.content_length or 0) > limit:
+            return None
+        buf = bytearray()
+        sniffing = animated_only
+        async for chunk in resp.content.iter_chunked(16 * 1024):
+            buf += chunk
+            if len(buf) > limit:
+                return None
+            if sniffing:
+                verdict = frames.sniff_animated(bytes(buf[:frames.SNIFF_BYTES]))
+                if verdict is False:
+                    _net_stats["bytes_fetched"] += len(buf)
+                    return None
+                if verdict is True or len(buf) >= frames.SNIFF_BYTES:
+                    sniffing = False
+        return bytes(buf)
+
+async def _check_frames(session: aiohttp.ClientSession, provider: NSFWProvider, att: discord.Attachment, kind: str) -> Optional[Dict[str, Any]]:
+    """
+    Sample representative frames and scan them as one batch.
+    Returns the result of the most explicit frame, or None to fall back to a single URL scan.
+    """
+    size = getattr(att, "size", 0) or 0
+    if not frames.available(kind) or size > frames.MAX_INPUT_BYTES:
+        return None
+    try:
+        # a still .gif/.webp goes back to the (resized) single scan after a few KB, not a full download
+        blob = await _fetch_bytes(session, att.url, frames.MAX_INPUT_BYTES, animated_only=kind == "animated")
+    except Exception:
+        return None
+    if not blob:
+        return None
+    with metrics.span("nsfw.frame_sample"):
+        picked = await frames.sample(blob, kind)
+    if not picked:
+        return None
+    _net_stats["frames_scanned"] += len(picked)
+    # our download plus the frames we upload
+    _net_stats["bytes_fetched"] += len(blob) + sum(len(f) for f in picked)
+    results = await asyncio.gather(*(provider.check_image_bytes(session, f) for f in picked))
+    ok = [r for r in results if r.get("ok")]
+    if not ok:
+        return results[0]
+    best, best_score = ok[0], -1.0
+    for r in ok:
+        explicit, suggestive, _ = await _parse_sightengine_scores(r.get("data", {}))
+        if max(explicit, suggestive) > best_score:
+            best, best_score = r, max(explicit, suggestive)
+    return best
+
 # --- internal logging to configured log channel ---
+@metrics.timed("nsfw.log_action")
 async def _log_action(bot: "discord.Client", guild_id: int, text: str) -> None:
     try:
         g = await db.load_guild(guild_id)
-        ns = _ensure_nsfw_cfg(g)
-        cid = ns.get("log_channel_id")
+        ns = g.nsfw
+        cid = ns.log_channel_id
         if not cid:
             return
         ch = bot.get_channel(cid)
@@ -167,20 +362,19 @@ async def _log_action(bot: "discord.Client", guild_id: int, text: str) -> None:
 
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime())
         log_message = f"`[{timestamp}]` {text}"  # keep link only, no embeds
-        await ch.send(
-            log_message,
+        # cosmetic: merged with other pending lines for this channel, shed under load
+        outbound.post_log(
+            ch, log_message,
             allowed_mentions=discord.AllowedMentions.none(),
             suppress_embeds=True
         )
     except Exception as e:
-        try:
-            print(f"[NSFW Logger Error] {e}")
-        except Exception:
-            pass
+        log.warning("NSFW log channel post failed: %s", e, extra={"guild_id": guild_id})
         return
 
 # --- core scanning routine ---
-async def _scan_message(bot: "discord.Client", message: discord.Message, provider: Optional[NSFWProvider]) -> bool:
+@metrics.timed("nsfw.scan_message")
+async def _scan_message(bot: "discord.Client", message: discord.Message, provider: Optional[NSFWProvider], media: Optional[List[Any]] = None) -> bool:
     if message.guild is None or message.author.bot:
         return False
 
@@ -190,24 +384,26 @@ async def _scan_message(bot: "discord.Client", message: discord.Message, provide
         await _log_action(bot, message.guild.id if message.guild else 0, f"❌ Failed to load guild data: {e}")
         return False
 
-    if not gdata.get("activated", False):
+    if not gdata.activated:
         return False
 
-    ns = _ensure_nsfw_cfg(gdata)
-    if not ns.get("enabled", True):
+    ns = gdata.nsfw
+    if not ns.enabled:
         return False
 
     author_id = message.author.id
-    if author_id in ns.get("whitelist_user_ids", []):
+    if author_id in ns.whitelist_user_ids:
         return False
 
-    attachments = [a for a in message.attachments if _is_image_attachment(a)]
+    if media is None:
+        media = list(message.attachments) + _embed_media(message)
+    attachments = [a for a in media if _media_kind(a)]
     if not attachments:
         return False
 
-    is_monitored_channel = message.channel.id in ns.get("active_channel_ids", [])
-    is_explicitly_blacklisted = author_id in ns.get("blacklist_user_ids", [])
-    everyone_blacklisted = ns.get("everyone_blacklisted", False)
+    is_monitored_channel = message.channel.id in ns.active_channel_ids
+    is_explicitly_blacklisted = author_id in ns.blacklist_user_ids
+    everyone_blacklisted = ns.everyone_blacklisted
 
     # --- scanning rules (as in original) ---
     if not is_monitored_channel:
@@ -221,32 +417,66 @@ async def _scan_message(bot: "discord.Client", message: discord.Message, provide
         await _log_action(bot, message.guild.id, "⚠️ Provider not configured; skipping image scan.")
         return False
 
+    targets = []
+    for att in attachments:
+        target = _scan_target(att)
+        if target is None:
+            _mark_seen(att)
+            _net_stats["skipped_small"] += 1
+            continue
+        targets.append((att, target))
+    if not targets:
+        return False
+
     session = await _get_session()
-    async with _scan_sem:
-        for att in attachments:
+    global _scan_waiting
+    _scan_waiting += 1
+    try:
+        await _scan_sem.acquire()
+    finally:
+        _scan_waiting -= 1
+    try:
+        for att, (scan_url, est_bytes) in targets:
             try:
-                res = await provider.check_image(session, att.url)
+                _net_stats["scans"] += 1
+                metrics.inc("nsfw_scans")
+                _net_stats["bytes_original"] += getattr(att, "size", 0) or 0
+                kind = _media_kind(att)
+                res = None
+                if kind in ("animated", "video"):
+                    res = await _check_frames(session, provider, att, kind)
+                if res is None:
+                    if kind == "video":
+                        # providers can't fetch a video as an image; nothing sensible to send
+                        continue
+                    if scan_url != att.url:
+                        _net_stats["proxied"] += 1
+                    _net_stats["bytes_fetched"] += est_bytes
+                    res = await provider.check_image(session, scan_url)
                 if not res.get("ok"):
+                    metrics.inc("provider_errors")
                     await _log_action(
                         bot, message.guild.id,
                         f"❌ Scan failed for image `{att.url}` — {res.get('error', 'Unknown error')}"
                     )
                     continue
+                # only now: a failed scan leaves the media for the next edit to retry
+                _mark_seen(att)
 
                 data = res.get("data", {})
                 nsfw_score, suggestive_score, media_type = await _parse_sightengine_scores(data)
 
-                thresholds = ns.get("thresholds", {"nsfw": 0.80, "suggestive": 0.90, "nsfw_illustration": 0.90, "suggestive_illustration": 0.95})
+                thresholds = ns.thresholds
 
                 # Choose thresholds based on media type (treat non-realistic images as illustrations)
                 illustration_labels = {"illustration", "cartoon", "anime", "animated", "cgi"}
                 if str(media_type).lower() in illustration_labels:
-                    nsfw_th = thresholds.get("nsfw_illustration", 0.90)
-                    sugg_th = thresholds.get("suggestive_illustration", 0.95)
+                    nsfw_th = thresholds.nsfw_illustration
+                    sugg_th = thresholds.suggestive_illustration
                     typ_label = "illustration"
                 else:
-                    nsfw_th = thresholds.get("nsfw", 0.80)
-                    sugg_th = thresholds.get("suggestive", 0.90)
+                    nsfw_th = thresholds.nsfw
+                    sugg_th = thresholds.suggestive
                     typ_label = "photo"
 
                 # --- Improved decision logic to reduce false positives ---
@@ -274,7 +504,7 @@ async def _scan_message(bot: "discord.Client", message: discord.Message, provide
                 if should_delete:
                     deleted = False
                     try:
-                        await message.delete()
+                        await outbound.enforce(message.delete, key=message.channel.id)
                         deleted = True
                     except Exception as e:
                         deleted = False
@@ -284,14 +514,11 @@ async def _scan_message(bot: "discord.Client", message: discord.Message, provide
                         )
 
                     # Ahri-style feedback only (randomized, no mention)
-                    try:
-                        response = random.choice(AHRI_FEEDBACK_RESPONSES)
-                        await message.channel.send(
-                            personality.ahri_say("oops") + f" {response}",
-                            delete_after=12
-                        )
-                    except Exception:
-                        pass
+                    response = random.choice(AHRI_FEEDBACK_RESPONSES)
+                    outbound.fire(outbound.COSMETIC, lambda: message.channel.send(
+                        personality.ahri_say("oops") + f" {response}",
+                        delete_after=12
+                    ))
 
                     await _log_action(
                         bot, message.guild.id,
@@ -306,7 +533,7 @@ async def _scan_message(bot: "discord.Client", message: discord.Message, provide
                         )
                     )
 
-                    ns["last_updated"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+                    ns.last_updated = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
                     try:
                         await db.save_guild(message.guild.id, gdata)
                     except Exception as e:
@@ -319,6 +546,8 @@ async def _scan_message(bot: "discord.Client", message: discord.Message, provide
                     f"❌ Exception while scanning image in <#{message.channel.id}>: {e}"
                 )
                 continue
+    finally:
+        _scan_sem.release()
     return False
 
 # --- trigger handler registration helper (matches other features) ---
@@ -338,8 +567,7 @@ async def setup(bot: "discord.Client"):
         try:
             if message.author.bot or message.guild is None:
                 return
-            gdata = await db.load_guild(message.guild.id)
-            if not gdata.get("activated", False):
+            if not message.attachments and not message.embeds:
                 return
             await _scan_message(bot, message, provider)
         except commands.CommandNotFound:
@@ -352,7 +580,26 @@ async def setup(bot: "discord.Client"):
                 pass
             return
 
+    # ---- edit listener: only media we haven't scanned yet ----
+    @bot.listen("on_raw_message_edit")
+    async def _on_edit_listener(payload: discord.RawMessageUpdateEvent):
+        message = payload.message
+        try:
+            if message.author.bot or message.guild is None:
+                return
+            fresh = _unseen(list(message.attachments) + _embed_media(message))
+            if not fresh:
+                return
+            await _scan_message(bot, message, provider, media=fresh)
+        except Exception as e:
+            try:
+                await _log_action(bot, message.guild.id if message.guild else 0, f"❌ on_message_edit error: {e}")
+            except Exception:
+                pass
+            return
+
     # ---- trigger root: ahri nsfw <sub> ----
+    @utils.limited(per_user=(5, 10), per_guild=(20, 60))
     async def nsfw_root(bot: "discord.Client", message: discord.Message, args: List[str]):
         if message.guild is None:
             return
@@ -363,10 +610,10 @@ async def setup(bot: "discord.Client"):
 
         sub = args[0].lower()
         gdata = await db.load_guild(message.guild.id)
-        ns = _ensure_nsfw_cfg(gdata)
+        ns = gdata.nsfw
 
         async def _save_and_ack(text: str):
-            ns["last_updated"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            ns.last_updated = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
             await db.save_guild(message.guild.id, gdata)
             await message.channel.send(personality.ahri_say("done") + " " + text)
 
@@ -377,7 +624,7 @@ async def setup(bot: "discord.Client"):
             "whitelist", "unwhitelist", "allow", "unallow",
             "blacklist", "unblacklist", "watch", "unwatch",
             "toggleglobal", "globallock", "viewsettings", "settings",
-            "viewwhitelist", "viewblacklist"
+            "viewwhitelist", "viewblacklist", "stats"
         }
         if sub in admin_subs:
             if not await permissions.is_guild_admin(message.author, message.guild.id):
@@ -398,17 +645,18 @@ async def setup(bot: "discord.Client"):
                 "`ahri nsfw viewwhitelist` / `ahri nsfw viewblacklist`\n"
                 "`ahri nsfw toggleglobal` — treat everyone as blacklisted in monitored channels (whitelist still bypasses)\n"
                 "`ahri nsfw viewsettings` — view current settings\n"
+                "`ahri nsfw stats` — scan bandwidth and connection reuse for this process\n"
             )
             await message.channel.send(help_text)
             return
 
         # enable/disable
         if sub in ("enable", "on"):
-            ns["enabled"] = True
+            ns.enabled = True
             await _save_and_ack("NSFW scanning enabled.")
             return
         if sub in ("disable", "off"):
-            ns["enabled"] = False
+            ns.enabled = False
             await _save_and_ack("NSFW scanning disabled.")
             return
 
@@ -418,7 +666,7 @@ async def setup(bot: "discord.Client"):
                 await message.channel.send("Mention the channel: `ahri nsfw setlogchannel #logs`")
                 return
             ch = message.channel_mentions[0]
-            ns["log_channel_id"] = ch.id
+            ns.log_channel_id = ch.id
             await _save_and_ack(f"Logging to {ch.mention}.")
             return
 
@@ -430,8 +678,8 @@ async def setup(bot: "discord.Client"):
             try:
                 nsfw_v = float(args[1])
                 suggest_v = float(args[2])
-                ill_nsfw_v = float(args[3]) if len(args) > 3 else ns["thresholds"].get("nsfw_illustration", 0.90)
-                ill_sugg_v = float(args[4]) if len(args) > 4 else ns["thresholds"].get("suggestive_illustration", 0.95)
+                ill_nsfw_v = float(args[3]) if len(args) > 3 else ns.thresholds.nsfw_illustration
+                ill_sugg_v = float(args[4]) if len(args) > 4 else ns.thresholds.suggestive_illustration
                 if not (0.0 <= nsfw_v <= 1.0):
                     await message.channel.send("NSFW threshold must be between 0.0 and 1.0")
                     return
@@ -441,12 +689,12 @@ async def setup(bot: "discord.Client"):
                 if not (0.0 <= ill_nsfw_v <= 1.0) or not (0.0 <= ill_sugg_v <= 1.0):
                     await message.channel.send("Illustration thresholds must be between 0.0 and 1.0")
                     return
-                ns["thresholds"] = {
-                    "nsfw": nsfw_v,
-                    "suggestive": suggest_v,
-                    "nsfw_illustration": ill_nsfw_v,
-                    "suggestive_illustration": ill_sugg_v,
-                }
+                ns.thresholds = Thresholds(
+                    nsfw=nsfw_v,
+                    suggestive=suggest_v,
+                    nsfw_illustration=ill_nsfw_v,
+                    suggestive_illustration=ill_sugg_v,
+                )
                 await _save_and_ack(
                     f"Thresholds set: NSFW={nsfw_v:.2f}, Suggestive={suggest_v:.2f}, "
                     f"NSFW(illustration)={ill_nsfw_v:.2f}, Suggestive(illustration)={ill_sugg_v:.2f}"
@@ -461,8 +709,8 @@ async def setup(bot: "discord.Client"):
                 await message.channel.send("Mention the channel to monitor: `ahri nsfw addchannel #channel`")
                 return
             ch = message.channel_mentions[0]
-            if ch.id not in ns.get("active_channel_ids", []):
-                ns["active_channel_ids"].append(ch.id)
+            if ch.id not in ns.active_channel_ids:
+                ns.active_channel_ids.append(ch.id)
                 await _save_and_ack(f"Monitoring {ch.mention}.")
             else:
                 await message.channel.send(f"I'm already watching {ch.mention}~")
@@ -473,8 +721,8 @@ async def setup(bot: "discord.Client"):
                 await message.channel.send("Mention the channel to stop: `ahri nsfw removechannel #channel`")
                 return
             ch = message.channel_mentions[0]
-            if ch.id in ns.get("active_channel_ids", []):
-                ns["active_channel_ids"].remove(ch.id)
+            if ch.id in ns.active_channel_ids:
+                ns.active_channel_ids.remove(ch.id)
                 await _save_and_ack(f"Stopped monitoring {ch.mention}.")
             else:
                 await message.channel.send(f"I wasn't watching {ch.mention}~")
@@ -486,8 +734,8 @@ async def setup(bot: "discord.Client"):
                 await message.channel.send("Mention the user to whitelist: `ahri nsfw whitelist @user`")
                 return
             u = message.mentions[0]
-            if u.id not in ns.get("whitelist_user_ids", []):
-                ns["whitelist_user_ids"].append(u.id)
+            if u.id not in ns.whitelist_user_ids:
+                ns.whitelist_user_ids.append(u.id)
                 await _save_and_ack(f"{u.mention} can bypass scans.")
             else:
                 await message.channel.send(f"{u.mention} is already whitelisted~")
@@ -498,8 +746,8 @@ async def setup(bot: "discord.Client"):
                 await message.channel.send("Mention the user to remove from whitelist.")
                 return
             u = message.mentions[0]
-            if u.id in ns.get("whitelist_user_ids", []):
-                ns["whitelist_user_ids"].remove(u.id)
+            if u.id in ns.whitelist_user_ids:
+                ns.whitelist_user_ids.remove(u.id)
                 await _save_and_ack(f"{u.mention} removed from whitelist.")
             else:
                 await message.channel.send(f"{u.mention} wasn't whitelisted~")
@@ -511,8 +759,8 @@ async def setup(bot: "discord.Client"):
                 await message.channel.send("Mention the user to blacklist: `ahri nsfw blacklist @user`")
                 return
             u = message.mentions[0]
-            if u.id not in ns.get("blacklist_user_ids", []):
-                ns["blacklist_user_ids"].append(u.id)
+            if u.id not in ns.blacklist_user_ids:
+                ns.blacklist_user_ids.append(u.id)
                 await _save_and_ack(f"{u.mention} added to watchlist.")
             else:
                 await message.channel.send(f"{u.mention} is already on the watchlist~")
@@ -523,8 +771,8 @@ async def setup(bot: "discord.Client"):
                 await message.channel.send("Mention the user to remove from blacklist.")
                 return
             u = message.mentions[0]
-            if u.id in ns.get("blacklist_user_ids", []):
-                ns["blacklist_user_ids"].remove(u.id)
+            if u.id in ns.blacklist_user_ids:
+                ns.blacklist_user_ids.remove(u.id)
                 await _save_and_ack(f"{u.mention} removed from watchlist.")
             else:
                 await message.channel.send(f"{u.mention} wasn't on the watchlist~")
@@ -532,37 +780,51 @@ async def setup(bot: "discord.Client"):
 
         # toggleglobal
         if sub in ("toggleglobal", "globallock"):
-            ns["everyone_blacklisted"] = not ns.get("everyone_blacklisted", False)
-            state = "ENABLED (monitored channels only) 🔒" if ns["everyone_blacklisted"] else "DISABLED 🔓"
+            ns.everyone_blacklisted = not ns.everyone_blacklisted
+            state = "ENABLED (monitored channels only) 🔒" if ns.everyone_blacklisted else "DISABLED 🔓"
             await _save_and_ack(f"Global 'everyone blacklisted' is now {state}")
             return
 
         # viewsettings
         if sub in ("viewsettings", "settings"):
-            thr = ns.get("thresholds", {})
-            monitored = ", ".join(f"<#{c}>" for c in ns.get("active_channel_ids", [])) or "(none)"
-            logc = f"<#{ns['log_channel_id']}>" if ns.get("log_channel_id") else "(not set)"
-            whitelist = " ".join(f"<@{uid}>" for uid in ns.get("whitelist_user_ids", [])) or "(empty)"
-            blacklist = " ".join(f"<@{uid}>" for uid in ns.get("blacklist_user_ids", [])) or "(empty)"
-            last_updated = ns.get("last_updated") or "(never)"
+            thr = ns.thresholds
+            monitored = ", ".join(f"<#{c}>" for c in ns.active_channel_ids) or "(none)"
+            logc = f"<#{ns.log_channel_id}>" if ns.log_channel_id else "(not set)"
+            whitelist = " ".join(f"<@{uid}>" for uid in ns.whitelist_user_ids) or "(empty)"
+            blacklist = " ".join(f"<@{uid}>" for uid in ns.blacklist_user_ids) or "(empty)"
+            last_updated = ns.last_updated or "(never)"
 
             await message.channel.send(
-                f"Enabled: {'YES' if ns.get('enabled', True) else 'NO'}\n"
+                f"Enabled: {'YES' if ns.enabled else 'NO'}\n"
                 f"Log channel: {logc}\n"
                 f"Monitored: {monitored}\n"
-                f"Global everyone-blacklisted: {'ON (monitored only)' if ns.get('everyone_blacklisted') else 'OFF'}\n"
-                f"Thresholds → NSFW: {thr.get('nsfw',0):.2f} | Suggestive: {thr.get('suggestive',0):.2f} | "
-                f"NSFW(illustration): {thr.get('nsfw_illustration',0.90):.2f} | "
-                f"Suggestive(illustration): {thr.get('suggestive_illustration',0.95):.2f}\n"
+                f"Global everyone-blacklisted: {'ON (monitored only)' if ns.everyone_blacklisted else 'OFF'}\n"
+                f"Thresholds → NSFW: {thr.nsfw:.2f} | Suggestive: {thr.suggestive:.2f} | "
+                f"NSFW(illustration): {thr.nsfw_illustration:.2f} | "
+                f"Suggestive(illustration): {thr.suggestive_illustration:.2f}\n"
                 f"Whitelist: {whitelist}\n"
                 f"Blacklist: {blacklist}\n"
                 f"Last updated: {last_updated}"
             )
             return
 
+        # stats (process-wide, not per guild)
+        if sub == "stats":
+            st = net_stats()
+            saved = st["bytes_original"] - st["bytes_fetched"]
+            await message.channel.send(
+                f"Scans: {st['scans']} (proxied {st['proxied']}, skipped tiny {st['skipped_small']}, "
+                f"animation frames {st['frames_scanned']})\n"
+                f"Avg bytes/scan: {st['avg_bytes_per_scan'] / 1024:.1f} KiB | "
+                f"Saved vs originals: {saved / (1024 * 1024):.1f} MiB\n"
+                f"Connections: {st['conn_created']} new, {st['conn_reused']} reused "
+                f"(reuse rate {st['reuse_rate'] * 100:.0f}%)"
+            )
+            return
+
         # viewwhitelist
         if sub == "viewwhitelist":
-            wl = ns.get("whitelist_user_ids", [])
+            wl = ns.whitelist_user_ids
             if not wl:
                 await message.channel.send("Whitelist is empty.")
             else:
@@ -572,7 +834,7 @@ async def setup(bot: "discord.Client"):
 
         # viewblacklist
         if sub == "viewblacklist":
-            bl = ns.get("blacklist_user_ids", [])
+            bl = ns.blacklist_user_ids
             if not bl:
                 await message.channel.send("Blacklist is empty.")
             else:
@@ -584,19 +846,15 @@ async def setup(bot: "discord.Client"):
 
     # register handler
     register(bot, "nsfw", nsfw_root)
-
-    # --- graceful aiohttp session cleanup on bot shutdown ---
-    original_close = bot.close
-
-    async def wrapped_close():
-        global _session
-        if _session and not _session.closed:
-            try:
-                await _session.close()
-            except Exception:
-                pass
-            _session = None
-        await original_close()
-
-    bot.close = wrapped_close
     return
+
+# --- graceful aiohttp session cleanup on shutdown / reload (called by loader) ---
+async def teardown(bot: "discord.Client"):
+    global _session
+    if _session and not _session.closed:
+        try:
+            await _session.close()
+        except Exception:
+            pass
+    _session = None
+    frames.shutdown()
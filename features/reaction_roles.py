@@ -1,13 +1,221 @@
 from __future__ import annotations
-from typing import List, Optional
+import asyncio, logging, time
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
 import discord
-from core import db, personality, utils
+from core import db, personality, utils, members, permissions, roles
+from core.models import Panel
 
-FEATURE_INFO = {"name": "reaction_roles", "triggers": ["reactionrole"]}
+FEATURE_INFO = {"name": "reaction_roles", "triggers": ["reactionrole"], "listeners": ["on_ready", "on_raw_reaction_add", "on_raw_reaction_remove", "on_guild_data_restored"]}
+
+log = logging.getLogger(__name__)
 
 def register(bot, key, func):
     bot.trigger_handlers[key] = func
 
+# --- in-memory lookup, built from guild documents on first use ---
+# (channel_id, message_id, emoji) -> role_id
+_role_index: Dict[Tuple[int, int, str], int] = {}
+# every panel message id across indexed guilds: most reactions aren't on panels
+_panel_messages: Set[int] = set()
+_indexed_guilds: Set[int] = set()
+
+def _index_panel(panel: Panel):
+    _panel_messages.add(panel.message_id)
+    for emoji, role_id in panel.map.items():
+        if isinstance(role_id, int):
+            _role_index[(panel.channel_id, panel.message_id, emoji)] = role_id
+
+def _migrate_panels(guild: discord.Guild, panels: List[Panel]) -> bool:
+    """Old panels stored role names; resolve them to IDs once. Returns True if anything changed."""
+    changed = False
+    for p in panels:
+        for emoji, ref in list(p.map.items()):
+            if isinstance(ref, int):
+                continue
+            if isinstance(ref, str) and ref.isdigit():
+                p.map[emoji] = int(ref)
+                changed = True
+                continue
+            role = discord.utils.get(guild.roles, name=ref)
+            if role:
+                p.map[emoji] = role.id
+                changed = True
+            else:
+                log.warning("Reaction-role panel %s: role %r not found, left unmapped", p.message_id, ref, extra={"guild_id": guild.id})
+    return changed
+
+async def _ensure_indexed(guild: discord.Guild):
+    if guild.id in _indexed_guilds:
+        return
+    g = await db.load_guild(guild.id)
+    panels = g.reaction_roles.panels
+    if _migrate_panels(guild, panels):
+        await db.save_guild(guild.id, g)
+    for p in panels:
+        _index_panel(p)
+    _indexed_guilds.add(guild.id)
+
+async def _lookup(bot, payload: discord.RawReactionActionEvent) -> Optional[Tuple[discord.Guild, discord.Role]]:
+    if payload.user_id == bot.user.id or not payload.guild_id:
+        return None
+    if payload.guild_id in _indexed_guilds and payload.message_id not in _panel_messages:
+        return None
+    guild = bot.get_guild(payload.guild_id)
+    if not guild:
+        return None
+    await _ensure_indexed(guild)
+    role_id = _role_index.get((payload.channel_id, payload.message_id, str(payload.emoji)))
+    if role_id is None:
+        return None
+    g = await db.load_guild(guild.id)
+    if not g.activated:
+        return None
+    role = guild.get_role(role_id)
+    return (guild, role) if role else None
+
+# --- startup reconciliation: apply reactions added/removed while we were offline ---
+RECONCILE_CONCURRENCY = 2       # guilds reconciled at once
+LOOKUP_CONCURRENCY = 8          # member lookups at once (each may be a REST fetch in the low profile)
+RESUME_WINDOW = 3600            # an interrupted run younger than this skips the roles it already did
+CHECKPOINT_EVERY = 30.0         # seconds between progress saves; most guilds finish before the first
+_reconcile_task: Optional[asyncio.Task] = None
+
+async def _panel_reactors(guild: discord.Guild, panel: Panel) -> Optional[Dict[str, Set[int]]]:
+    """emoji -> ids of (non-bot) users reacting on the panel, or None if the message can't be read."""
+    ch = guild.get_channel(panel.channel_id)
+    if ch is None:
+        return None
+    try:
+        msg = await ch.fetch_message(panel.message_id)
+    except (discord.NotFound, discord.Forbidden):
+        return None
+    out: Dict[str, Set[int]] = {}
+    for reaction in msg.reactions:
+        emoji = str(reaction.emoji)
+        if emoji not in panel.map:
+            continue
+        ids: Set[int] = set()
+        if reaction.count > (1 if reaction.me else 0):
+            # paged 100 at a time; discord.py waits out the route's rate limit between pages
+            async for user in reaction.users(limit=None):
+                if not user.bot:
+                    ids.add(user.id)
+        out[emoji] = ids
+    return out
+
+async def _apply_role(guild: discord.Guild, role: discord.Role, want: Set[int], can_remove: Optional[bool], stats: Counter):
+    """can_remove: None when removals are off for the guild, False when the data isn't complete."""
+    holders = {m.id for m in role.members}
+    sem = asyncio.Semaphore(LOOKUP_CONCURRENCY)
+    async def add(uid: int):
+        async with sem:
+            member = await members.get_member(guild, uid)
+        if member is None or member.bot or any(r.id == role.id for r in member.roles):
+            return
+        roles.batcher.add(member, role, reason="Reaction role (resync)")
+        stats["added"] += 1
+    await asyncio.gather(*(add(uid) for uid in want - holders))
+    if can_remove is None:
+        return
+    if not can_remove:
+        stats["removals_skipped"] += 1
+        return
+    for m in role.members:
+        if m.id not in want and not m.bot:
+            roles.batcher.remove(m, role, reason="Reaction role (resync)")
+            stats["removed"] += 1
+
+async def reconcile_guild(guild: discord.Guild) -> Optional[Counter]:
+    """
+    Bring role holders in line with the reactions on every panel. A long run checkpoints the
+    roles it finished in the guild document, so a restart within RESUME_WINDOW skips them.
+    """
+    g = await db.load_guild(guild.id)
+    rr = g.reaction_roles
+    if not g.activated or not rr.panels:
+        return None
+    await _ensure_indexed(guild)
+
+    # a role offered on several panels/emojis is judged on all of them together
+    by_role: Dict[int, List[Tuple[Panel, str]]] = {}
+    for p in rr.panels:
+        for emoji, rid in p.map.items():
+            if isinstance(rid, int):
+                by_role.setdefault(rid, []).append((p, emoji))
+
+    prog = rr.reconcile or {}
+    if time.time() - prog.get("started", 0) > RESUME_WINDOW:
+        prog = {"started": time.time(), "done": []}
+    done: Set[int] = set(prog.get("done") or ())
+    last_checkpoint = time.monotonic()
+    stats: Counter = Counter()
+    fetched: Dict[int, Optional[Dict[str, Set[int]]]] = {}
+    for rid, sources in by_role.items():
+        if rid in done:
+            stats["resumed"] += 1
+            continue
+        if time.monotonic() - last_checkpoint >= CHECKPOINT_EVERY:
+            rr.reconcile = {"started": prog["started"], "done": sorted(done)}
+            await db.save_guild(guild.id, g)
+            last_checkpoint = time.monotonic()
+        done.add(rid)
+        role = guild.get_role(rid)
+        if role is None:
+            continue
+        want: Set[int] = set()
+        complete = True
+        for p, emoji in sources:
+            if p.message_id not in fetched:
+                fetched[p.message_id] = await _panel_reactors(guild, p)
+            reactors = fetched[p.message_id]
+            if reactors is None or emoji not in reactors:
+                # unreadable panel or missing reaction: never strip roles on missing data
+                complete = False
+                continue
+            want |= reactors[emoji]
+        # role.members only lists everyone once the guild is chunked
+        await _apply_role(guild, role, want, (complete and guild.chunked) if rr.resync_removals else None, stats)
+        stats["roles"] += 1
+    stats["unreadable"] = sum(1 for r in fetched.values() if r is None)
+    if rr.reconcile is not None:
+        rr.reconcile = None
+        await db.save_guild(guild.id, g)
+    return stats
+
+async def _report(bot, guild: discord.Guild, stats: Counter):
+    log.info("Reaction roles resynced: %d added, %d removed over %d roles", stats["added"], stats["removed"], stats["roles"],
+             extra={"guild_id": guild.id, **stats})
+    if not (stats["added"] or stats["removed"] or stats["unreadable"]):
+        return
+    g = await db.load_guild(guild.id)
+    ch = guild.get_channel(g.logging.channel_id or 0)
+    if ch is None:
+        return
+    text = f"Reaction roles resynced after downtime: {stats['added']} added" + (f", {stats['removed']} removed." if stats["removed"] else ".")
+    if stats["unreadable"]:
+        text += f" {stats['unreadable']} panel(s) couldn't be read."
+    if stats["removals_skipped"]:
+        text += " Removals skipped for roles with missing panel data or an unchunked member list."
+    try:
+        await ch.send(text)
+    except discord.HTTPException:
+        pass
+
+async def reconcile_all(bot):
+    sem = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+    async def one(guild: discord.Guild):
+        async with sem:
+            try:
+                stats = await reconcile_guild(guild)
+            except Exception as e:
+                # finished roles up to the last checkpoint are skipped by the next start
+                log.warning("Reaction-role resync failed: %s", e, extra={"guild_id": guild.id})
+                return
+            if stats is not None:
+                await _report(bot, guild, stats)
+    await asyncio.gather(*(one(g) for g in list(bot.guilds)))
+
 def normalize_emoji(tok: str) -> Optional[str]:
     try:
         pe = discord.PartialEmoji.from_str(tok)
@@ -18,9 +226,10 @@ def normalize_emoji(tok: str) -> Optional[str]:
         return None
 
 async def setup(bot):
+    @utils.limited(per_user=(3, 10), per_guild=(10, 30))
     async def rr_cmd(bot, message: discord.Message, args: List[str]):
         if not args:
-            await message.channel.send('Use: `ahri reactionrole create "Title" #channel` | `add <message_id> <emoji> "Role Name"` | `remove <message_id> <emoji>` | `list`')
+            await message.channel.send('Use: `ahri reactionrole create "Title" #channel` | `add <message_id> <emoji> "Role Name"` | `remove <message_id> <emoji>` | `list` | `stats` | `resync-removals on|off`')
             return
         sub = args[0].lower()
         if sub == "create":
@@ -37,8 +246,11 @@ async def setup(bot):
             try:
                 msg = await ch.send(f"**{title}**\nReact to get the role!")
                 g = await db.load_guild(message.guild.id)
-                g["settings"]["reaction_roles"]["panels"].append({"message_id": msg.id, "channel_id": ch.id, "map": {}})
+                panel = Panel(message_id=msg.id, channel_id=ch.id)
+                g.reaction_roles.panels.append(panel)
                 await db.save_guild(message.guild.id, g)
+                if message.guild.id in _indexed_guilds:
+                    _index_panel(panel)
                 await message.channel.send(personality.ahri_say("done") + f" Panel ID: `{msg.id}`")
             except Exception:
                 await message.channel.send("Couldn't create panel. Check permissions.")
@@ -68,19 +280,21 @@ async def setup(bot):
                 await message.channel.send("Role not found. Create it first.")
                 return
             g = await db.load_guild(message.guild.id)
-            panel = next((p for p in g["settings"]["reaction_roles"]["panels"] if p["message_id"] == message_id), None)
+            panel = next((p for p in g.reaction_roles.panels if p.message_id == message_id), None)
             if not panel:
                 await message.channel.send("Panel not found.")
                 return
-            ch = message.guild.get_channel(panel["channel_id"])
+            ch = message.guild.get_channel(panel.channel_id)
             try:
                 msg = await ch.fetch_message(message_id)
                 await msg.add_reaction(norm)
             except Exception:
                 await message.channel.send("Couldn't add reaction to message (missing perms?).")
                 return
-            panel["map"][norm] = role.name
+            panel.map[norm] = role.id
             await db.save_guild(message.guild.id, g)
+            if message.guild.id in _indexed_guilds:
+                _index_panel(panel)
             await message.channel.send(personality.ahri_say("done"))
             return
         if sub == "remove" and len(args) >= 3:
@@ -94,84 +308,86 @@ async def setup(bot):
                 await message.channel.send("Emoji not recognized.")
                 return
             g = await db.load_guild(message.guild.id)
-            panel = next((p for p in g["settings"]["reaction_roles"]["panels"] if p["message_id"] == message_id), None)
-            if not panel or norm not in panel["map"]:
+            panel = next((p for p in g.reaction_roles.panels if p.message_id == message_id), None)
+            if not panel or norm not in panel.map:
                 await message.channel.send("Mapping not found.")
                 return
-            del panel["map"][norm]
+            del panel.map[norm]
             await db.save_guild(message.guild.id, g)
+            _role_index.pop((panel.channel_id, panel.message_id, norm), None)
             await message.channel.send(personality.ahri_say("done"))
             return
+        if sub == "resync-removals" and len(args) >= 2 and args[1].lower() in ("on", "off"):
+            if not await permissions.is_guild_admin(message.author, message.guild.id):
+                await message.channel.send(personality.ahri_say("no_permission"))
+                return
+            g = await db.load_guild(message.guild.id)
+            g.reaction_roles.resync_removals = args[1].lower() == "on"
+            await db.save_guild(message.guild.id, g)
+            await message.channel.send(personality.ahri_say("done") + (" After downtime I'll also take panel roles from members who aren't reacting, including roles given by hand." if g.reaction_roles.resync_removals else ""))
+            return
+        if sub == "stats":
+            b = roles.batcher
+            await message.channel.send(f"Role changes requested: {b.requested} | API calls: {b.calls} | saved: {b.saved}")
+            return
         if sub == "list":
             g = await db.load_guild(message.guild.id)
-            panels = g["settings"]["reaction_roles"]["panels"]
+            panels = g.reaction_roles.panels
             if not panels:
                 await message.channel.send("No panels yet.")
                 return
             lines = []
             for p in panels:
-                pairs = [f"{k} -> {v}" for k,v in p["map"].items()] or ["(empty)"]
-                lines.append(f"ID `{p['message_id']}` in <#{p['channel_id']}>: " + ", ".join(pairs))
-            await message.channel.send("\n".join(lines))
+                pairs = [f"{k} -> " + (f"<@&{v}>" if isinstance(v, int) else str(v)) for k,v in p.map.items()] or ["(empty)"]
+                lines.append(f"ID `{p.message_id}` in <#{p.channel_id}>: " + ", ".join(pairs))
+            await message.channel.send("\n".join(lines), allowed_mentions=discord.AllowedMentions.none())
             return
-        await message.channel.send('Use: `ahri reactionrole create "Title" #channel` | `add <message_id> <emoji> "Role Name"` | `remove <message_id> <emoji>` | `list`')
+        await message.channel.send('Use: `ahri reactionrole create "Title" #channel` | `add <message_id> <emoji> "Role Name"` | `remove <message_id> <emoji>` | `list` | `stats` | `resync-removals on|off`')
+
+    @bot.listen("on_ready")
+    async def _build_index():
+        # warm the index so reactions on non-panel messages are dropped without any lookup
+        for guild in list(bot.guilds):
+            try:
+                await _ensure_indexed(guild)
+            except Exception as e:
+                log.warning("Reaction-role index build failed: %s", e, extra={"guild_id": guild.id})
+        # on_ready also fires after a full reconnect; resync only once per process
+        global _reconcile_task
+        if _reconcile_task is None:
+            _reconcile_task = asyncio.create_task(reconcile_all(bot))
 
     @bot.listen("on_raw_reaction_add")
     async def _add(payload: discord.RawReactionActionEvent):
-        if payload.user_id == bot.user.id:
-            return
-        guild = bot.get_guild(payload.guild_id) if payload.guild_id else None
-        if not guild:
-            return
-        g = await db.load_guild(guild.id)
-        if not g.get("activated", False):
-            return
-        panels = g["settings"]["reaction_roles"]["panels"]
-        if not panels:
+        hit = await _lookup(bot, payload)
+        if not hit:
             return
-        key = str(payload.emoji)
-        for p in panels:
-            if p["message_id"] == payload.message_id and p["channel_id"] == payload.channel_id:
-                role_name = p["map"].get(key)
-                if not role_name:
-                    continue
-                role = discord.utils.get(guild.roles, name=role_name)
-                if not role:
-                    continue
-                member = guild.get_member(payload.user_id)
-                if member and not member.bot:
-                    try:
-                        await member.add_roles(role, reason="Reaction role")
-                    except Exception:
-                        pass
+        guild, role = hit
+        member = payload.member or await members.get_member(guild, payload.user_id)
+        if member and not member.bot:
+            roles.batcher.add(member, role, reason="Reaction role")
 
     @bot.listen("on_raw_reaction_remove")
     async def _remove(payload: discord.RawReactionActionEvent):
-        if payload.user_id == bot.user.id:
+        hit = await _lookup(bot, payload)
+        if not hit:
             return
-        guild = bot.get_guild(payload.guild_id) if payload.guild_id else None
-        if not guild:
-            return
-        g = await db.load_guild(guild.id)
-        if not g.get("activated", False):
-            return
-        panels = g["settings"]["reaction_roles"]["panels"]
-        if not panels:
-            return
-        key = str(payload.emoji)
-        for p in panels:
-            if p["message_id"] == payload.message_id and p["channel_id"] == payload.channel_id:
-                role_name = p["map"].get(key)
-                if not role_name:
-                    continue
-                role = discord.utils.get(guild.roles, name=role_name)
-                if not role:
-                    continue
-                member = guild.get_member(payload.user_id)
-                if member and not member.bot:
-                    try:
-                        await member.remove_roles(role, reason="Reaction role removal")
-                    except Exception:
-                        pass
+        guild, role = hit
+        member = await members.get_member(guild, payload.user_id)
+        if member and not member.bot:
+            roles.batcher.remove(member, role, reason="Reaction role")
+
+    @bot.listen("on_guild_data_restored")
+    async def _drop_index(guild_id: int):
+        # entries aren't keyed by guild; start over, each guild re-indexes on its next reaction
+        _role_index.clear()
+        _panel_messages.clear()
+        _indexed_guilds.clear()
 
     register(bot, "reactionrole", rr_cmd)
+
+async def teardown(bot):
+    if _reconcile_task is not None and not _reconcile_task.done():
+        _reconcile_task.cancel()
+    # apply whatever is still inside the debounce window
+    await roles.batcher.flush_all()
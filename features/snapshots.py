@@ -0,0 +1,70 @@
+from __future__ import annotations
+import asyncio, logging, os
+from typing import List, Optional
+import discord
+from core import snapshot, utils
+
+FEATURE_INFO = {"name": "snapshots", "triggers": ["snapshot"], "lazy": False}
+
+# AHRI_SNAPSHOT_EVERY=<minutes>: take (and prune) a snapshot on a timer; 0 = manual only
+EVERY_MIN = float(os.getenv("AHRI_SNAPSHOT_EVERY", "0"))
+
+log = logging.getLogger(__name__)
+_timer: Optional[asyncio.Task] = None
+
+def register(bot, key, func):
+    bot.trigger_handlers[key] = func
+
+def _restored(bot, guild_ids: List[int]):
+    # features holding derived state (e.g. reaction-role indexes) rebuild it from the document
+    for gid in guild_ids:
+        bot.dispatch("guild_data_restored", gid)
+
+async def _periodic():
+    while True:
+        await asyncio.sleep(EVERY_MIN * 60)
+        try:
+            await snapshot.take()
+            await snapshot.prune()
+        except Exception as e:
+            log.exception("Scheduled snapshot failed: %s", e)
+
+async def setup(bot):
+    global _timer
+    USAGE = "Use: `ahri snapshot take` | `list` | `restore <name> [guild_id]` | `prune [keep]`"
+
+    @utils.owner_only
+    @utils.limited(per_user=(3, 60), timeout=600)
+    async def snapshot_cmd(bot, message: discord.Message, args: List[str]):
+        sub = args[0].lower() if args else ""
+        if sub == "take":
+            s = await snapshot.take()
+            await message.channel.send(f"📸 Snapshot `{s['name']}`: {s['guilds']} guilds, {s['written']} new objects ({s['ms']:.0f} ms).")
+        elif sub == "list":
+            names = snapshot.list_manifests()
+            await message.channel.send("Snapshots: " + (", ".join(f"`{n}`" for n in names[-20:]) or "(none)"))
+        elif sub == "restore" and len(args) >= 2:
+            gid = int(args[2]) if len(args) >= 3 and args[2].isdigit() else None
+            try:
+                restored = await snapshot.restore(args[1], gid)
+            except KeyError:
+                await message.channel.send(f"No snapshot named `{args[1]}`.")
+                return
+            _restored(bot, restored)
+            await message.channel.send(f"♻️ Restored {len(restored)} guild(s) from `{args[1]}`.")
+        elif sub == "prune":
+            keep = int(args[1]) if len(args) >= 2 and args[1].isdigit() else snapshot.KEEP
+            manifests, objects = await snapshot.prune(keep)
+            await message.channel.send(f"Pruned {manifests} snapshot(s) and {objects} unused object(s); kept the newest {keep}.")
+        else:
+            await message.channel.send(USAGE)
+
+    register(bot, "snapshot", snapshot_cmd)
+    if EVERY_MIN > 0 and _timer is None:
+        _timer = asyncio.create_task(_periodic())
+
+def teardown(bot):
+    global _timer
+    if _timer is not None:
+        _timer.cancel()
+        _timer = None
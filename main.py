@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 import re, asyncio, logging
-from typing import Dict, Callable, Any, List
+from typing import Dict, Callable, Any, List, Optional
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 
-from core import config, db, loader, personality, permissions, utils
+import core.logging  # noqa: F401  (installs the queued JSON handler on the root logger)
+from core import config, db, loader, personality, permissions, utils, ratelimit, metrics, health, tree_sync, members, outbound, timers
 
 INTENTS = discord.Intents.default()
 INTENTS.guilds = True
@@ -18,32 +19,68 @@ TRIGGER = "ahri"
 
 class AhriBot(commands.Bot):
     def __init__(self):
+        self.memory_profile = members.current_profile()
         super().__init__(
             command_prefix=commands.when_mentioned_or(TRIGGER + " "),
             intents=INTENTS,
             help_command=None,
             case_insensitive=True,
+            **members.client_options(self.memory_profile),
         )
         self.trigger_handlers: Dict[str, Callable] = {}
         self.feature_info: Dict[str, Dict[str, Any]] = {}
+        self.feature_records: Dict[str, loader.FeatureRecord] = {}
         self.failed_modules: List[str] = []
+        self.config: Optional[config.Config] = None
+        self.health: Optional[health.HealthServer] = None
 
     async def setup_hook(self):
         # configure logging already done by import
+        if self.config and self.config.metrics_port:
+            try:
+                self.health = health.HealthServer(self, self.config.metrics_host, self.config.metrics_port)
+                await self.health.start()
+            except Exception as e:
+                logging.exception("Metrics endpoint failed to start: %s", e)
+                self.health = None
         await loader.load_features(self)
+        await timers.service.start(self)
         try:
-            await self.tree.sync()
+            await tree_sync.sync_if_changed(self)
         except Exception as e:
             logging.exception("Slash sync failed: %s", e)
 
+    async def close(self):
+        if self.health:
+            await self.health.stop()
+            self.health = None
+        await timers.service.stop()
+        await loader.unload_all(self)
+        await super().close()
+
     async def on_ready(self):
-        logging.getLogger().info("Ready as %s (%s)", self.user, self.user.id)
+        logging.getLogger().info("Ready as %s (%s), memory profile %s", self.user, self.user.id, self.memory_profile.name)
         await self.change_presence(activity=discord.Game(name="with nine tails ✨"))
 
     async def on_guild_join(self, guild: discord.Guild):
         await db.ensure_guild(guild.id)
 
+    async def on_guild_remove(self, guild: discord.Guild):
+        # keep the settings around in case they invite us back
+        await db.archive_guild(guild.id)
+        permissions.invalidate(guild.id)
+
     async def on_message(self, message: discord.Message):
+        metrics.inc("messages_handled")
+        with metrics.span("on_message"):
+            await self._dispatch(message)
+
+    def _say(self, channel, key: str, **kwargs):
+        # persona replies are cosmetic: queued behind enforcement and shed under load
+        text = personality.ahri_say(key, **kwargs)
+        outbound.fire(outbound.COSMETIC, lambda: channel.send(text))
+
+    async def _dispatch(self, message: discord.Message):
         # ignore bots & DMs
         if message.author.bot or message.guild is None:
             return
@@ -60,42 +97,61 @@ class AhriBot(commands.Bot):
 
         rest = content[m.end():].strip()
         if not rest:
-            try:
-                await message.channel.send(personality.ahri_say("help_intro"))
-            except Exception:
-                pass
+            self._say(message.channel, "help_intro")
             return
 
         tokens = utils.tokenize(rest)
         if not tokens:
-            await message.channel.send(personality.ahri_say("unknown_trigger", cmd=rest.split()[0] if rest else ""))
+            self._say(message.channel, "unknown_trigger", cmd=rest.split()[0] if rest else "")
             return
 
         # activation gate
         guild_id = message.guild.id
         g = await db.load_guild(guild_id)
-        if not g.get("activated", False):
-            await message.channel.send(personality.ahri_say("inactive_hint"))
+        if not g.activated:
+            self._say(message.channel, "inactive_hint")
             return
 
         cmd = tokens.pop(0).lower()
         handler = self.trigger_handlers.get(cmd)
         if not handler:
-            await message.channel.send(personality.ahri_say("unknown_trigger", cmd=cmd))
+            self._say(message.channel, "unknown_trigger", cmd=cmd)
             return
 
+        if getattr(handler, "_lazy_module", None):
+            handler = await loader.materialize(self, cmd, handler)
+            if handler is None:
+                self._say(message.channel, "oops")
+                return
+
         try:
+            if getattr(handler, "_needs_owner", False) and not await self.is_owner(message.author):
+                self._say(message.channel, "no_permission")
+                return
             needs_admin = getattr(handler, "_needs_admin", False)
             if needs_admin and not await permissions.is_guild_admin(message.author, guild_id):
-                await message.channel.send(personality.ahri_say("no_permission"))
+                self._say(message.channel, "no_permission")
+                return
+            retry_after, notify = ratelimit.check_cooldown(cmd, handler, guild_id, message.author.id)
+            if retry_after:
+                if notify:
+                    self._say(message.channel, "cooldown", secs=max(1, round(retry_after)))
                 return
-            await handler(self, message, tokens)
+            slot = ratelimit.guild_slot(guild_id)
+            if slot is None:
+                if ratelimit.busy_notice(guild_id):
+                    self._say(message.channel, "busy")
+                return
+            async with slot:
+                try:
+                    with metrics.span("trigger." + cmd):
+                        await asyncio.wait_for(handler(self, message, tokens), timeout=ratelimit.limits_for(handler).timeout)
+                except asyncio.TimeoutError:
+                    logging.warning("Trigger handler %s timed out in guild %s", cmd, guild_id, extra={"guild_id": guild_id, "trigger": cmd})
+                    self._say(message.channel, "timeout")
         except Exception as e:
-            logging.exception("Trigger handler error for %s: %s", cmd, e)
-            try:
-                await message.channel.send(personality.ahri_say("oops"))
-            except Exception:
-                pass
+            logging.exception("Trigger handler error for %s: %s", cmd, e, extra={"guild_id": guild_id, "trigger": cmd})
+            self._say(message.channel, "oops")
         finally:
             try:
                 await self.process_commands(message)
@@ -133,7 +189,10 @@ async def help_cmd(interaction: discord.Interaction):
 def main():
     cfg = config.load_env()
     config.ensure_data_dir()
-    bot.run(cfg.token)
+    db.migrate_layout()
+    bot.config = cfg
+    # log_handler=None keeps discord.py from adding a second (synchronous) root handler
+    bot.run(cfg.token, log_handler=None)
 
 if __name__ == "__main__":
     main()